@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import random
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+from rich import print
+
+from agent.supervisor import Supervisor
+from agent.portfolio import extract_submission
+from agent.models.registry import get_encoding
+
+
+def load_tasks(tasks_path):
+    """Read tasks from JSONL: {"task_id": ..., "prompt": ..., "provider": optional}."""
+    tasks = []
+    with open(tasks_path, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            task = json.loads(line)
+            task.setdefault("task_id", str(task.get("id", line_number)))
+            task["task_id"] = str(task["task_id"])
+            tasks.append(task)
+    return tasks
+
+
+def load_completed(output_path):
+    """Task IDs that already have a completed record in the output file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by a crash mid-write
+            if record.get("status") == "completed":
+                completed.add(str(record["task_id"]))
+    return completed
+
+
+def _init_batch_process():
+    # Importing this module already paid for torch, sentence-transformers and
+    # the SDKs; load the tokenizer too so the first task starts warm.
+    get_encoding("cl100k_base")
+
+
+def run_batch_task(task, options, log_dir=None):
+    """Run one task end to end inside a pool process and return its record."""
+    run_id = random.getrandbits(32)
+    provider = task.get("provider", options.get("provider", "openai"))
+    record = {"task_id": task["task_id"], "run_id": run_id, "provider": provider}
+    start = time.time()
+
+    log_file = None
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        log_file = open(os.path.join(log_dir, f"{task['task_id']}.log"), "w")
+    try:
+        with contextlib.ExitStack() as stack:
+            if log_file:
+                stack.enter_context(contextlib.redirect_stdout(log_file))
+                stack.enter_context(contextlib.redirect_stderr(log_file))
+            result = Supervisor().run(
+                1,
+                run_id,
+                task["prompt"],
+                provider,
+                options.get("history_mode", False),
+                options.get("streaming", False),
+            )
+    except Exception as e:
+        result = {"error": f"{e}\n{traceback.format_exc()}"}
+    finally:
+        if log_file:
+            log_file.close()
+
+    record["wall_time_seconds"] = time.time() - start
+    submission = extract_submission(result)
+    if isinstance(result, dict):
+        record["total_tokens"] = result.get("total_tokens")
+        record["total_turns"] = int(result["total_turns"]) if "total_turns" in result else None
+        record["error"] = result.get("error")
+    else:
+        record["error"] = str(result)
+    record["submission"] = submission["submission"] if submission else None
+    record["model_path"] = submission.get("model_path") if submission else None
+    record["status"] = "completed" if submission else "failed"
+    return record
+
+
+class BatchRunner:
+    """Runs a JSONL file of tasks through a pool of long-lived worker processes.
+
+    Results are appended to `output_path` as each task finishes, so a restarted
+    batch skips every task that already has a completed record.
+    """
+
+    def __init__(self, tasks_path, output_path, max_concurrency=1, options=None, log_dir=None):
+        self.tasks_path = tasks_path
+        self.output_path = output_path
+        self.max_concurrency = max_concurrency
+        self.options = options or {}
+        self.log_dir = log_dir
+
+    def run(self):
+        tasks = load_tasks(self.tasks_path)
+        completed = load_completed(self.output_path)
+        remaining = [task for task in tasks if task["task_id"] not in completed]
+        print(
+            f"Batch: {len(tasks)} tasks, {len(tasks) - len(remaining)} already completed, "
+            f"running {len(remaining)} with concurrency {self.max_concurrency}"
+        )
+
+        records = []
+        with ProcessPoolExecutor(
+            max_workers=self.max_concurrency,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_batch_process,
+        ) as pool, open(self.output_path, "a") as output:
+            futures = {
+                pool.submit(run_batch_task, task, self.options, self.log_dir): task
+                for task in remaining
+            }
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # The pool process itself died (e.g. OOM-killed).
+                    record = {"task_id": task["task_id"], "status": "failed", "error": str(e)}
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                records.append(record)
+                print(
+                    f"Batch: task {record['task_id']} {record['status']} "
+                    f"({len(records)}/{len(remaining)})"
+                )
+        return records
@@ -0,0 +1,156 @@
+import os
+import re
+from agent.models.registry import get_encoding
+
+
+PROGRESS_LINE = re.compile(
+    r"(\d+%\|)"  # tqdm: " 45%|████▌     | 45/100"
+    r"|(\d+/\d+ \[[=>.\- ]*\])"  # keras: "12/100 [==>.....]"
+    r"|(^\s*(Downloading|Progress)\b.*\d+(\.\d+)?\s*%)"  # pip / generic percentages
+)
+
+# Token budgets per prompt section. Short-term memory repeats the last few
+# steps on every turn, so its budgets are much tighter than the latest output.
+DEFAULT_BUDGETS = {
+    "output": 2000,
+    "errors": 1000,
+    "memory_output": 300,
+    "memory_errors": 150,
+}
+
+
+def fold_carriage_returns(text):
+    """Keep only what a terminal would show for lines redrawn with \\r."""
+    lines = []
+    for line in text.split("\n"):
+        if "\r" in line:
+            segments = [segment for segment in line.split("\r") if segment.strip()]
+            line = segments[-1] if segments else ""
+        lines.append(line)
+    return lines
+
+
+def fold_progress_lines(lines):
+    """Collapse runs of progress-bar lines into their final state."""
+    folded = []
+    run = 0
+    for line in lines:
+        if PROGRESS_LINE.search(line):
+            if run:
+                folded[-1] = line
+            else:
+                folded.append(line)
+            run += 1
+            continue
+        if run > 1:
+            folded.append(f"[{run - 1} progress updates folded]")
+        run = 0
+        folded.append(line)
+    if run > 1:
+        folded.append(f"[{run - 1} progress updates folded]")
+    return folded
+
+
+def collapse_repeated_lines(lines):
+    collapsed = []
+    repeats = 0
+    for line in lines:
+        if collapsed and line == collapsed[-1] and line.strip():
+            repeats += 1
+            continue
+        if repeats:
+            collapsed.append(f"[previous line repeated {repeats} more times]")
+        repeats = 0
+        collapsed.append(line)
+    if repeats:
+        collapsed.append(f"[previous line repeated {repeats} more times]")
+    return collapsed
+
+
+class OutputCompactor:
+    """Shrinks tool output to a per-section token budget before it enters a prompt.
+
+    Progress bars and repeated lines are folded first; whatever is still over
+    budget keeps a head window and a (larger) tail window, where errors and
+    final metrics usually are. When anything is dropped, the full text is
+    written under `log_dir` and the marker in the prompt points at it.
+    """
+
+    def __init__(self, log_dir=None, budgets=None, encoding=None, head_fraction=0.3):
+        self.log_dir = log_dir
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.encoding = encoding or get_encoding("cl100k_base")
+        self.head_fraction = head_fraction
+        self.tokens_saved = 0
+        self.turn_tokens_saved = 0
+        self.logged = 0
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def start_turn(self):
+        saved = self.turn_tokens_saved
+        self.turn_tokens_saved = 0
+        return saved
+
+    def save_full_output(self, text, section):
+        if not self.log_dir:
+            return None
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.logged += 1
+        path = os.path.join(self.log_dir, f"{self.logged:05d}_{section}.log")
+        with open(path, "w") as file:
+            file.write(text)
+        return path
+
+    def head_tail(self, text, budget, path):
+        tokens = self.encoding.encode(text, disallowed_special=())
+        head_budget = int(budget * self.head_fraction)
+        tail_budget = budget - head_budget
+        head = self.encoding.decode(tokens[:head_budget])
+        tail = self.encoding.decode(tokens[-tail_budget:]) if tail_budget else ""
+        # Snap the cut points to line boundaries when that loses little.
+        if "\n" in head[len(head) // 2 :]:
+            head = head[: head.rindex("\n")]
+        if "\n" in tail[: len(tail) // 2]:
+            tail = tail[tail.index("\n") + 1 :]
+        # Counted on what is actually kept, after snapping to line boundaries.
+        omitted = max(len(tokens) - self.count_tokens(head) - self.count_tokens(tail), 0)
+        location = f"; full output: {path}" if path else ""
+        return f"{head}\n... [{omitted} tokens omitted{location}] ...\n{tail}"
+
+    def compact(self, text, section="output", keep_full=True):
+        """Return `text` within the token budget of `section`.
+
+        Pass keep_full=False for text that is already stored elsewhere (memory
+        rows re-rendered every turn) so it is not written out again.
+        """
+        if not isinstance(text, str) or not text:
+            return text
+        budget = self.budgets.get(section, self.budgets["output"])
+        original_tokens = self.count_tokens(text)
+        lines = fold_carriage_returns(text)
+        lines = fold_progress_lines(lines)
+        lines = collapse_repeated_lines(lines)
+        compacted = "\n".join(lines)
+        if self.count_tokens(compacted) > budget:
+            path = self.save_full_output(text, section) if keep_full else None
+            compacted = self.head_tail(compacted, budget, path)
+        saved = max(original_tokens - self.count_tokens(compacted), 0)
+        self.tokens_saved += saved
+        self.turn_tokens_saved += saved
+        return compacted
+
+    def compact_result(self, tool_output):
+        """Compact the stdout/stderr fields of a tool result dict."""
+        if not isinstance(tool_output, dict):
+            return tool_output
+        compacted = dict(tool_output)
+        if "stdout" in compacted:
+            compacted["stdout"] = self.compact(compacted["stdout"], "output")
+        if "stderr" in compacted:
+            compacted["stderr"] = self.compact(compacted["stderr"], "errors")
+        return compacted
+
+    def compact_memory(self, text, section):
+        return self.compact(text, f"memory_{section}", keep_full=False)
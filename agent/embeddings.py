@@ -0,0 +1,216 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+import numpy as np
+
+
+DEFAULT_ENCODER_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DTYPES = ("float32", "int8")
+
+# int8 blobs start with the float32 scale that maps them back to floats.
+_INT8_SCALE_BYTES = 4
+
+
+def default_embedding_dtype():
+    dtype = os.getenv("AGENT_EMBEDDING_DTYPE", "float32")
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Unknown embedding dtype: {dtype}")
+    return dtype
+
+
+def pack_embedding(vector, dtype="float32"):
+    """Serialize a vector to bytes: raw float32, or int8 with a scale prefix."""
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    if dtype == "float32":
+        return vector.tobytes()
+    if dtype == "int8":
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        quantized = np.round(vector / scale).astype(np.int8)
+        return np.float32(scale).tobytes() + quantized.tobytes()
+    raise ValueError(f"Unknown embedding dtype: {dtype}")
+
+
+def unpack_embedding(blob, dtype="float32"):
+    """Inverse of pack_embedding. float32 blobs are viewed without copying."""
+    if dtype == "float32":
+        return np.frombuffer(blob, dtype=np.float32)
+    if dtype == "int8":
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=_INT8_SCALE_BYTES) * scale
+    raise ValueError(f"Unknown embedding dtype: {dtype}")
+
+
+def stack_embeddings(blobs, dtype="float32"):
+    """Decode many packed embeddings of one dtype into an (n, dim) float32 matrix.
+
+    float32 blobs are concatenated and viewed in a single frombuffer call
+    instead of being decoded row by row.
+    """
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+    if dtype == "float32":
+        return np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+    return np.vstack([unpack_embedding(blob, dtype) for blob in blobs]).astype(np.float32)
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder():
+    """Return the process-wide SentenceTransformer, loading it on first use.
+
+    Every memory consumer (worker memory, long-term memory tool, indexes)
+    shares this one instance. Set AGENT_ENCODER_PATH to a directory written by
+    `python -m agent.embeddings <dir>` to load it fully offline; otherwise
+    AGENT_ENCODER_MODEL (default all-MiniLM-L6-v2) is resolved through the
+    Hugging Face cache.
+    """
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = _load_encoder()
+    return _encoder
+
+
+def _load_encoder():
+    model_path = os.getenv("AGENT_ENCODER_PATH")
+    if model_path:
+        # Must be set before huggingface_hub is imported to take effect.
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    # Imported here rather than at module level: it pulls in torch, which
+    # processes that never touch memory embeddings should not pay for.
+    from sentence_transformers import SentenceTransformer
+
+    if model_path:
+        return SentenceTransformer(model_path)
+    return SentenceTransformer(os.getenv("AGENT_ENCODER_MODEL", DEFAULT_ENCODER_MODEL))
+
+
+def encoder_loaded():
+    return _encoder is not None
+
+
+_STOP = object()
+
+
+class EmbeddingQueue:
+    """Encodes memory rows on a background thread, in batches.
+
+    `submit` only enqueues (row_id, text) and returns immediately, so the
+    worker's turn loop never waits on a transformer forward pass. The thread
+    drains up to `max_batch_size` pending rows (waiting at most `max_wait`
+    seconds for a batch to fill), encodes them in one vectorized call and
+    hands the vectors to `write_back(rows)` with rows as [(row_id, vector)].
+    Pending rows are flushed at interpreter exit.
+    """
+
+    def __init__(self, write_back, max_batch_size=32, max_wait=0.5):
+        self.write_back = write_back
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.metrics = {
+            "submitted": 0,
+            "encoded": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+        }
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def submit(self, row_id, text):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="embedding-queue", daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.flush)
+            self.metrics["submitted"] += 1
+        self.queue.put((row_id, text))
+
+    def _next_batch(self):
+        item = self.queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self.queue.get(timeout=remaining)
+                else:
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self.queue.put(_STOP)  # stop after this batch
+                self.queue.task_done()
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                self.queue.task_done()
+                return
+            try:
+                vectors = get_encoder().encode(
+                    [text for _, text in batch], batch_size=len(batch), convert_to_numpy=True
+                )
+                self.write_back([(row_id, vector) for (row_id, _), vector in zip(batch, vectors)])
+                self.metrics["encoded"] += len(batch)
+            except Exception:
+                # Rows keep a NULL embedding and can be re-encoded later.
+                self.metrics["failed"] += len(batch)
+                logging.exception("Failed to encode a batch of %d memory rows", len(batch))
+            finally:
+                self.metrics["batches"] += 1
+                self.metrics["last_batch_size"] = len(batch)
+                self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], len(batch))
+                for _ in batch:
+                    self.queue.task_done()
+
+    def flush(self):
+        """Block until every submitted row has been encoded and written back."""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        self.flush()
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+        self.thread = None
+
+
+def save_encoder(path, model_name=DEFAULT_ENCODER_MODEL):
+    """Download `model_name` and save it to `path` for offline use."""
+    from sentence_transformers import SentenceTransformer
+
+    SentenceTransformer(model_name).save(path)
+    return path
+
+
+if __name__ == "__main__":
+    # python -m agent.embeddings /models/all-MiniLM-L6-v2 [model_name]
+    if len(sys.argv) < 2:
+        print("Usage: python -m agent.embeddings <output_dir> [model_name]")
+        sys.exit(1)
+    print(f"Saved encoder to {save_encoder(*sys.argv[1:3])}")
@@ -0,0 +1,244 @@
+import os
+import threading
+import numpy as np
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def kmeans(vectors, n_clusters, iterations=10, seed=0):
+    """Spherical k-means on unit vectors; returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        empty = counts == 0
+        # Re-seed empty clusters from random points so no list goes unused.
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class MemoryIndex:
+    """Approximate nearest-neighbour index (IVF) over memory embeddings.
+
+    Vectors are stored unit-normalized so cosine similarity is a dot product.
+    Until `train_size` vectors have been added the index is flat and every
+    search is exact; after that, k-means splits the space into `n_lists`
+    inverted lists and a search only scores the `n_probe` lists whose
+    centroids are closest to the query. Once the index has grown to
+    `retrain_factor` times the size it was trained at, it is trained again,
+    so the lists stay balanced as new kinds of steps arrive. Searches
+    filtered to a run or user with at most `exact_limit` rows score just
+    those rows, exactly.
+
+    `synced_id` is the highest database row id up to which every embedded
+    row is in the index; AgentMemory uses it to catch up incrementally.
+    """
+
+    def __init__(self, dim=None, n_lists=256, n_probe=8, train_size=None, exact_limit=4096, retrain_factor=2.0):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size or n_lists * 40
+        self.exact_limit = exact_limit
+        self.retrain_factor = retrain_factor
+        # Number of vectors the centroids were trained on.
+        self.trained_size = 0
+        self.lock = threading.RLock()
+        self.size = 0
+        self.vectors = np.empty((0, dim or 0), dtype=np.float32)
+        self.row_ids = np.empty(0, dtype=np.int64)
+        self.run_ids = np.empty(0, dtype=np.int64)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.list_ids = np.empty(0, dtype=np.int32)
+        self.centroids = None
+        self.synced_id = 0
+        self.dirty = False
+        self._lists = None
+        self._groups = {"run": {}, "user": {}}
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed <= len(self.row_ids):
+            return
+        capacity = max(needed, 2 * len(self.row_ids), 1024)
+        for name, shape in [
+            ("vectors", (capacity, self.dim)),
+            ("row_ids", (capacity,)),
+            ("run_ids", (capacity,)),
+            ("user_ids", (capacity,)),
+            ("list_ids", (capacity,)),
+        ]:
+            old = getattr(self, name)
+            grown = np.empty(shape, dtype=old.dtype)
+            grown[: self.size] = old[: self.size]
+            setattr(self, name, grown)
+
+    def add(self, row_ids, vectors, run_ids, user_ids=None):
+        """Append rows; they are assigned to inverted lists if already trained."""
+        vectors = normalize(np.atleast_2d(vectors))
+        if not len(vectors):
+            return
+        user_ids = [-1] * len(vectors) if user_ids is None else user_ids
+        with self.lock:
+            if self.size == 0:
+                self.dim = vectors.shape[1]
+                self.vectors = np.empty((len(self.row_ids), self.dim), dtype=np.float32)
+            start, end = self.size, self.size + len(vectors)
+            self._reserve(len(vectors))
+            self.vectors[start:end] = vectors
+            self.row_ids[start:end] = row_ids
+            self.run_ids[start:end] = run_ids
+            self.user_ids[start:end] = [-1 if user_id is None else user_id for user_id in user_ids]
+            self.list_ids[start:end] = self._assign(vectors) if self.trained else -1
+            self.size = end
+            self.dirty = True
+            self._extend_cached(start, end)
+            if not self.trained and self.size >= self.train_size:
+                self.train()
+            elif self.trained and self.size >= self.retrain_factor * self.trained_size:
+                self.train()
+
+    def _extend_cached(self, start, end):
+        # Keep cached inverted lists and run/user groups current without a rebuild.
+        positions = np.arange(start, end)
+        if self._lists is not None:
+            for list_id in np.unique(self.list_ids[start:end]):
+                added = positions[self.list_ids[start:end] == list_id]
+                self._lists[list_id] = np.concatenate([self._lists[list_id], added])
+        for kind, column in (("run", self.run_ids), ("user", self.user_ids)):
+            for key, cached in self._groups[kind].items():
+                added = positions[column[start:end] == key]
+                if len(added):
+                    self._groups[kind][key] = np.concatenate([cached, added])
+
+    def _assign(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def train(self):
+        with self.lock:
+            vectors = self.vectors[: self.size]
+            sample = vectors
+            if len(sample) > 100_000:
+                sample = sample[np.random.default_rng(0).choice(len(sample), 100_000, replace=False)]
+            self.centroids = kmeans(sample, min(self.n_lists, len(sample)))
+            self.trained_size = self.size
+            for start in range(0, self.size, 65536):
+                end = min(start + 65536, self.size)
+                self.list_ids[start:end] = self._assign(vectors[start:end])
+            self._lists = None
+            self.dirty = True
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.list_ids[: self.size], kind="stable")
+            bounds = np.searchsorted(
+                self.list_ids[: self.size][order], np.arange(len(self.centroids) + 1)
+            )
+            self._lists = [order[bounds[i] : bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._lists
+
+    def _group(self, kind, key):
+        groups = self._groups[kind]
+        if key not in groups:
+            column = self.run_ids if kind == "run" else self.user_ids
+            groups[key] = np.flatnonzero(column[: self.size] == key)
+        return groups[key]
+
+    def _candidates(self, query, run_id, user_id):
+        """Positions to score for a query, or None to score everything."""
+        for kind, key in (("run", run_id), ("user", user_id)):
+            if key is not None:
+                positions = self._group(kind, key)
+                if len(positions) <= self.exact_limit:
+                    if kind == "run" and user_id is not None:
+                        positions = positions[self.user_ids[positions] == user_id]
+                    return positions
+        if not self.trained:
+            return None
+        probes = np.argsort(-(self.centroids @ query))[: self.n_probe]
+        lists = self._inverted_lists()
+        return np.concatenate([lists[probe] for probe in probes])
+
+    def search(self, query, k=5, run_id=None, user_id=None):
+        """Return [(row_id, score)] for the k most similar rows, best first."""
+        with self.lock:
+            if self.size == 0:
+                return []
+            query = normalize(query).ravel()
+            positions = self._candidates(query, run_id, user_id)
+            if positions is None:
+                positions = np.arange(self.size)
+            if run_id is not None:
+                positions = positions[self.run_ids[positions] == run_id]
+            if user_id is not None:
+                positions = positions[self.user_ids[positions] == user_id]
+            if not len(positions):
+                return []
+            scores = self.vectors[positions] @ query
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(self.row_ids[positions[i]]), float(scores[i])) for i in top]
+
+    def contains(self, row_ids):
+        return np.isin(np.asarray(row_ids, dtype=np.int64), self.row_ids[: self.size])
+
+    def save(self, path):
+        with self.lock:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                np.savez(
+                    file,
+                    vectors=self.vectors[: self.size],
+                    row_ids=self.row_ids[: self.size],
+                    run_ids=self.run_ids[: self.size],
+                    user_ids=self.user_ids[: self.size],
+                    list_ids=self.list_ids[: self.size],
+                    centroids=self.centroids if self.trained else np.empty((0, 0), np.float32),
+                    config=np.array(
+                        [self.n_lists, self.n_probe, self.train_size, self.synced_id, self.trained_size]
+                    ),
+                )
+            os.replace(tmp_path, path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Load an index saved with `save`, or return an empty one."""
+        if not os.path.exists(path):
+            return cls(**kwargs)
+        with np.load(path) as data:
+            config = [int(value) for value in data["config"]]
+            n_lists, n_probe, train_size, synced_id = config[:4]
+            index = cls(
+                dim=data["vectors"].shape[1],
+                **dict({"n_lists": n_lists, "n_probe": n_probe, "train_size": train_size}, **kwargs),
+            )
+            index.vectors = data["vectors"]
+            index.row_ids = data["row_ids"]
+            index.run_ids = data["run_ids"]
+            index.user_ids = data["user_ids"]
+            index.list_ids = data["list_ids"]
+            index.centroids = data["centroids"] if data["centroids"].size else None
+            index.size = len(index.row_ids)
+            index.synced_id = synced_id
+            if index.trained:
+                # Indexes saved before trained_size was recorded count as trained on everything.
+                index.trained_size = config[4] if len(config) > 4 else index.size
+        return index
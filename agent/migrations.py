@@ -0,0 +1,89 @@
+import json
+import logging
+from sqlalchemy import inspect, text
+from agent.embeddings import pack_embedding
+
+
+def add_missing_columns(engine, table, columns):
+    """ALTER TABLE ADD COLUMN for each (name, ddl_type) the table lacks."""
+    existing = {column["name"] for column in inspect(engine).get_columns(table)}
+    added = []
+    with engine.begin() as connection:
+        for name, ddl_type in columns:
+            if name not in existing:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+                added.append(name)
+    return added
+
+
+def convert_text_embeddings(engine, table, dtype="float32", batch_size=500):
+    """Repack embeddings stored as stringified lists ("[0.1, -0.2, ...]").
+
+    Rows written before embeddings were binary have text in the embedding
+    column and no embedding_dtype; they are rewritten as packed `dtype` blobs.
+    Returns the number of rows converted.
+    """
+    converted = 0
+    with engine.begin() as connection:
+        rows = connection.execute(
+            text(
+                f"SELECT id, embedding FROM {table} "
+                "WHERE embedding IS NOT NULL AND embedding_dtype IS NULL"
+            )
+        ).fetchall()
+        updates = []
+        for row_id, embedding in rows:
+            if isinstance(embedding, (bytes, memoryview)):
+                # Already binary, only the dtype marker is missing.
+                updates.append({"id": row_id, "embedding": bytes(embedding), "dtype": "float32"})
+                continue
+            try:
+                vector = json.loads(embedding)
+            except (TypeError, json.JSONDecodeError):
+                logging.warning("Dropping unreadable embedding for %s row %s", table, row_id)
+                updates.append({"id": row_id, "embedding": None, "dtype": None})
+                continue
+            updates.append({"id": row_id, "embedding": pack_embedding(vector, dtype), "dtype": dtype})
+        for start in range(0, len(updates), batch_size):
+            connection.execute(
+                text(f"UPDATE {table} SET embedding = :embedding, embedding_dtype = :dtype WHERE id = :id"),
+                updates[start : start + batch_size],
+            )
+            converted += len(updates[start : start + batch_size])
+    return converted
+
+
+def add_missing_indexes(engine, table):
+    """CREATE INDEX for every index declared on `table` that the database lacks."""
+    existing = {index["name"] for index in inspect(engine).get_indexes(table.name)}
+    added = []
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(bind=engine, checkfirst=True)
+            added.append(index.name)
+    return added
+
+
+def migrate_memory_database(engine, table, dtype="float32"):
+    """Bring an existing agent memory database up to the current schema."""
+    added = add_missing_columns(
+        engine,
+        table.name,
+        [
+            ("embedding_dtype", "VARCHAR"),
+            ("wall_seconds", "FLOAT"),
+            ("cpu_user_seconds", "FLOAT"),
+            ("cpu_system_seconds", "FLOAT"),
+            ("peak_rss_bytes", "BIGINT"),
+            ("output_bytes", "BIGINT"),
+            ("exit_reason", "VARCHAR"),
+        ],
+    )
+    indexes = add_missing_indexes(engine, table)
+    converted = convert_text_embeddings(engine, table.name, dtype)
+    if added or indexes or converted:
+        logging.info(
+            "Migrated %s: added columns %s, indexes %s, converted %d embeddings",
+            table.name, added, indexes, converted,
+        )
+    return {"added_columns": added, "added_indexes": indexes, "converted_embeddings": converted}
@@ -1,16 +1,31 @@
 import os
-import anthropic
 from agent.utils import count_tokens
+from agent.models.registry import get_client, get_encoding
+from agent.models.history import anthropic_cached_tools
+from agent.models.streaming import StreamingToolCalls
+from agent.models.response_cache import get_response_cache
+from anthropic.types import Message
 import json
-import tiktoken
 
 class AnthropicModel:
     def __init__(self, system_prompt, all_tools):
-        self.anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC"))
+        self.anthropic_client = get_client("anthropic")
         self.system_prompt = system_prompt
         self.all_tools = all_tools
         self.max_tokens = 200000  # Maximum tokens for Claude-3
-        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = get_encoding("cl100k_base")
+        self.model = "claude-3-5-sonnet-20240620"
+        self.max_response_tokens = 4096
+        # System prompt and tool schemas are identical on every turn; marking
+        # them with cache_control lets Anthropic serve them from its prompt cache.
+        self.cached_system = [
+            {
+                "type": "text",
+                "text": self.system_prompt,
+                "cache_control": {"type": "ephemeral"},
+            }
+        ]
+        self.cached_tools = anthropic_cached_tools(self.all_tools)
 
     def encode_text(self, text):
         return self.encoding.encode(text, disallowed_special=())
@@ -31,20 +46,110 @@ class AnthropicModel:
         truncated_prompt = self.truncate_prompt(prompt, available_tokens)
         prompt_tokens = len(self.encode_text(truncated_prompt))
 
-        response = self.anthropic_client.messages.create(
-            model="claude-3-5-sonnet-20240620",
+        response = get_response_cache().create(
+            "anthropic",
+            self.anthropic_client.messages.create,
+            Message,
+            model=self.model,
+            system=self.cached_system,
             messages=[
-                {"role": "user", "content": self.system_prompt + "\n" + prompt},
+                {"role": "user", "content": truncated_prompt},
             ],
             temperature=0,
             max_tokens=1024,
-            tools=self.all_tools,
+            tools=self.cached_tools,
         )
         response_data, response_tokens = self.get_anthropic_response(response)
         total_tokens = system_prompt_tokens + prompt_tokens + response_tokens
 
         return response_data, total_tokens, prompt_tokens, response_tokens
 
+    def generate_turn(self, history):
+        """Run one turn of a multi-turn ConversationHistory.
+
+        Returns a dict with the assistant text, every tool call requested and
+        token usage, including the prompt tokens served from the cache.
+        """
+        history.trim()
+        response = get_response_cache().create(
+            "anthropic",
+            self.anthropic_client.messages.create,
+            Message,
+            model=self.model,
+            system=self.cached_system,
+            messages=history.to_anthropic(),
+            temperature=0,
+            max_tokens=self.max_response_tokens,
+            tools=self.cached_tools,
+        )
+        return self.get_turn(response)
+
+    def stream_turn(self, history, on_tool_call=None):
+        """Streaming variant of generate_turn.
+
+        Each tool call is passed to `on_tool_call` as soon as its content block
+        closes, while later blocks are still being generated.
+        """
+        if get_response_cache().enabled:
+            # Recorded responses are whole messages; serve them without streaming.
+            turn = self.generate_turn(history)
+            for call in turn["tool_calls"]:
+                on_tool_call(call)
+            return turn
+
+        history.trim()
+        tool_calls = StreamingToolCalls(on_tool_call)
+        with self.anthropic_client.messages.stream(
+            model=self.model,
+            system=self.cached_system,
+            messages=history.to_anthropic(),
+            temperature=0,
+            max_tokens=self.max_response_tokens,
+            tools=self.cached_tools,
+        ) as stream:
+            for event in stream:
+                if event.type == "content_block_start":
+                    if event.content_block.type == "tool_use":
+                        tool_calls.start(
+                            event.index, event.content_block.id, event.content_block.name
+                        )
+                elif event.type == "content_block_delta":
+                    if event.delta.type == "input_json_delta":
+                        tool_calls.append(event.index, event.delta.partial_json)
+                    else:
+                        tool_calls.mark_token()
+                elif event.type == "content_block_stop":
+                    tool_calls.complete(event.index)
+            response = stream.get_final_message()
+        tool_calls.finish()
+
+        turn = self.get_turn(response)
+        turn["tool_calls"] = tool_calls.completed
+        turn.update(tool_calls.metrics())
+        return turn
+
+    def get_turn(self, response):
+        text_blocks = [block.text for block in response.content if block.type == "text"]
+        tool_calls = [
+            {"id": block.id, "name": block.name, "input": block.input or {}}
+            for block in response.content
+            if block.type == "tool_use"
+        ]
+        usage = response.usage
+        cache_read_tokens = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_write_tokens = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        # Anthropic reports cached prefix tokens separately from input_tokens.
+        prompt_tokens = usage.input_tokens + cache_read_tokens + cache_write_tokens
+        return {
+            "text": " ".join(text_blocks),
+            "tool_calls": tool_calls,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": usage.output_tokens,
+            "total_tokens": prompt_tokens + usage.output_tokens,
+            "cache_read_tokens": cache_read_tokens,
+            "cache_write_tokens": cache_write_tokens,
+        }
+
     def get_anthropic_response(self, response):
         # Initialize default response data
         response_data = None
@@ -53,16 +158,13 @@ class AnthropicModel:
             tool_use_blocks = [
                 block for block in response.content if block.type == "tool_use"
             ]
-            # Process the first tool use block, if any
+            # Return every tool call the model asked for, not just the first
             if tool_use_blocks:
-                first_tool_use_block = tool_use_blocks[0]
-                # Assuming the input or relevant details are in the 'input' attribute of the tool use block
-                if (
-                    hasattr(first_tool_use_block, "input")
-                    and first_tool_use_block.input
-                ):
-                    response_data = first_tool_use_block.input
-                    num_tokens = 0
+                response_data = [
+                    {"name": block.name, "input": block.input or {}}
+                    for block in tool_use_blocks
+                ]
+                num_tokens = 0
                 return response_data, num_tokens
             else:
                 # No tool use blocks found; defaulting to extracting text from text blocks
@@ -77,7 +179,7 @@ class AnthropicModel:
 
                 else:
                     print("No tool use blocks or text blocks found in the response.")
-                    return response_data, num_tokens
+                return response_data, num_tokens
         else:
             print("No content found in the response.")
             return response_data, 0
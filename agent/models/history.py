@@ -0,0 +1,148 @@
+import json
+
+
+class ConversationHistory:
+    """Provider-neutral multi-turn transcript for the worker loop.
+
+    Turns are stored once and rendered to Anthropic or OpenAI message lists on
+    demand. The first user message (goal, plan, instructions) never changes, so
+    together with the system prompt and tool schemas it forms a stable prefix
+    that the providers can serve from their prompt caches.
+    """
+
+    def __init__(self, max_tokens=100000, count_tokens=None):
+        self.messages = []
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens or (lambda text: len(text) // 4)
+
+    def add_user_text(self, text):
+        self.messages.append({"role": "user", "text": text})
+
+    def add_assistant(self, text, tool_calls):
+        """tool_calls: list of {"id", "name", "input"} dicts."""
+        self.messages.append(
+            {"role": "assistant", "text": text or "", "tool_calls": list(tool_calls)}
+        )
+
+    def add_tool_results(self, results, text=None):
+        """results: list of {"id", "name", "content"} dicts answering the last assistant turn."""
+        self.messages.append(
+            {"role": "tool", "results": list(results), "text": text}
+        )
+
+    def _message_tokens(self, message):
+        total = self.count_tokens(message.get("text") or "")
+        for call in message.get("tool_calls", []):
+            total += self.count_tokens(json.dumps(call["input"]))
+        for result in message.get("results", []):
+            total += self.count_tokens(result["content"])
+        return total
+
+    def trim(self):
+        """Drop the oldest exchanges once the transcript exceeds `max_tokens`.
+
+        Trimming goes down to half the budget in one step so the cached prefix
+        is only invalidated occasionally rather than on every turn. The opening
+        task message is always kept, and an assistant turn is never separated
+        from the tool results that answer it.
+        """
+        sizes = [self._message_tokens(message) for message in self.messages]
+        if sum(sizes) <= self.max_tokens or len(self.messages) <= 1:
+            return False
+        target = self.max_tokens // 2
+        total = sum(sizes)
+        cut = 1
+        while cut < len(self.messages) - 1 and total > target:
+            total -= sizes[cut]
+            cut += 1
+        # Resume on an assistant turn so no tool result is left without its call.
+        while cut < len(self.messages) and self.messages[cut]["role"] != "assistant":
+            cut += 1
+        self.messages = self.messages[:1] + self.messages[cut:]
+        return True
+
+    def to_anthropic(self):
+        messages = []
+        for message in self.messages:
+            if message["role"] == "user":
+                messages.append(
+                    {"role": "user", "content": [{"type": "text", "text": message["text"]}]}
+                )
+            elif message["role"] == "assistant":
+                content = []
+                if message["text"]:
+                    content.append({"type": "text", "text": message["text"]})
+                for call in message["tool_calls"]:
+                    content.append(
+                        {
+                            "type": "tool_use",
+                            "id": call["id"],
+                            "name": call["name"],
+                            "input": call["input"],
+                        }
+                    )
+                messages.append({"role": "assistant", "content": content})
+            else:
+                content = [
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": result["id"],
+                        "content": result["content"],
+                    }
+                    for result in message["results"]
+                ]
+                if message["text"]:
+                    content.append({"type": "text", "text": message["text"]})
+                messages.append({"role": "user", "content": content})
+
+        # Move a cache breakpoint onto the newest block so each turn reads the
+        # whole previous conversation from cache and writes only the new tail.
+        if messages:
+            last_block = dict(messages[-1]["content"][-1])
+            last_block["cache_control"] = {"type": "ephemeral"}
+            messages[-1] = {
+                "role": messages[-1]["role"],
+                "content": messages[-1]["content"][:-1] + [last_block],
+            }
+        return messages
+
+    def to_openai(self, system_prompt):
+        messages = [{"role": "system", "content": system_prompt}]
+        for message in self.messages:
+            if message["role"] == "user":
+                messages.append({"role": "user", "content": message["text"]})
+            elif message["role"] == "assistant":
+                entry = {"role": "assistant", "content": message["text"] or None}
+                if message["tool_calls"]:
+                    entry["tool_calls"] = [
+                        {
+                            "id": call["id"],
+                            "type": "function",
+                            "function": {
+                                "name": call["name"],
+                                "arguments": json.dumps(call["input"]),
+                            },
+                        }
+                        for call in message["tool_calls"]
+                    ]
+                messages.append(entry)
+            else:
+                for result in message["results"]:
+                    messages.append(
+                        {
+                            "role": "tool",
+                            "tool_call_id": result["id"],
+                            "content": result["content"],
+                        }
+                    )
+                if message["text"]:
+                    messages.append({"role": "user", "content": message["text"]})
+        return messages
+
+
+def anthropic_cached_tools(all_tools):
+    """Tool schemas with a cache breakpoint after the last definition."""
+    tools = [dict(tool) for tool in all_tools]
+    if tools:
+        tools[-1]["cache_control"] = {"type": "ephemeral"}
+    return tools
@@ -1,18 +1,22 @@
 import os
-from openai import OpenAI
 from agent.utils import count_tokens
 from agent.utils import anthropic_to_openai
+from agent.models.registry import get_client, get_encoding
+from agent.models.streaming import StreamingToolCalls
+from agent.models.response_cache import get_response_cache
+from openai.types.chat import ChatCompletion
 import json
-import tiktoken
 
 
 class OpenAIModel:
     def __init__(self, system_prompt, all_tools):
         self.system_prompt = system_prompt
-        self.oai_client = OpenAI(api_key=os.getenv("OPENAI"))
+        self.oai_client = get_client("openai")
         self.all_tools = all_tools
         self.max_tokens = 124000   # Maximum tokens for GPT-4
-        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = get_encoding("cl100k_base")
+        self.openai_tools = [anthropic_to_openai(tool) for tool in self.all_tools]
+        self.model = "gpt-4o"
 
     def encode_text(self, text):
         # Allow all special tokens to be encoded as normal text
@@ -36,19 +40,123 @@ class OpenAIModel:
         truncated_prompt = self.truncate_prompt(prompt, available_tokens)
         prompt_tokens = len(self.encode_text(truncated_prompt))
 
-        response = self.oai_client.chat.completions.create(
-            model="gpt-4o",
+        response = get_response_cache().create(
+            "openai",
+            self.oai_client.chat.completions.create,
+            ChatCompletion,
+            model=self.model,
             messages=[
                 {"role": "system", "content": self.system_prompt},
                 {"role": "user", "content": truncated_prompt},
             ],
-            tools=[anthropic_to_openai(tool) for tool in self.all_tools],
+            tools=self.openai_tools,
         )
         response_data, response_tokens = self.get_openai_response(response)
         total_tokens = system_prompt_tokens + prompt_tokens + response_tokens
 
         return response_data, total_tokens, prompt_tokens, response_tokens
 
+    def generate_turn(self, history):
+        """Run one turn of a multi-turn ConversationHistory.
+
+        OpenAI caches prompt prefixes automatically; keeping the system prompt,
+        tools and earlier turns byte-identical is all that is needed for hits.
+        """
+        history.trim()
+        response = get_response_cache().create(
+            "openai",
+            self.oai_client.chat.completions.create,
+            ChatCompletion,
+            model=self.model,
+            messages=history.to_openai(self.system_prompt),
+            tools=self.openai_tools,
+        )
+        return self.get_turn(response)
+
+    def stream_turn(self, history, on_tool_call=None):
+        """Streaming variant of generate_turn.
+
+        OpenAI does not mark the end of an individual tool call, so arguments
+        are checked for completeness as they arrive and each call is passed to
+        `on_tool_call` as soon as its JSON closes.
+        """
+        if get_response_cache().enabled:
+            # Recorded responses are whole completions; serve them without streaming.
+            turn = self.generate_turn(history)
+            for call in turn["tool_calls"]:
+                on_tool_call(call)
+            return turn
+
+        history.trim()
+        tool_calls = StreamingToolCalls(on_tool_call)
+        text_parts = []
+        usage = None
+        stream = self.oai_client.chat.completions.create(
+            model=self.model,
+            messages=history.to_openai(self.system_prompt),
+            tools=self.openai_tools,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                tool_calls.mark_token()
+                text_parts.append(delta.content)
+            for tool_call_delta in delta.tool_calls or []:
+                index = tool_call_delta.index
+                if tool_call_delta.id:
+                    # A new call starting means every earlier one is finished.
+                    for previous in [i for i in tool_calls.pending if i < index]:
+                        tool_calls.complete(previous)
+                    tool_calls.start(index, tool_call_delta.id, tool_call_delta.function.name)
+                if tool_call_delta.function and tool_call_delta.function.arguments:
+                    tool_calls.append(
+                        index, tool_call_delta.function.arguments, detect_complete=True
+                    )
+        tool_calls.finish()
+
+        details = getattr(usage, "prompt_tokens_details", None)
+        turn = {
+            "text": "".join(text_parts),
+            "tool_calls": tool_calls.completed,
+            "prompt_tokens": usage.prompt_tokens if usage else 0,
+            "response_tokens": usage.completion_tokens if usage else 0,
+            "total_tokens": usage.total_tokens if usage else 0,
+            "cache_read_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+            "cache_write_tokens": 0,
+        }
+        turn.update(tool_calls.metrics())
+        return turn
+
+    def get_turn(self, response):
+        message = response.choices[0].message
+        tool_calls = []
+        for tool_call in message.tool_calls or []:
+            try:
+                arguments = json.loads(tool_call.function.arguments or "{}")
+            except json.JSONDecodeError:
+                arguments = {}
+            tool_calls.append(
+                {"id": tool_call.id, "name": tool_call.function.name, "input": arguments}
+            )
+        usage = response.usage
+        details = getattr(usage, "prompt_tokens_details", None)
+        cache_read_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        return {
+            "text": message.content or "",
+            "tool_calls": tool_calls,
+            "prompt_tokens": usage.prompt_tokens,
+            "response_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens,
+            "cache_read_tokens": cache_read_tokens,
+            "cache_write_tokens": 0,
+        }
+
     def get_openai_response(self, response):
         # Initialize default response data
         response_data = None
@@ -59,9 +167,15 @@ class OpenAIModel:
                     hasattr(choice, "finish_reason")
                     and choice.finish_reason == "tool_calls"
                 ):
-                    response_data = choice.message.tool_calls[0].function.arguments
-                    response_tokens = count_tokens(response_data, "cl100k_base")
-                    response_data = json.loads(response_data)
+                    # Return every tool call the model asked for, not just the first
+                    response_data = []
+                    response_tokens = 0
+                    for tool_call in choice.message.tool_calls:
+                        arguments = tool_call.function.arguments
+                        response_tokens += count_tokens(arguments, "cl100k_base")
+                        response_data.append(
+                            {"name": tool_call.function.name, "input": json.loads(arguments)}
+                        )
                     return response_data, response_tokens
                 else:
                     print("No tool calls found in this choice.")
@@ -0,0 +1,142 @@
+import os
+import weakref
+import threading
+import anthropic
+import httpx
+import openai
+import tiktoken
+
+
+class ModelClientRegistry:
+    """Process-wide cache of LLM SDK clients and tokenizer handles.
+
+    One client is kept per provider, each backed by a keep-alive httpx pool, so
+    every turn of every Worker (and the Supervisor) reuses warm TLS connections
+    instead of paying a new handshake and tokenizer load per step.
+    """
+
+    def __init__(self, max_connections=20, max_keepalive_connections=10, keepalive_expiry=120):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._encodings = {}
+        self._streams = {}
+        self.metrics = {}
+
+    def _new_metrics(self):
+        return {"clients_created": 0, "requests": 0, "connections_opened": 0}
+
+    def _record_response(self, provider, response):
+        # httpcore exposes the underlying connection as the "network_stream"
+        # extension; a stream we have already seen means the request rode on a
+        # pooled keep-alive connection rather than a fresh handshake. Streams
+        # are held weakly: a closed connection drops out of the set, and a new
+        # stream can never be mistaken for an old one with a reused id().
+        stream = response.extensions.get("network_stream")
+        with self._lock:
+            metrics = self.metrics[provider]
+            metrics["requests"] += 1
+            if stream is None:
+                return
+            seen = self._streams[provider]
+            if stream not in seen:
+                seen.add(stream)
+                metrics["connections_opened"] += 1
+
+    def _build_http_client(self, provider, client_cls):
+        return client_cls(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            event_hooks={
+                "response": [lambda response: self._record_response(provider, response)]
+            },
+        )
+
+    def _build_client(self, provider):
+        if provider == "openai":
+            return openai.OpenAI(
+                api_key=os.getenv("OPENAI"),
+                http_client=self._build_http_client(provider, openai.DefaultHttpxClient),
+            )
+        elif provider == "anthropic":
+            return anthropic.Anthropic(
+                api_key=os.getenv("ANTHROPIC"),
+                http_client=self._build_http_client(provider, anthropic.DefaultHttpxClient),
+            )
+        raise ValueError(f"Unknown provider: {provider}")
+
+    def get_client(self, provider):
+        """Return the shared SDK client for `provider` ("openai" or "anthropic")."""
+        client = self._clients.get(provider)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(provider)
+            if client is None:
+                self.metrics.setdefault(provider, self._new_metrics())
+                self._streams.setdefault(provider, weakref.WeakSet())
+                client = self._build_client(provider)
+                self.metrics[provider]["clients_created"] += 1
+                self._clients[provider] = client
+        return client
+
+    def get_encoding(self, encoding_name="cl100k_base"):
+        """Return a cached tiktoken encoding."""
+        encoding = self._encodings.get(encoding_name)
+        if encoding is None:
+            with self._lock:
+                encoding = self._encodings.get(encoding_name)
+                if encoding is None:
+                    encoding = tiktoken.get_encoding(encoding_name)
+                    self._encodings[encoding_name] = encoding
+        return encoding
+
+    def connection_stats(self):
+        """Per-provider request/connection counters.
+
+        `reused_connections` counts requests that were served on an already
+        open connection; on a healthy long run it should track `requests`.
+        """
+        with self._lock:
+            stats = {}
+            for provider, metrics in self.metrics.items():
+                stats[provider] = dict(metrics)
+                stats[provider]["reused_connections"] = max(
+                    metrics["requests"] - metrics["connections_opened"], 0
+                )
+            return stats
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+            for seen in self._streams.values():
+                seen.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide ModelClientRegistry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelClientRegistry()
+    return _registry
+
+
+def get_client(provider):
+    return get_registry().get_client(provider)
+
+
+def get_encoding(encoding_name="cl100k_base"):
+    return get_registry().get_encoding(encoding_name)
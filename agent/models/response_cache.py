@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+
+# Per-turn clock lines would otherwise make every worker prompt unique.
+VOLATILE_PATTERNS = [
+    re.compile(r"Time spent: [0-9.]+ minutes\. Remaining: -?[0-9.]+ minutes\."),
+]
+
+
+class ReplayMissError(RuntimeError):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of raw LLM responses.
+
+    Keys hash the provider and the full request (model, system prompt, tools,
+    messages and sampling parameters). Modes:
+      - "off":    pass every request through to the provider.
+      - "record": serve hits from disk, call the provider on misses and store them.
+      - "replay": serve hits from disk and raise ReplayMissError on misses,
+                  so runs are reproducible offline and never touch the network.
+    Entries are evicted least-recently-used once the directory exceeds `max_bytes`.
+    """
+
+    MODES = ("off", "record", "replay")
+
+    def __init__(self, directory=".llm_cache", mode="off", max_bytes=512 * 1024 * 1024):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown response cache mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.total_bytes = None
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def key(self, provider, request):
+        payload = json.dumps(
+            {"provider": provider, "request": request},
+            sort_keys=True,
+            default=str,
+        )
+        for pattern in VOLATILE_PATTERNS:
+            payload = pattern.sub("", payload)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r") as file:
+                data = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        os.utime(path)  # mtime doubles as the LRU clock
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.metrics["stores"] += 1
+            if self.total_bytes is not None:
+                self.total_bytes += os.path.getsize(path)
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, size, _ in self._entries())
+            if self.total_bytes <= self.max_bytes:
+                return
+            entries = sorted(self._entries())
+            self.total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.total_bytes -= size
+                self.metrics["evictions"] += 1
+
+    def create(self, provider, create_fn, response_cls, **request):
+        """Call `create_fn(**request)` through the cache.
+
+        Responses are stored as JSON dumps of the SDK's pydantic models and
+        rebuilt with `response_cls.model_validate`, so callers get the same
+        object type whether the response came from disk or the network.
+        """
+        if not self.enabled:
+            return create_fn(**request)
+        key = self.key(provider, request)
+        cached = self.get(key)
+        if cached is not None:
+            with self.lock:
+                self.metrics["hits"] += 1
+            return response_cls.model_validate(cached)
+        with self.lock:
+            self.metrics["misses"] += 1
+        if self.mode == "replay":
+            raise ReplayMissError(f"No recorded {provider} response for request {key}")
+        response = create_fn(**request)
+        self.put(key, response.model_dump(mode="json"))
+        return response
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def configure_response_cache(mode=None, directory=None, max_mb=None):
+    """Install the process-wide response cache.
+
+    Unset arguments fall back to the AGENT_RESPONSE_CACHE,
+    AGENT_RESPONSE_CACHE_DIR and AGENT_RESPONSE_CACHE_MAX_MB environment variables.
+    """
+    global _response_cache
+    mode = mode or os.getenv("AGENT_RESPONSE_CACHE", "off")
+    directory = directory or os.getenv("AGENT_RESPONSE_CACHE_DIR", ".llm_cache")
+    max_mb = max_mb or int(os.getenv("AGENT_RESPONSE_CACHE_MAX_MB", "512"))
+    with _response_cache_lock:
+        _response_cache = ResponseCache(directory, mode, max_mb * 1024 * 1024)
+    return _response_cache
+
+
+def get_response_cache():
+    if _response_cache is None:
+        return configure_response_cache()
+    return _response_cache
@@ -0,0 +1,88 @@
+import time
+import jiter
+
+
+class StreamingToolCalls:
+    """Assembles tool calls from streamed argument fragments.
+
+    Each call is handed to `on_tool_call` the moment its arguments form a
+    complete JSON document, so the worker can start executing it while the
+    rest of the response is still streaming. Also records time-to-first-token
+    and time-to-first-dispatch for the turn.
+    """
+
+    def __init__(self, on_tool_call=None):
+        self.on_tool_call = on_tool_call
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.first_dispatch_at = None
+        self.pending = {}
+        self.completed = []
+
+    def mark_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+    def start(self, index, call_id, name):
+        self.mark_token()
+        self.pending[index] = {"id": call_id, "name": name, "arguments": ""}
+
+    def append(self, index, fragment, detect_complete=False):
+        """Add an argument fragment to the call at `index`.
+
+        With `detect_complete`, the buffer is parsed whenever it could have
+        just closed its top-level object; providers that do not signal the end
+        of a tool call (OpenAI) get dispatched as soon as the JSON is whole.
+        """
+        self.mark_token()
+        call = self.pending.get(index)
+        if call is None or not fragment:
+            return
+        call["arguments"] += fragment
+        if detect_complete and fragment.rstrip().endswith("}"):
+            try:
+                arguments = jiter.from_json(call["arguments"].encode(), partial_mode="off")
+            except ValueError:
+                return
+            self._dispatch(index, arguments)
+
+    def complete(self, index):
+        call = self.pending.get(index)
+        if call is None:
+            return
+        try:
+            arguments = jiter.from_json((call["arguments"] or "{}").encode(), partial_mode="off")
+        except ValueError:
+            # Truncated output (e.g. max_tokens hit mid-call): salvage what parsed.
+            try:
+                arguments = jiter.from_json(
+                    call["arguments"].encode(), partial_mode="trailing-strings"
+                )
+            except ValueError:
+                arguments = {}
+            if not isinstance(arguments, dict):
+                arguments = {}
+        self._dispatch(index, arguments)
+
+    def finish(self):
+        for index in sorted(self.pending):
+            self.complete(index)
+
+    def _dispatch(self, index, arguments):
+        call = self.pending.pop(index)
+        tool_call = {"id": call["id"], "name": call["name"], "input": arguments}
+        self.completed.append(tool_call)
+        if self.first_dispatch_at is None:
+            self.first_dispatch_at = time.monotonic()
+        if self.on_tool_call is not None:
+            self.on_tool_call(tool_call)
+
+    def metrics(self):
+        def since_start(timestamp):
+            return None if timestamp is None else timestamp - self.started_at
+
+        return {
+            "time_to_first_token": since_start(self.first_token_at),
+            "time_to_tool_dispatch": since_start(self.first_dispatch_at),
+            "stream_seconds": time.monotonic() - self.started_at,
+        }
@@ -0,0 +1,193 @@
+import os
+import re
+import sys
+import ast
+import json
+import queue
+import signal
+import multiprocessing
+
+from rich import print
+
+from agent.worker import Worker
+from agent.tools.context import kill_process_groups
+
+
+def derive_run_id(run_id, plan_index):
+    """Run ID (and so working directory and memory key) of the worker for one plan."""
+    return run_id * 1000 + plan_index + 1
+
+
+def extract_submission(worker_result):
+    """Pull the return_fn payload out of a worker result, or None."""
+    if not isinstance(worker_result, dict):
+        return None
+    match = re.search(r"\{.*\}", str(worker_result.get("result", "")), re.DOTALL)
+    if not match:
+        return None
+    try:
+        parsed = ast.literal_eval(match.group(0))
+    except (ValueError, SyntaxError):
+        try:
+            parsed = json.loads(match.group(0).replace("'", '"'))
+        except json.JSONDecodeError:
+            return None
+    subtask_result = parsed.get("subtask_result") if isinstance(parsed, dict) else None
+    if isinstance(subtask_result, dict) and "submission" in subtask_result:
+        return subtask_result
+    return None
+
+
+def parse_metric(submission):
+    """First number in a submission such as "accuracy: 0.981" -> 0.981."""
+    match = re.search(r"-?\d+(?:\.\d+)?(?:[eE]-?\d+)?", str(submission))
+    return float(match.group(0)) if match else None
+
+
+def plan_work_dir(run_id, plan_index):
+    """Working directory of a plan's worker (see Worker.make_directory)."""
+    return os.path.abspath(f"./{derive_run_id(run_id, plan_index)}")
+
+
+def _terminate(signum, frame):
+    # Tools run in sessions of their own, out of reach of a killpg on this
+    # group. Stop them first so the worker's finally blocks do not wait on
+    # them, then exit normally so the atexit hooks close shells, kernels and
+    # background jobs.
+    kill_process_groups(signal.SIGTERM)
+    sys.exit(128 + signum)
+
+
+def _run_plan_worker(result_queue, plan_index, worker_args, worker_kwargs):
+    # Lead a new process group so cancelling this plan reaches the worker
+    # and anything it started without a session of its own.
+    os.setsid()
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        result = Worker(*worker_args, **worker_kwargs).run()
+    except Exception as e:
+        result = {"error": str(e)}
+    result_queue.put((plan_index, result))
+
+
+class PlanPortfolio:
+    """Runs the supervisor's alternative plans as competing worker processes.
+
+    Each plan gets its own process and working directory (see derive_run_id);
+    at most `max_concurrency` run at once. With strategy "first" the first
+    worker to submit via return_fn wins and the rest are cancelled; with
+    "best" every plan runs to completion and the best reported metric wins.
+    """
+
+    def __init__(self, max_concurrency=None, strategy="first", maximize=True, cancel_timeout=10):
+        if strategy not in ("first", "best"):
+            raise ValueError(f"Unknown portfolio strategy: {strategy}")
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.strategy = strategy
+        self.maximize = maximize
+        self.cancel_timeout = cancel_timeout
+        # Spawn gives every worker a fresh interpreter instead of inheriting
+        # open SQLite connections and HTTP pools through fork.
+        self.context = multiprocessing.get_context("spawn")
+
+    def cancel(self, process, work_dir=None):
+        """Stop a worker process and the tool processes it started.
+
+        The worker gets SIGTERM and `cancel_timeout` seconds to shut down
+        through its handler before its group is killed. The tool process
+        groups it recorded in `work_dir` are killed last, in case it never
+        got that far.
+        """
+        if process.is_alive():
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                process.terminate()
+            process.join(self.cancel_timeout)
+            if process.is_alive():
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    process.kill()
+                process.join()
+        if work_dir is not None:
+            kill_process_groups(signal.SIGKILL, work_dir)
+
+    def select_winner(self, outcomes):
+        submitted = [outcome for outcome in outcomes if outcome["submission"] is not None]
+        if not submitted:
+            return None
+        if self.strategy == "first":
+            return submitted[0]
+        scored = [outcome for outcome in submitted if outcome["metric"] is not None]
+        if not scored:
+            return submitted[0]
+        return (max if self.maximize else min)(scored, key=lambda outcome: outcome["metric"])
+
+    def run(self, user_id, run_id, task, plans, provider, worker_kwargs=None):
+        """Run one worker per plan statement and return (winner, outcomes)."""
+        worker_kwargs = worker_kwargs or {}
+        result_queue = self.context.Queue()
+        pending = list(enumerate(plans))
+        running = {}
+        outcomes = []
+
+        try:
+            while pending or running:
+                while pending and len(running) < self.max_concurrency:
+                    plan_index, plan = pending.pop(0)
+                    worker_args = (user_id, derive_run_id(run_id, plan_index))
+                    kwargs = dict(
+                        worker_kwargs,
+                        user_query=task,
+                        plan=plan,
+                        worker_number=plan_index + 1,
+                        provider=provider,
+                    )
+                    process = self.context.Process(
+                        target=_run_plan_worker,
+                        args=(result_queue, plan_index, worker_args, kwargs),
+                    )
+                    process.start()
+                    running[plan_index] = process
+                    print(f"Portfolio: started worker {plan_index + 1} (pid {process.pid})")
+
+                try:
+                    plan_index, result = result_queue.get(timeout=1)
+                except queue.Empty:
+                    # A worker that died without reporting is recorded as failed.
+                    for plan_index, process in list(running.items()):
+                        if not process.is_alive():
+                            process.join()
+                            del running[plan_index]
+                            outcomes.append(self.outcome(plan_index, run_id, None))
+                    continue
+
+                process = running.pop(plan_index, None)
+                if process is not None:
+                    process.join()
+                # The result may land just after the process was reaped as failed.
+                outcomes = [o for o in outcomes if o["worker_number"] != plan_index + 1]
+                outcome = self.outcome(plan_index, run_id, result)
+                outcomes.append(outcome)
+                print(
+                    f"Portfolio: worker {plan_index + 1} finished, submission: {outcome['submission']}"
+                )
+                if self.strategy == "first" and outcome["submission"] is not None:
+                    pending.clear()
+                    break
+        finally:
+            for plan_index, process in running.items():
+                self.cancel(process, plan_work_dir(run_id, plan_index))
+
+        return self.select_winner(outcomes), outcomes
+
+    def outcome(self, plan_index, run_id, result):
+        submission = extract_submission(result)
+        return {
+            "worker_number": plan_index + 1,
+            "run_id": derive_run_id(run_id, plan_index),
+            "result": result,
+            "submission": submission["submission"] if submission else None,
+            "metric": parse_metric(submission["submission"]) if submission else None,
+        }
@@ -34,7 +34,7 @@ def get_worker_system_prompt(run_number):
     worker_system_prompt = f"""
     You are a highly capable AI agent researcher. Your task is to complete a given goal efficiently and effectively. Key points:
 
-    1. Use available tools: run_python, run_bash, write_code, insert_code, replace_code, delete_code, scratchpad, search_papers, get_paper_details, get_paper_abstract, get_paper_citations, download_paper, github_get_readme, github_list_files, github_get_file_code, search_papers_with_code, get_paper_details_pwc, get_code_links_pwc, search_the_internet.
+    1. Use available tools: run_python, run_bash, write_code, insert_code, replace_code, delete_code, scratchpad, search_papers, get_paper_details, get_paper_abstract, get_paper_citations, download_paper, github_get_readme, github_list_files, github_get_file_code, search_papers_with_code, get_paper_details_pwc, get_code_links_pwc, search_the_internet, long_term_memory, run_python_cell, start_job, job_status, job_tail, cancel_job, run_sweep.
     2. Prefer writing and running code to solve problems.
     3. Use the scratchpad tool to track progress and store important information.
     4. Express thoughts using the thought tool.
@@ -45,6 +45,11 @@ def get_worker_system_prompt(run_number):
     9. Save your work to the working directory before using the return_fn tool.
     10. Complete tasks sequentially or combine them to achieve the main goal.
     11. Use return_fn only when you're certain the task is completed and you have a metric to report.
+    12. You may call several tools in one response. Independent lookups (papers, GitHub files, websites, scratchpad reads) run in parallel.
+    13. Only your last 5 steps are shown to you. Use long_term_memory with run_id {run_number} to recall relevant earlier steps.
+    14. run_python_cell keeps variables between calls. Load large datasets or models there once and iterate on them, instead of reloading them in every run_python script.
+    15. Start training runs and other commands that take more than a few minutes with start_job. They run in the background while you keep working (read papers, write the evaluation script); their progress is shown to you every turn.
+    16. To tune hyperparameters, make the script take them as arguments and print its metric, then compare settings with one run_sweep call instead of editing and re-running the script per value.
 
     Remember:
     - Overcome errors and make assumptions when necessary.
@@ -65,6 +70,7 @@ def get_worker_prompt(
     previous_subtask_attempt,
     previous_subtask_output,
     previous_subtask_errors,
+    jobs=None,
 ):
     elapsed_minutes = elapsed_time.total_seconds() / 60
     task_duration_minutes = 24 * 60  # 1 day
@@ -89,6 +95,9 @@ def get_worker_prompt(
     
     Additional output: {previous_subtask_errors}
     
+    Background jobs:
+    {jobs or "No background jobs."}
+    
     Instructions:
     - You must find the working directory before beginning the task.
     - Use the scratchpad tool to record important information.
@@ -101,3 +110,40 @@ def get_worker_prompt(
     When you have completed the task, submit it with return_fn.
     """
     return worker_prompt
+
+
+def get_worker_task_prompt(user_query, plan, run_number):
+    """Opening message of a multi-turn worker conversation.
+
+    Nothing in here changes between turns, so it stays part of the cached
+    prompt prefix; per-turn state is sent with the tool results instead.
+    """
+    worker_task_prompt = f"""
+    Your goal is to: {user_query}
+    Your working directory is: {run_number}
+
+    Plan outline:
+    {plan}
+
+    Instructions:
+    - You must find the working directory before beginning the task.
+    - Use the scratchpad tool to record important information.
+    - Express thoughts using the thought tool.
+    - Use return_fn only when the goal is completed
+    - Save the work to the working directory before using return_fn.
+    - Think critically about the compute resources you have and the amount of time left to complete the task
+    Think carefully about what you have done and what you have not done. 
+    Do not take unnecessary steps. Complete only what is necessary.
+    When you have completed the task, submit it with return_fn.
+    """
+    return worker_task_prompt
+
+
+def get_worker_turn_prompt(elapsed_time, jobs=None):
+    elapsed_minutes = elapsed_time.total_seconds() / 60
+    task_duration_minutes = 24 * 60  # 1 day
+    remaining_minutes = task_duration_minutes - elapsed_minutes
+    turn_prompt = f"Time spent: {elapsed_minutes:.2f} minutes. Remaining: {remaining_minutes:.2f} minutes."
+    if jobs:
+        turn_prompt += f"\nBackground jobs:\n{jobs}"
+    return turn_prompt
@@ -1,13 +1,15 @@
 import json
-import anthropic
-from openai import OpenAI
 from argparse import ArgumentParser
 from typing import TypedDict
 from dotenv import load_dotenv
 import os
-import tiktoken
 import traceback
 from agent.worker import Worker
+from agent.portfolio import PlanPortfolio
+from agent.models.registry import get_client, get_encoding
+from agent.models.response_cache import get_response_cache
+from anthropic.types import Message
+from openai.types.chat import ChatCompletion
 from agent.prompts import get_supervisor_system_prompt
 
 # load environment variables
@@ -20,9 +22,9 @@ class Supervisor:
         output: final_command
         """
         self.agent_model = "openai"
-        self.encoding = tiktoken.get_encoding("cl100k_base")
-        self.oai_client = OpenAI(api_key=os.getenv("OPENAI"))
-        self.client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC"))
+        self.encoding = get_encoding("cl100k_base")
+        self.oai_client = get_client("openai")
+        self.client = get_client("anthropic")
         self.system_prompt = get_supervisor_system_prompt()
 
         self.oai_planner_tool = [
@@ -63,7 +65,10 @@ class Supervisor:
     def generate_plan(self, task):
         user_query = task
         if self.agent_model == "openai":
-            response = self.oai_client.chat.completions.create(
+            response = get_response_cache().create(
+                "openai",
+                self.oai_client.chat.completions.create,
+                ChatCompletion,
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": self.system_prompt},
@@ -78,7 +83,10 @@ class Supervisor:
             # print("Got response from OpenAI API")
             # print(response)
         else:
-            response = self.client.beta.tools.messages.create(
+            response = get_response_cache().create(
+                "anthropic",
+                self.client.beta.tools.messages.create,
+                Message,
                 model="claude-3-opus-20240229",  # Choose the appropriate model for your use case
                 messages=[{"role": "user", "content": self.system_prompt + user_query}],
                 temperature=0,  # Adjust based on desired creativity
@@ -117,13 +125,65 @@ class Supervisor:
 
         return final_plans
 
-    def run(self, user_id, run_id, task, provider):
+    def run_portfolio(self, user_id, run_id, task, plans, provider, portfolio, worker_kwargs):
+        plan_statements = [
+            "".join(f"{subtask['Subtask']}\n" for subtask in plan) for plan in plans
+        ]
+        winner, outcomes = portfolio.run(
+            user_id, run_id, task, plan_statements, provider, worker_kwargs
+        )
+        summary = [
+            {key: outcome[key] for key in ("worker_number", "run_id", "submission", "metric")}
+            for outcome in outcomes
+        ]
+        if winner is None:
+            print("No worker in the portfolio submitted a result.")
+            results = [outcome["result"] or {} for outcome in outcomes]
+            return {
+                "plan": "\n".join(plan_statements),
+                "result": "No worker in the portfolio submitted a result.",
+                "total_tokens": sum(result.get("total_tokens", 0) for result in results),
+                "total_turns": str(sum(int(result.get("total_turns", 0)) for result in results)),
+                "run_number": str(run_id),
+                "plan_results": [outcome["result"] for outcome in outcomes],
+                "portfolio": summary,
+            }
+        print(f"Portfolio winner: worker {winner['worker_number']} ({winner['submission']})")
+        worker_result = dict(winner["result"])
+        worker_result["portfolio"] = summary
+        return worker_result
+
+    def run(
+        self,
+        user_id,
+        run_id,
+        task,
+        provider,
+        history_mode=False,
+        streaming=False,
+        portfolio=None,
+    ):
+        """Plan `task` and execute it.
+
+        With a PlanPortfolio, each alternative plan is run by its own worker
+        process instead of merging every plan into one worker's outline.
+        """
         if task:
             try:
                 print("Running agent...")
                 agent_plan = self.generate_plan(task)
                 plans = self.parse_chat_response_to_subtasks(agent_plan)
                 print("\n")
+                if portfolio is not None:
+                    return self.run_portfolio(
+                        user_id,
+                        run_id,
+                        task,
+                        plans,
+                        provider,
+                        portfolio,
+                        {"history_mode": history_mode, "streaming": streaming},
+                    )
                 plan_statement = ""
                 for idx, plan in enumerate(plans):
                     for sub_idx, subtask in enumerate(plan):
@@ -138,6 +198,8 @@ class Supervisor:
                     plan=plan_statement,
                     worker_number=1,
                     provider=provider,
+                    history_mode=history_mode,
+                    streaming=streaming,
                 )
 
                 worker_result = worker.run()
@@ -1,3 +1,6 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
 from rich import print
 from rich.panel import Panel
 from rich.text import Text
@@ -24,6 +27,10 @@ from agent.tools.semantic_scholar.semantic_scholar_tool import (
     semantic_scholar_tool_definitions,
 )
 from agent.tools.python.python_tool import run_python, python_tool_definitions
+from agent.tools.python_cell.python_cell_tool import run_python_cell, python_cell_tool_definitions
+from agent.tools.jobs.jobs_tool import start_job, job_status, job_tail, cancel_job, jobs_tool_definitions
+from agent.tools.sweep.sweep_tool import run_sweep, sweep_tool_definitions
+from agent.tools.accounting import merge_usage
 from agent.tools.return_fn.return_fn_tool import return_fn, return_fn_tool_definitions
 from agent.tools.scratchpad.scratchpad_tool import (
     use_scratchpad,
@@ -54,6 +61,9 @@ all_tools = collect_all_tools(
     github_tool_definitions,
     semantic_scholar_tool_definitions,
     python_tool_definitions,
+    python_cell_tool_definitions,
+    jobs_tool_definitions,
+    sweep_tool_definitions,
     return_fn_tool_definitions,
     scratchpad_tool_definitions,
     thought_tool_definitions,
@@ -91,12 +101,99 @@ worker_action_map = {
     "get_paper_details_pwc": "paper_id",
     "get_code_links_pwc": "paper_id",
     "search_papers_with_code": "query",
-    #"long_term_memory": ["query", "run_id"],
+    "long_term_memory": ["query", "run_id"],
+    "run_python_cell": "cell",
+    "start_job": "command",
+    "job_status": "job_id",
+    "job_tail": ["job_id", "lines"],
+    "cancel_job": "job_id",
+    "run_sweep": ["filepath", "space", "metric"],
     # "lookup_papers": "query",
     # "lookup_code": "query"
 }
 
 
+function_mapping = {
+    "run_python": run_python,
+    "run_bash": run_bash,
+    "return_fn": return_fn,
+    "write_code": write_code,
+    "insert_code": insert_code,
+    "replace_code": replace_code,
+    "delete_code": delete_code,
+    "scratchpad": use_scratchpad,
+    "github_get_readme": github_get_readme,
+    "github_list_files": github_list_files,
+    "github_get_file_code": github_get_file_code,
+    "navigate_to_website": navigate_to_website,
+    "search_papers": search_papers,
+    "get_paper_details": get_paper_details,
+    "get_paper_citations": get_paper_citations,
+    "download_paper": download_paper,
+    "thought": use_thought,
+    "search_the_internet": search_the_internet,
+    "search_paperswithcode": search_papers_with_code,
+    "search_papers_with_code": search_papers_with_code,
+    "get_paper_details_pwc": get_paper_details_pwc,
+    "get_code_links_pwc": get_code_links_pwc,
+    "get_code_links": get_code_links_pwc,
+    "long_term_memory": use_long_term_memory,
+    "run_python_cell": run_python_cell,
+    "start_job": start_job,
+    "job_status": job_status,
+    "job_tail": job_tail,
+    "cancel_job": cancel_job,
+    "run_sweep": run_sweep,
+    # "code_lookup": code_lookup,
+    # "paper_lookup": paper_lookup
+}
+
+
+# Whether a tool only reads (and can run alongside other reads) or changes the
+# working directory / external state. Tools missing here are treated as mutating.
+READ_ONLY = "read_only"
+MUTATING = "mutating"
+
+tool_effects = {
+    "run_python": MUTATING,
+    "run_bash": MUTATING,
+    "return_fn": MUTATING,
+    "write_code": MUTATING,
+    "insert_code": MUTATING,
+    "replace_code": MUTATING,
+    "delete_code": MUTATING,
+    "scratchpad": MUTATING,  # read-only when action == "read", see is_read_only
+    "github_get_readme": READ_ONLY,
+    "github_list_files": READ_ONLY,
+    "github_get_file_code": READ_ONLY,
+    "navigate_to_website": READ_ONLY,
+    "search_papers": READ_ONLY,
+    "get_paper_details": READ_ONLY,
+    "get_paper_citations": READ_ONLY,
+    "download_paper": MUTATING,
+    "thought": READ_ONLY,
+    "search_the_internet": READ_ONLY,
+    "search_paperswithcode": READ_ONLY,
+    "search_papers_with_code": READ_ONLY,
+    "get_paper_details_pwc": READ_ONLY,
+    "get_code_links_pwc": READ_ONLY,
+    "get_code_links": READ_ONLY,
+    "long_term_memory": READ_ONLY,
+    "run_python_cell": MUTATING,
+    "start_job": MUTATING,
+    "job_status": READ_ONLY,
+    "job_tail": READ_ONLY,
+    "cancel_job": MUTATING,
+    "run_sweep": MUTATING,
+}
+
+
+def is_read_only(name, arguments):
+    if name == "scratchpad":
+        return isinstance(arguments, dict) and arguments.get("action") == "read"
+    return tool_effects.get(name, MUTATING) == READ_ONLY
+
+
 class Tool:
     def __init__(self, task):
         self.task = task
@@ -121,33 +218,6 @@ class Tool:
             print(panel)
 
     def run(self):
-        function_mapping = {
-            "run_python": run_python,
-            "run_bash": run_bash,
-            "return_fn": return_fn,
-            "write_code": write_code,
-            "insert_code": insert_code,
-            "replace_code": replace_code,
-            "delete_code": delete_code,
-            "scratchpad": use_scratchpad,
-            "github_get_readme": github_get_readme,
-            "github_list_files": github_list_files,
-            "github_get_file_code": github_get_file_code,
-            "navigate_to_website": navigate_to_website,
-            "search_papers": search_papers,
-            "get_paper_details": get_paper_details,
-            "get_paper_citations": get_paper_citations,
-            "download_paper": download_paper,
-            "thought": use_thought,
-            "search_the_internet": search_the_internet,
-            "search_paperswithcode": search_papers_with_code,
-            "get_paper_details_pwc": get_paper_details_pwc,
-            "get_code_links_pwc": get_code_links_pwc,
-            #"long_term_memory": use_long_term_memory,
-            # "code_lookup": code_lookup,
-            # "paper_lookup": paper_lookup
-        }
-
         if self.task["type"] == "function":
             function_name = self.task["function"]["name"]
             if function_name in function_mapping:
@@ -161,3 +231,85 @@ class Tool:
                 return {"subtask_result": "Invalid task", "attempted": "no"}
         else:
             return {"subtask_result": "Invalid task", "attempted": "no"}
+
+
+def run_tool_call(name, arguments):
+    """Run a tool call addressed by name, as returned in a tool_use block."""
+    return Tool(
+        {"type": "function", "function": {"name": name, "parameters": arguments}}
+    ).run()
+
+
+class ToolCallScheduler:
+    """Runs the tool calls of one model response, concurrently where safe.
+
+    Read-only calls run side by side on a thread pool. A mutating call waits
+    for every call submitted before it, and calls submitted after a mutating
+    call wait for it, so the observable order matches sequential execution.
+    """
+
+    def __init__(self, max_workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.last_mutation = None
+        self.since_mutation = []
+
+    def _run_after(self, dependencies, name, arguments):
+        wait(dependencies)
+        return run_tool_call(name, arguments)
+
+    def submit(self, name, arguments):
+        with self.lock:
+            # Finished calls have nothing left to wait for; dropping them keeps
+            # the dependency lists from growing over a long run.
+            self.since_mutation = [future for future in self.since_mutation if not future.done()]
+            if self.last_mutation is not None and self.last_mutation.done():
+                self.last_mutation = None
+            if is_read_only(name, arguments):
+                dependencies = [self.last_mutation] if self.last_mutation else []
+                future = self.executor.submit(self._run_after, dependencies, name, arguments)
+                self.since_mutation.append(future)
+            else:
+                dependencies = list(self.since_mutation)
+                if self.last_mutation:
+                    dependencies.append(self.last_mutation)
+                future = self.executor.submit(self._run_after, dependencies, name, arguments)
+                self.last_mutation = future
+                self.since_mutation = []
+            return future
+
+    def run_all(self, calls):
+        """Run (name, arguments) pairs and return their outputs in call order."""
+        futures = [self.submit(name, arguments) for name, arguments in calls]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def merge_tool_outputs(tool_outputs):
+    """Fold the outputs of several calls from one response into one result."""
+    if len(tool_outputs) == 1:
+        return tool_outputs[0]
+    for tool_output in tool_outputs:
+        if isinstance(tool_output, dict) and tool_output.get("tool") == "return_fn":
+            return tool_output
+    outputs = [
+        output if isinstance(output, dict) else {"stdout": output} for output in tool_outputs
+    ]
+    return {
+        "tool": ", ".join(str(output.get("tool", "None")) for output in outputs),
+        "status": "success"
+        if all(output.get("status") == "success" for output in outputs)
+        else "failure",
+        "attempt": "\n".join(
+            f"[{output.get('tool', 'None')}] {output.get('attempt', '')}" for output in outputs
+        ),
+        "stdout": "\n".join(
+            f"[{output.get('tool', 'None')}] {output.get('stdout', '')}" for output in outputs
+        ),
+        "stderr": "\n".join(
+            f"[{output.get('tool', 'None')}] {output.get('stderr', '')}" for output in outputs
+        ),
+        "resources": merge_usage(output.get("resources") for output in outputs),
+    }
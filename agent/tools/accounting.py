@@ -0,0 +1,170 @@
+import os
+import time
+import threading
+import subprocess
+
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Columns added to the memory table, see agent.memory.AgentConversation.
+RESOURCE_FIELDS = (
+    "wall_seconds",
+    "cpu_user_seconds",
+    "cpu_system_seconds",
+    "peak_rss_bytes",
+    "output_bytes",
+    "exit_reason",
+)
+
+
+def _read_stat(pid):
+    """Fields of /proc/<pid>/stat after the command name, or None."""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            data = file.read()
+    except OSError:
+        return None
+    # The command name is in parentheses and may contain spaces.
+    return data[data.rindex(")") + 2 :].split()
+
+
+def process_times(pid):
+    """(user, system) CPU seconds of a live process plus its reaped children.
+
+    A shell or kernel waits for the commands it runs, so the difference of
+    two readings is the CPU time of everything it ran in between.
+    """
+    fields = _read_stat(pid)
+    if fields is None:
+        return None
+    utime, stime, cutime, cstime = (int(value) for value in fields[11:15])
+    return (utime + cutime) / CLOCK_TICKS, (stime + cstime) / CLOCK_TICKS
+
+
+def session_rss(session_id):
+    """Resident memory, in bytes, of all processes in a session (a tool's process tree)."""
+    total = 0
+    try:
+        pids = [name for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return 0
+    for pid in pids:
+        fields = _read_stat(pid)
+        # fields[3] is the session id, fields[21] the RSS in pages.
+        if fields is not None and int(fields[3]) == session_id:
+            total += int(fields[21]) * PAGE_SIZE
+    return total
+
+
+class ResourceMonitor:
+    """Measures one tool execution: wall time, CPU time, peak RSS of its process tree.
+
+    Tool processes are started in their own session (start_new_session), so
+    the tree is "every process in that session"; a background thread sums
+    their RSS every `interval` seconds (AGENT_ACCOUNTING_INTERVAL, default
+    0.5). CPU time comes from the caller: a wait4() rusage for a process that
+    was reaped, or process_times() deltas for a long-lived shell or kernel.
+    """
+
+    def __init__(self, session_id=None, interval=None):
+        self.session_id = session_id
+        self.interval = interval or float(os.getenv("AGENT_ACCOUNTING_INTERVAL", "0.5"))
+        self.peak_rss = 0
+        self.started = time.perf_counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self, session_id=None):
+        if session_id is not None:
+            self.session_id = session_id
+        self.started = time.perf_counter()
+        if self.session_id is not None and os.path.isdir("/proc"):
+            self.thread = threading.Thread(target=self._sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def _sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, session_rss(self.session_id))
+            if self.stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        """Stop sampling and return the wall-clock seconds since start."""
+        wall = time.perf_counter() - self.started
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        return wall
+
+    def usage(self, user=None, system=None, max_rss=0, output_stats=None, exit_reason=None):
+        """The `resources` dict of a tool result.
+
+        `max_rss` (bytes) is the largest single process as reported by the
+        kernel; it catches spikes shorter than the sampling interval.
+        """
+        wall = self.stop()
+        return {
+            "wall_seconds": round(wall, 3),
+            "cpu_user_seconds": round(user, 3) if user is not None else None,
+            "cpu_system_seconds": round(system, 3) if system is not None else None,
+            "peak_rss_bytes": max(self.peak_rss, max_rss or 0) or None,
+            "output_bytes": sum(stats["bytes"] for stats in (output_stats or {}).values()),
+            "exit_reason": exit_reason,
+        }
+
+
+def wait_with_rusage(process):
+    """Reap a tool process: (returncode, user seconds, system seconds, max RSS bytes).
+
+    A Popen child is reaped with wait4() for its own rusage (including the
+    children it waited for); a warm pool child is reaped by the pool server,
+    which reports the same numbers.
+    """
+    if isinstance(process, subprocess.Popen):
+        if process.returncode is None:
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return process.returncode, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss * 1024
+        return process.returncode, None, None, 0
+    returncode = process.wait()
+    return (returncode, *(process.rusage or (None, None, 0)))
+
+
+def merge_usage(usages):
+    """One `resources` dict for several tool calls answered in one step."""
+    usages = [usage for usage in usages if usage]
+    if not usages:
+        return None
+    merged = {}
+    for field in ("wall_seconds", "cpu_user_seconds", "cpu_system_seconds", "output_bytes"):
+        values = [usage[field] for usage in usages if usage.get(field) is not None]
+        merged[field] = round(sum(values), 3) if values else None
+    merged["peak_rss_bytes"] = max((usage.get("peak_rss_bytes") or 0) for usage in usages) or None
+    reasons = [usage.get("exit_reason") for usage in usages]
+    merged["exit_reason"] = next((reason for reason in reasons if reason not in (None, "completed")), reasons[0])
+    return merged
+
+
+def summarize_usage(rows):
+    """Totals over stored tool executions (dicts with RESOURCE_FIELDS) for the run summary."""
+    summary = {
+        "tool_executions": 0,
+        "wall_seconds": 0.0,
+        "cpu_seconds": 0.0,
+        "peak_rss_bytes": 0,
+        "output_bytes": 0,
+        "killed": 0,
+    }
+    for row in rows:
+        if row.get("wall_seconds") is None:
+            continue
+        summary["tool_executions"] += 1
+        summary["wall_seconds"] += row["wall_seconds"]
+        summary["cpu_seconds"] += (row.get("cpu_user_seconds") or 0) + (row.get("cpu_system_seconds") or 0)
+        summary["peak_rss_bytes"] = max(summary["peak_rss_bytes"], row.get("peak_rss_bytes") or 0)
+        summary["output_bytes"] += row.get("output_bytes") or 0
+        if row.get("exit_reason") in ("wall_timeout", "idle_timeout", "cpu_limit", "memory_limit", "signal"):
+            summary["killed"] += 1
+    return summary
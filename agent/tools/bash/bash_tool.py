@@ -1,13 +1,12 @@
 import logging
-import shlex
-import subprocess
 from typing import Dict, Optional
-from agent.utils import remove_ascii
+from agent.tools.bash.shell_session import ShellSession, get_shell_session
+from agent.tools.exec_cache import bash_inputs, declared_inputs, get_exec_cache
 
 bash_tool_definitions = [
     {
         "name": "run_bash",
-        "description": "Run a bash script on the server. Doesn't support interactive commands",
+        "description": "Run a bash script on the server. Doesn't support interactive commands. Commands run in one persistent shell, so the working directory, exported variables and activated environments carry over between calls.",
         "input_schema": {
             "type": "object",
             "properties": {
@@ -15,6 +14,15 @@ bash_tool_definitions = [
                     "type": "string",
                     "description": "The bash script to run.",
                 },
+                "inputs": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Files or directories the script reads that it does not name literally (execution cache only).",
+                },
+                "no_cache": {
+                    "type": "boolean",
+                    "description": "Run even if an identical earlier run is cached (execution cache only).",
+                },
             },
             "required": ["script"],
         },
@@ -23,11 +31,13 @@ bash_tool_definitions = [
 
 
 class BashRunnerActor:
-    def __init__(self, timeout: int = 1000000):
+    def __init__(self, timeout: Optional[float] = None, session: Optional[ShellSession] = None):
+        # None uses the session's limits (AGENT_TOOL_TIMEOUT, see agent.tools.limits).
         self.timeout = timeout
+        self.session = session or get_shell_session()
 
     def run(self, command: str) -> Dict[str, Optional[str]]:
-        """Method to execute a bash command and return the results."""
+        """Method to execute a bash command in the run's shell session and return the results."""
         logging.info(f"Executing command: {command}")
 
         result = {
@@ -40,52 +50,35 @@ class BashRunnerActor:
         }
 
         try:
-            # Start the subprocess with unbuffered output
-            process = subprocess.Popen(
-                command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-            )
-
-            stdout_lines = []
-            stderr_lines = []
-
-            import threading
-            import sys
-
-            def read_stdout():
-                for line in iter(process.stdout.readline, ''):
-                    print(line, end='')  # Print to console
-                    stdout_lines.append(line)
-
-            def read_stderr():
-                for line in iter(process.stderr.readline, ''):
-                    print(line, end='', file=sys.stderr)  # Print errors to stderr
-                    stderr_lines.append(line)
-
-            stdout_thread = threading.Thread(target=read_stdout)
-            stderr_thread = threading.Thread(target=read_stderr)
-
-            stdout_thread.start()
-            stderr_thread.start()
-
-            # Wait for the process to finish
-            process.wait(timeout=self.timeout)
-
-            # Wait for threads to finish reading
-            stdout_thread.join()
-            stderr_thread.join()
-
-            returncode = process.returncode
-            result['returncode'] = returncode
-
-            result["stdout"] = ''.join(stdout_lines)
-            result["stderr"] = ''.join(stderr_lines)
-
+            outcome = self.session.run(command, timeout=self.timeout)
+            returncode, status = outcome["returncode"], outcome["status"]
+            result["returncode"] = returncode
+            result["exit_reason"] = outcome["exit_reason"]
+            result["stdout"] = outcome["stdout"]
+            result["stderr"] = outcome["stderr"]
+            result["output_stats"] = outcome["output_stats"]
+            result["resources"] = outcome["resources"]
+
+            if status == "timeout" and self.timeout is not None:
+                result["stderr"] += (
+                    f"\nCommand timed out after {self.timeout:g} seconds; "
+                    "the shell session was restarted"
+                )
+            elif status in ("timeout", "idle_timeout"):
+                result["stderr"] += (
+                    f"\nCommand {self.session.limits.describe(outcome['exit_reason'])}; "
+                    "the shell session was restarted. Run long jobs in the background "
+                    "with their output redirected to a file, or make them print progress."
+                )
+            elif status == "shell_exited":
+                result["stderr"] += (
+                    "\nThe shell exited; the next command starts a new session "
+                    "in the original directory"
+                )
+            if outcome["exit_reason"] in ("cpu_limit", "memory_limit"):
+                result["stderr"] += f"\nThe command {self.session.limits.describe(outcome['exit_reason'])}"
+            if status != "completed":
+                logging.error(result["stderr"])
             if returncode == 0:
                 result["status"] = "success"
             else:
@@ -95,18 +88,8 @@ class BashRunnerActor:
 
             return result
 
-        except subprocess.TimeoutExpired:
-            process.kill()
-            stdout_thread.join()
-            stderr_thread.join()
-            result["stderr"] = f"Command timed out after {self.timeout} seconds"
-            logging.error(result["stderr"])
-            return result
-
         except Exception as e:
-            process.kill()
-            stdout_thread.join()
-            stderr_thread.join()
+            self.session.kill()
             result["stderr"] = f"Unexpected error: {str(e)}"
             logging.exception(result["stderr"])
             return result
@@ -117,12 +100,25 @@ def run_bash(arguments: dict) -> Dict[str, Optional[str]]:
     This function is used to run a bash script on the server.
     Use this function to run the code you need to complete the task.
     """
+    inputs, bypass = [], False
     if isinstance(arguments, dict):
         command = arguments["script"]
+        inputs = arguments.get("inputs") or []
+        bypass = bool(arguments.get("no_cache", False))
     else:
         command = arguments
 
     runner_actor = BashRunnerActor()
-    result = runner_actor.run(command)
-    result["stdout"] = remove_ascii(result["stdout"])
-    return result
+    cache = get_exec_cache()
+    if cache is None:
+        # Output is already stripped of ANSI codes and progress-bar redraws.
+        return runner_actor.run(command)
+    session = runner_actor.session
+    # Variables exported or set, functions and aliases defined, environments
+    # activated by earlier commands of the session.
+    state = session.current_state()
+    cwd = session.current_dir
+    files = bash_inputs(command, cwd)
+    if files is not None:
+        files |= declared_inputs(inputs, cwd)
+    return cache.run("run_bash", command, cwd, files, lambda: runner_actor.run(command), bypass, state)
@@ -0,0 +1,257 @@
+import os
+import time
+import uuid
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+
+from agent.tools.context import get_run_context, track_process_group, untrack_process_group
+from agent.tools.io_pump import SentinelReader
+from agent.tools.limits import ToolLimits, classify_exit, kill_process_group
+from agent.tools.accounting import ResourceMonitor, process_times
+
+
+class ShellSession:
+    """A long-lived bash process that runs commands one after another.
+
+    Each command is written to a script file and sourced (`.`) by the shell, so
+    `cd`, `export`, activated virtualenvs and shell functions carry over to
+    the next command. After the script, the shell prints a unique sentinel
+    with the exit code, a checksum of its variables, functions and aliases
+    (`state`) and its directory on stdout, and a sentinel on stderr; output
+    is read until both sentinels arrive. A command that times out kills the shell's process
+    group, and a shell that exits (e.g. the script called `exit`) is
+    restarted on the next command, starting from the original directory.
+    """
+
+    def __init__(self, cwd=None, env=None, shell=None, limits=None):
+        self.cwd = cwd or os.getcwd()
+        self.env = env
+        self.shell = shell or shutil.which("bash") or "/bin/sh"
+        self.limits = limits or ToolLimits.from_env()
+        self.process = None
+        self.cgroup = None
+        # The shell's working directory after the last command.
+        self.current_dir = self.cwd
+        # Checksum of its variables, functions and aliases, see current_state().
+        self.state = None
+        self.script_dir = tempfile.mkdtemp(prefix="agent_shell_")
+        self.lock = threading.Lock()
+        self.metrics = {
+            "spawns": 0,
+            "spawn_seconds": 0.0,
+            "commands": 0,
+            "timeouts": 0,
+            "idle_timeouts": 0,
+            "restarts": 0,
+        }
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        start = time.perf_counter()
+        # rlimits / the cgroup apply to the shell and everything it starts.
+        self.cgroup = self.limits.cgroup()
+        self.process = subprocess.Popen(
+            [self.shell, "--noprofile", "--norc"] if self.shell.endswith("bash") else [self.shell],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            env=self.env,
+            start_new_session=True,  # own process group, see kill()
+            preexec_fn=self.limits.preexec(self.cgroup),
+        )
+        track_process_group(self.process.pid)
+        self.current_dir = self.cwd
+        # None until the first command: the shell starts from our environment.
+        self.state = None
+        if self.metrics["spawns"]:
+            self.metrics["restarts"] += 1
+        self.metrics["spawns"] += 1
+        self.metrics["spawn_seconds"] += time.perf_counter() - start
+
+    def kill(self):
+        if self.process is None:
+            return
+        # Background jobs of the shell live in its process group too.
+        kill_process_group(self.process.pid)
+        self.process.wait()
+        untrack_process_group(self.process.pid)
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            pipe.close()
+        self.process = None
+        if self.cgroup is not None:
+            self.cgroup.remove()
+            self.cgroup = None
+
+    def close(self):
+        self.kill()
+        shutil.rmtree(self.script_dir, ignore_errors=True)
+
+    def current_state(self):
+        """Checksum of the shell's variables, functions and aliases.
+
+        A shell that has not run anything yet is asked with a no-op, so its
+        first command and the ones after it see the same value.
+        """
+        if self.state is None:
+            self.run(":", echo=False)
+        return self.state
+
+    def environment(self):
+        """The shell's exported variables, for processes started on its behalf.
+
+        Our own environment if the shell has not been started or cannot tell.
+        """
+        if not self.alive:
+            return dict(os.environ if self.env is None else self.env)
+        path = os.path.join(self.script_dir, "environment")
+        outcome = self.run(f"env -0 > '{path}'", echo=False)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            data = b""
+        if outcome["returncode"] != 0 or not data:
+            return dict(os.environ if self.env is None else self.env)
+        return dict(
+            item.split("=", 1) for item in data.decode(errors="surrogateescape").split("\0") if "=" in item
+        )
+
+    def run(self, command, timeout=None, echo=True, idle_timeout=None):
+        """Run `command` in the session.
+
+        `timeout` (wall clock) and `idle_timeout` (seconds without output)
+        default to the session's ToolLimits. Returns a dict with returncode,
+        status ("completed", "timeout", "idle_timeout" or "shell_exited"),
+        exit_reason (see agent.tools.limits.classify_exit), stdout, stderr,
+        output_stats and resources (see agent.tools.accounting). returncode is None when the command was killed by a
+        timeout. Output is captured with OutputCapture, so very long output is
+        truncated in the middle and spilled to disk.
+        """
+        timeout = self.limits.wall_timeout if timeout is None else timeout
+        idle_timeout = self.limits.idle_timeout if idle_timeout is None else idle_timeout
+        with self.lock:
+            if not self.alive:
+                if self.process is not None:
+                    self.kill()
+                self.start()
+            self.metrics["commands"] += 1
+            marker = f"__AGENT_SHELL_DONE_{uuid.uuid4().hex}__"
+            script_path = os.path.join(self.script_dir, "command.sh")
+            with open(script_path, "w") as script:
+                script.write(command)
+                script.write("\n")
+            # stdin comes from /dev/null so the command cannot swallow the
+            # next command we write to the shell.
+            wrapper = (
+                # POSIX `.` rather than `source`, for when only /bin/sh exists.
+                f". {script_path} < /dev/null\n"
+                f"__agent_status=$?\n"
+                # `_` and PIPESTATUS change with every command, PPID with every agent process.
+                f"__agent_state=$({{ set; alias; }} 2>/dev/null "
+                f"| grep -v -e '^_=' -e '^__agent_' -e '^PIPESTATUS=' -e '^PPID=' | cksum)\n"
+                f"printf '\\n{marker} %d %s %s\\n' \"$__agent_status\" \"${{__agent_state%% *}}\" \"$PWD\"\n"
+                f"printf '\\n{marker}\\n' >&2\n"
+            )
+            # The shell waits for what it runs, so its children's CPU time
+            # grows by exactly the command's.
+            monitor = ResourceMonitor().start(self.process.pid)
+            times_before = process_times(self.process.pid)
+            try:
+                self.process.stdin.write(wrapper.encode())
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                pass
+            return self._collect(marker, timeout, idle_timeout, echo, monitor, times_before)
+
+    def _cpu_times(self, times_before):
+        times_after = process_times(self.process.pid)
+        if times_before is None or times_after is None:
+            return None, None
+        return times_after[0] - times_before[0], times_after[1] - times_before[1]
+
+    def _collect(self, marker, timeout, idle_timeout, echo, monitor, times_before):
+        deadline = time.monotonic() + timeout if timeout else None
+        oom_kills = self.cgroup.oom_kills() if self.cgroup is not None else 0
+        # stdout ends with "<marker> <exit code> <state> <cwd>\n", stderr with "<marker>\n".
+        reader = SentinelReader(self.process, marker, "run_bash", echo)
+        status = {"timeout": "timeout", "idle": "idle_timeout"}.get(
+            reader.run(deadline, idle_timeout), "completed"
+        )
+        if reader.eof and status == "completed":
+            status = "shell_exited"
+        payload = reader.finish()
+        returncode = None
+        if payload is not None:
+            code, _, rest = payload.partition(" ")
+            state, _, directory = rest.partition(" ")
+            returncode = int(code)
+            self.state = state or None
+            self.current_dir = directory or self.current_dir
+
+        oom_killed = self.cgroup is not None and self.cgroup.oom_kills() > oom_kills
+        stderr = reader.text("stderr")
+        # Read before kill(); the killed command's own time is lost with it.
+        user, system = self._cpu_times(times_before)
+        if status in ("timeout", "idle_timeout"):
+            self.metrics["timeouts" if status == "timeout" else "idle_timeouts"] += 1
+            exit_reason = "wall_timeout" if status == "timeout" else "idle_timeout"
+            self.kill()
+        else:
+            if status == "shell_exited" or returncode is None:
+                status = "shell_exited"
+                returncode = self.process.wait()
+                self.kill()
+            exit_reason = classify_exit(returncode, stderr, self.limits, oom_killed)
+        output_stats = reader.stats()
+        return {
+            "returncode": returncode,
+            "status": status,
+            "exit_reason": exit_reason,
+            "stdout": reader.text("stdout"),
+            "stderr": stderr,
+            "output_stats": output_stats,
+            "resources": monitor.usage(user, system, 0, output_stats, exit_reason),
+        }
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_shell_session(run_id=None):
+    """The shell session of a run (default: the run this process is working on)."""
+    if run_id is None:
+        run_id = get_run_context()["run_id"]
+    with _sessions_lock:
+        session = _sessions.get(run_id)
+        if session is None:
+            session = _sessions[run_id] = ShellSession()
+        return session
+
+
+def session_metrics():
+    with _sessions_lock:
+        return {run_id: dict(session.metrics) for run_id, session in _sessions.items()}
+
+
+def close_shell_session(run_id):
+    """Close the shell session of a run that has finished, if it has one."""
+    with _sessions_lock:
+        session = _sessions.pop(run_id, None)
+    if session is not None:
+        session.close()
+
+
+@atexit.register
+def close_shell_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
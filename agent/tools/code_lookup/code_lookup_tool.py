@@ -2,7 +2,7 @@ import redis
 from redis.commands.search.field import TagField, VectorField
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
-from sentence_transformers import SentenceTransformer
+from agent.embeddings import get_encoder
 
 code_lookup_tool_deinitions = [
     {
@@ -25,7 +25,7 @@ code_lookup_tool_deinitions = [
 class RedisCodeLookUp:
     def __init__(self):
         self.cache = {}
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.model = get_encoder()
         self.index_name = "code"
         self.redis_db = redis.Redis(
             username="default",
@@ -0,0 +1,69 @@
+import os
+import signal
+import threading
+
+
+# The worker running in this process. Tools are called with only their model
+# arguments, so per-run state (shell sessions, output logs) is keyed off this.
+_context = {"run_id": None, "work_dir": None, "process_groups": set()}
+_context_lock = threading.Lock()
+
+# Under the run directory; the execution cache does not treat it as output.
+PROCESS_GROUPS_FILE = os.path.join(".processes", "groups")
+
+
+def set_run_context(run_id, work_dir):
+    with _context_lock:
+        _context["run_id"] = run_id
+        _context["work_dir"] = os.path.abspath(work_dir) if work_dir else None
+
+
+def get_run_context():
+    with _context_lock:
+        return dict(_context, process_groups=set(_context["process_groups"]))
+
+
+def _write_process_groups():
+    # Mirrored to the run directory so a parent (agent.portfolio) can still
+    # reach the groups after this process was killed.
+    if not _context["work_dir"] or not os.path.isdir(_context["work_dir"]):
+        return
+    path = os.path.join(_context["work_dir"], PROCESS_GROUPS_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write("".join(f"{pgid}\n" for pgid in sorted(_context["process_groups"])))
+    os.replace(tmp_path, path)
+
+
+def track_process_group(pgid):
+    """Record a tool process group (started with start_new_session) of this run."""
+    with _context_lock:
+        _context["process_groups"].add(pgid)
+        _write_process_groups()
+
+
+def untrack_process_group(pgid):
+    with _context_lock:
+        if pgid in _context["process_groups"]:
+            _context["process_groups"].discard(pgid)
+            _write_process_groups()
+
+
+def kill_process_groups(sig=signal.SIGKILL, work_dir=None):
+    """Signal the tracked tool process groups of this process, or of the run in `work_dir`."""
+    if work_dir is None:
+        with _context_lock:
+            pgids = set(_context["process_groups"])
+    else:
+        try:
+            with open(os.path.join(work_dir, PROCESS_GROUPS_FILE)) as file:
+                pgids = {int(line) for line in file if line.strip()}
+        except (OSError, ValueError):
+            pgids = set()
+    for pgid in pgids:
+        try:
+            os.killpg(pgid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+    return pgids
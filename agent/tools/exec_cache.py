@@ -0,0 +1,333 @@
+import os
+import re
+import ast
+import sys
+import json
+import time
+import shlex
+import hashlib
+import logging
+import sysconfig
+import threading
+
+from agent.tools.context import get_run_context
+
+
+# Directories the agent itself writes to; never inputs or outputs of a command.
+IGNORED_DIRS = {".exec_cache", ".tool_logs", ".outputs", ".jobs", ".sweeps", ".processes", "__pycache__", ".git"}
+# Commands that change the shell session's state, read state that is not on
+# disk (network, GPUs, processes, the clock) or just look around the file
+# system (cheap, and their output depends on more than their arguments).
+# They always run.
+UNCACHEABLE_COMMANDS = {
+    "cd", "pushd", "popd", "export", "unset", "set", "shopt", "alias", "unalias",
+    "source", ".", "eval", "exec", "trap", "ulimit", "umask", "conda", "activate",
+    "deactivate", "pip", "pip3", "git", "wget", "curl", "apt", "apt-get",
+    "nvidia-smi", "ps", "top", "kill", "pkill", "date", "sleep", "ping",
+    "ls", "find", "du", "df", "tree", "free", "nproc", "pwd", "which",
+}
+SHELL_OPERATORS = {"&&", "||", ";", "|", "&", "(", ")", "!"}
+MAX_INPUTS = 256
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def exec_cache_enabled():
+    return os.getenv("AGENT_EXEC_CACHE", "0") == "1"
+
+
+def _stat_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def file_digest(path):
+    """sha256 of a file, remembered per (path, size, mtime) so unchanged files are hashed once."""
+    fingerprint = _stat_fingerprint(path)
+    if fingerprint is None:
+        return None
+    memo_key = (os.path.abspath(path), *fingerprint)
+    with _digests_lock:
+        digest = _digests.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with _digests_lock:
+            _digests[memo_key] = digest
+    return digest
+
+
+def snapshot(directory, max_files=None):
+    """{absolute path: [size, mtime_ns]} of every file under `directory`, or None if there are too many."""
+    max_files = max_files or int(os.getenv("AGENT_EXEC_CACHE_MAX_FILES", "20000"))
+    files = {}
+    for root, dirs, names in os.walk(os.path.realpath(directory)):
+        dirs[:] = [name for name in dirs if name not in IGNORED_DIRS]
+        for name in names:
+            path = os.path.join(root, name)
+            fingerprint = _stat_fingerprint(path)
+            if fingerprint is not None:
+                files[path] = fingerprint
+        if len(files) > max_files:
+            return None
+    return files
+
+
+def changed_files(before, after):
+    """Files the command created, modified ([size, mtime_ns]) or deleted (None)."""
+    changes = {path: fingerprint for path, fingerprint in after.items() if before.get(path) != fingerprint}
+    changes.update({path: None for path in before if path not in after})
+    return changes
+
+
+def input_fingerprint(path):
+    """Content hash of a file, or a listing fingerprint of a directory."""
+    if not os.path.exists(path):
+        return "absent"
+    if os.path.isdir(path):
+        listing = snapshot(path)
+        if listing is None:
+            return None
+        listing = {os.path.relpath(name, path): fingerprint for name, fingerprint in listing.items()}
+        return hashlib.sha256(json.dumps(sorted(listing.items())).encode()).hexdigest()
+    return file_digest(path)
+
+
+def environment_fingerprint():
+    """Interpreter, environment variables and installed packages."""
+    sha = hashlib.sha256()
+    sha.update(f"{sys.executable}\n{sys.version}\n".encode())
+    sha.update(json.dumps(sorted(os.environ.items())).encode())
+    for name in ("purelib", "platlib"):
+        path = sysconfig.get_paths().get(name)
+        # pip install/uninstall changes site-packages' mtime.
+        sha.update(f"{path}:{_stat_fingerprint(path)}\n".encode())
+    return sha.hexdigest()
+
+
+def _is_candidate(path, cwd):
+    if not path or "\n" in path or "\0" in path or len(path) > 4096:
+        return False
+    full = os.path.realpath(os.path.join(cwd, path))
+    cwd = os.path.realpath(cwd)
+    # "." or a parent of the working directory would hash the whole tree.
+    if full == cwd or cwd.startswith(full.rstrip(os.sep) + os.sep):
+        return False
+    return os.path.exists(full)
+
+
+def declared_inputs(paths, cwd):
+    """Input paths given explicitly by the model, relative to `cwd`."""
+    return {os.path.realpath(os.path.join(cwd, path)) for path in paths or [] if path}
+
+
+def python_inputs(path, cwd, seen=None):
+    """Files a script reads, as far as can be told without running it.
+
+    String literals that name existing files or directories, and local modules
+    it imports (recursively).
+    """
+    seen = set() if seen is None else seen
+    full = os.path.realpath(os.path.join(cwd, path))
+    if full in seen or len(seen) >= MAX_INPUTS:
+        return seen
+    seen.add(full)
+    try:
+        with open(full, "rb") as file:
+            tree = ast.parse(file.read())
+    except (OSError, SyntaxError, ValueError):
+        return seen
+    script_dir = os.path.dirname(full)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            for base in (cwd, script_dir):
+                if _is_candidate(node.value, base):
+                    seen.add(os.path.realpath(os.path.join(base, node.value)))
+                    break
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module or ""]
+            for name in names:
+                module = os.path.join(script_dir, *name.split("."))
+                for candidate in (module + ".py", os.path.join(module, "__init__.py")):
+                    if name and os.path.isfile(candidate):
+                        python_inputs(candidate, cwd, seen)
+    return seen
+
+
+def bash_inputs(command, cwd):
+    """Files a command reads, or None if the command must not be cached.
+
+    Words that name existing files or directories count as inputs, and Python
+    scripts among them are scanned with python_inputs.
+    """
+    words = []
+    try:
+        # Line by line, so every line starts a command (a quoted string
+        # spanning lines fails to parse and makes the command uncacheable).
+        for line in command.splitlines():
+            lexer = shlex.shlex(line, posix=True, punctuation_chars=True)
+            lexer.whitespace_split = True
+            words.extend(list(lexer) + [";"])
+    except ValueError:
+        return None
+    inputs = set()
+    command_position = True
+    for word in words:
+        if word in SHELL_OPERATORS or set(word) <= set(";&|()"):
+            command_position = True
+            continue
+        if command_position:
+            if re.match(r"^[A-Za-z_][A-Za-z0-9_]*=", word):
+                continue  # VAR=value prefix
+            if os.path.basename(word) in UNCACHEABLE_COMMANDS:
+                return None
+            command_position = False
+        if _is_candidate(word, cwd):
+            full = os.path.realpath(os.path.join(cwd, word))
+            if full.endswith(".py"):
+                python_inputs(full, cwd, inputs)
+            else:
+                inputs.add(full)
+        if len(inputs) > MAX_INPUTS:
+            return None
+    return inputs
+
+
+class ExecCache:
+    """Results of run_python / run_bash calls, reused while nothing they depend on changed.
+
+    Entries are keyed by the tool, the script (bytes of the file for
+    run_python, the command for run_bash), the working directory and the
+    environment fingerprint. An entry records the fingerprints of the run's
+    inputs as they were before it ran, and the files it created, changed or
+    deleted in the run directory. It is reused while the inputs are
+    unchanged and the outputs are still as the run left them, so a cached
+    run never skips side effects that were undone since. A detected input
+    that the run itself wrote (an output file named in the script) counts as
+    an output. Entries live in `<run dir>/.exec_cache`; the least recently
+    used ones are evicted beyond `max_entries` or `max_bytes`.
+    """
+
+    def __init__(self, directory, max_entries=None, max_bytes=None):
+        self.directory = directory
+        self.root = os.path.dirname(directory)
+        self.max_entries = max_entries or int(os.getenv("AGENT_EXEC_CACHE_ENTRIES", "256"))
+        self.max_bytes = max_bytes or int(float(os.getenv("AGENT_EXEC_CACHE_MB", "256")) * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "uncacheable": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, tool, source, cwd, state=None):
+        sha = hashlib.sha256()
+        sha.update(f"{tool}\n{os.path.realpath(cwd)}\n{state}\n".encode())
+        sha.update(source if isinstance(source, bytes) else source.encode())
+        sha.update(environment_fingerprint().encode())
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key, inputs=None):
+        """The cached result for `key` if it is still valid for the current `inputs`."""
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        for output, fingerprint in entry["outputs"].items():
+            if _stat_fingerprint(output) != fingerprint:
+                return None
+        for input_path, fingerprint in entry["inputs"].items():
+            current = inputs.get(input_path) if inputs and input_path in inputs else input_fingerprint(input_path)
+            if current != fingerprint:
+                return None
+        for input_path in inputs or {}:
+            if input_path not in entry["inputs"] and input_path not in entry["outputs"]:
+                return None  # the script reads a file that did not exist back then
+        os.utime(path)  # most recently used
+        return dict(entry["result"], cached=True, cached_at=entry["created"])
+
+    def put(self, key, result, inputs, outputs):
+        entry = {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            # A cache hit costs nothing; resources describe the original run only.
+            "result": {name: value for name, value in result.items() if name != "resources"},
+            "inputs": {path: fingerprint for path, fingerprint in inputs.items() if path not in outputs},
+            "outputs": outputs,
+        }
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(entry, file)
+        os.replace(tmp_path, path)
+        self.metrics["stores"] += 1
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+                _, size, name = entries.pop(0)
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+                self.metrics["evictions"] += 1
+
+    def run(self, tool, source, cwd, inputs, execute, bypass=False, state=None):
+        """Return a cached result for this call, or `execute()` it and cache the result.
+
+        `inputs` are the files the call reads (None: not cacheable). `state`
+        is anything else the call depends on beyond this process' environment,
+        e.g. the variables of the shell session run_bash runs in. Only runs
+        that finished by themselves (exit_reason completed or error) are stored.
+        """
+        fingerprints = {path: input_fingerprint(path) for path in inputs} if inputs is not None else None
+        if fingerprints is None or None in fingerprints.values():
+            self.metrics["uncacheable"] += 1
+            return execute()
+        key = self.key(tool, source, cwd, state)
+        if not bypass:
+            cached = self.get(key, fingerprints)
+            if cached is not None:
+                self.metrics["hits"] += 1
+                return cached
+        self.metrics["misses"] += 1
+        before = snapshot(self.root)
+        result = execute()
+        after = snapshot(self.root) if before is not None else None
+        if after is not None and result.get("exit_reason") in ("completed", "error"):
+            try:
+                self.put(key, result, fingerprints, changed_files(before, after))
+            except (OSError, TypeError, ValueError):
+                logging.exception("Could not store %s result in the execution cache", tool)
+        return result
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_exec_cache():
+    """The execution cache of the current run, or None when AGENT_EXEC_CACHE is not 1."""
+    work_dir = get_run_context()["work_dir"]
+    if not exec_cache_enabled() or not work_dir:
+        return None
+    directory = os.path.realpath(os.path.join(work_dir, ".exec_cache"))
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = ExecCache(directory)
+        return cache
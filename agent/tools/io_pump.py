@@ -0,0 +1,250 @@
+import os
+import re
+import sys
+import time
+import codecs
+import selectors
+
+from agent.tools.output_capture import OutputCapture
+
+
+ANSI_ESCAPE = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
+# Longest escape sequence we wait for across a chunk boundary.
+MAX_ESCAPE_LENGTH = 32
+
+
+class TerminalCleaner:
+    """Incremental ANSI-escape and carriage-return stripper.
+
+    Bytes go in, clean text comes out, one complete line at a time. Escape
+    sequences are removed, and a line redrawn with "\\r" (tqdm, keras,
+    pip) keeps only its last non-blank state, so a progress bar that redraws
+    itself ten thousand times produces a single line. Multi-byte characters
+    and escape sequences split across chunks are handled. A line longer than
+    `max_line` characters without a newline is emitted as is to bound memory.
+    """
+
+    def __init__(self, max_line=65536):
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.max_line = max_line
+        self.pending = ""
+        self.line = ""
+
+    def feed(self, data, final=False):
+        text = self.pending + self.decoder.decode(data, final)
+        self.pending = ""
+        if not final:
+            escape = text.rfind("\x1b", max(0, len(text) - MAX_ESCAPE_LENGTH))
+            if escape != -1 and not ANSI_ESCAPE.match(text, escape):
+                self.pending = text[escape:]
+                text = text[:escape]
+            if text.endswith("\r"):
+                # Could be the first half of "\r\n".
+                self.pending = "\r" + self.pending
+                text = text[:-1]
+        text = ANSI_ESCAPE.sub("", text).replace("\r\n", "\n")
+
+        out = []
+        parts = text.split("\n")
+        for idx, part in enumerate(parts):
+            if "\r" in part:
+                segments = [segment for segment in (self.line + part).split("\r") if segment.strip()]
+                self.line = segments[-1] if segments else ""
+            else:
+                self.line += part
+            if idx < len(parts) - 1:
+                out.append(self.line + "\n")
+                self.line = ""
+            elif len(self.line) > self.max_line:
+                out.append(self.line)
+                self.line = ""
+        if final and self.line:
+            out.append(self.line)
+            self.line = ""
+        return "".join(out)
+
+
+class RateLimitedEcho:
+    """Mirrors tool output to the console, at most `max_lines` lines per second.
+
+    Lines over the budget are counted and summarized once the next second
+    starts, so a chatty process cannot flood (and slow down) the terminal.
+    """
+
+    def __init__(self, stream=None, max_lines=None):
+        self.stream = stream or sys.stdout
+        self.max_lines = max_lines or int(os.getenv("AGENT_ECHO_LINES_PER_SECOND", "50"))
+        self.window = int(time.monotonic())
+        self.lines = 0
+        self.suppressed = 0
+
+    def write(self, text):
+        if not text:
+            return
+        window = int(time.monotonic())
+        if window != self.window:
+            self.flush()
+            self.window = window
+            self.lines = 0
+        count = text.count("\n") or 1
+        if self.lines + count <= self.max_lines:
+            self.stream.write(text)
+        else:
+            room = max(self.max_lines - self.lines, 0)
+            if room:
+                shown = "".join(text.splitlines(keepends=True)[:room])
+                self.stream.write(shown)
+            self.suppressed += count - room
+        self.lines += count
+
+    def flush(self):
+        if self.suppressed:
+            self.stream.write(f"[... {self.suppressed} lines not echoed ...]\n")
+            self.suppressed = 0
+        self.stream.flush()
+
+
+class PumpStream:
+    """One output stream: raw bytes -> TerminalCleaner -> capture (+ console echo)."""
+
+    def __init__(self, capture, echo_stream=None, echo=True):
+        self.capture = capture
+        self.cleaner = TerminalCleaner()
+        self.echo = RateLimitedEcho(echo_stream) if echo else None
+
+    def feed(self, data, final=False):
+        text = self.cleaner.feed(data, final)
+        if text:
+            self.capture.write(text.encode())
+            if self.echo is not None:
+                self.echo.write(text)
+        if final and self.echo is not None:
+            self.echo.flush()
+
+
+class OutputPump:
+    """Reads several pipes on the calling thread with a selector.
+
+    `on_chunk(name, data)` is called for every non-blocking read of up to
+    `chunk_size` bytes and returns True once that stream needs no more
+    reading; `on_chunk(name, b"")` signals end of file. `run` returns
+    "done" when every stream has finished, "timeout" when `deadline`
+    (a time.monotonic() value) passes, or "idle" when no output arrived for
+    `idle_timeout` seconds. After a timeout, `run` can be called again and
+    continues with the streams that have not finished.
+    """
+
+    def __init__(self, fds, on_chunk, chunk_size=65536):
+        self.fds = {fd: name for name, fd in fds.items()}
+        self.on_chunk = on_chunk
+        self.chunk_size = chunk_size
+        self.eof = set()
+        self.finished = set()
+        self.last_output = time.monotonic()
+
+    def run(self, deadline=None, idle_timeout=None):
+        selector = selectors.DefaultSelector()
+        open_fds = set(self.fds) - self.finished
+        for fd in open_fds:
+            os.set_blocking(fd, False)
+            selector.register(fd, selectors.EVENT_READ)
+        try:
+            while open_fds:
+                now = time.monotonic()
+                waits = []
+                if deadline is not None:
+                    if now >= deadline:
+                        return "timeout"
+                    waits.append(deadline - now)
+                if idle_timeout is not None:
+                    if now - self.last_output >= idle_timeout:
+                        return "idle"
+                    waits.append(self.last_output + idle_timeout - now)
+                for key, _ in selector.select(min(waits) if waits else None):
+                    name = self.fds[key.fd]
+                    try:
+                        data = os.read(key.fd, self.chunk_size)
+                    except BlockingIOError:
+                        continue
+                    if data:
+                        self.last_output = time.monotonic()
+                    else:
+                        self.eof.add(name)
+                    if self.on_chunk(name, data) or not data:
+                        selector.unregister(key.fd)
+                        open_fds.discard(key.fd)
+                        self.finished.add(key.fd)
+            return "done"
+        finally:
+            selector.close()
+
+
+class SentinelReader:
+    """Output of one command run by a long-lived process (shell, kernel).
+
+    The process ends the command with "<marker> <payload>\\n" on stdout and
+    "<marker>\\n" on stderr. Everything before the sentinels goes through
+    PumpStream into a bounded OutputCapture per stream; the bytes from the
+    marker on are held back so the sentinel never reaches the capture. `run`
+    can be called again after a timeout (e.g. once the process has been
+    interrupted), and `finish` returns the payload, or None if the sentinel
+    never arrived.
+    """
+
+    def __init__(self, process, marker, tool, echo=True):
+        self.marker = marker.encode()
+        self.captures = {name: OutputCapture(tool, name) for name in ("stdout", "stderr")}
+        self.streams = {
+            "stdout": PumpStream(self.captures["stdout"], sys.stdout, echo),
+            "stderr": PumpStream(self.captures["stderr"], sys.stderr, echo),
+        }
+        self.ends = {
+            "stdout": re.compile(re.escape(self.marker) + rb" [^\n]*\n"),
+            "stderr": re.compile(re.escape(self.marker) + rb"\n"),
+        }
+        self.pending = {name: bytearray() for name in self.streams}
+        self.pump = OutputPump(
+            {"stdout": process.stdout.fileno(), "stderr": process.stderr.fileno()},
+            self._on_chunk,
+        )
+
+    def _on_chunk(self, name, data):
+        pending = self.pending[name]
+        pending += data
+        if self.ends[name].search(pending):
+            return True
+        start = pending.find(self.marker)
+        # Hold back anything that could be the start of the marker.
+        safe = start - 1 if start > 0 else len(pending) - len(self.marker) if start == -1 else 0
+        if safe > 0:
+            self.streams[name].feed(bytes(pending[:safe]))
+            del pending[:safe]
+        return False
+
+    @property
+    def eof(self):
+        return bool(self.pump.eof)
+
+    def run(self, deadline=None, idle_timeout=None):
+        return self.pump.run(deadline, idle_timeout)
+
+    def finish(self):
+        marker = re.escape(self.marker)
+        payload = None
+        stdout = bytes(self.pending["stdout"])
+        match = re.search(rb"\n?" + marker + rb" ([^\n]*)\n?$", stdout)
+        if match:
+            payload = match.group(1).decode()
+            stdout = stdout[: match.start()]
+        stderr = re.sub(rb"\n?" + marker + rb"\n?$", b"", bytes(self.pending["stderr"]))
+        self.streams["stdout"].feed(stdout, final=True)
+        self.streams["stderr"].feed(stderr, final=True)
+        for capture in self.captures.values():
+            capture.close()
+        return payload
+
+    def text(self, name):
+        return self.captures[name].text()
+
+    def stats(self):
+        return {name: capture.stats() for name, capture in self.captures.items()}
@@ -0,0 +1,314 @@
+import os
+import time
+import shutil
+import atexit
+import signal
+import tempfile
+import itertools
+import threading
+import subprocess
+import collections
+
+from agent.tools.context import get_run_context, track_process_group, untrack_process_group
+from agent.tools.io_pump import TerminalCleaner
+from agent.tools.output_capture import format_size
+from agent.tools.limits import ToolLimits, classify_exit, kill_process_group
+from agent.tools.accounting import ResourceMonitor, wait_with_rusage
+from agent.tools.bash.shell_session import get_shell_session
+
+
+# Bytes read from the end of a job's log to find its last lines.
+TAIL_BYTES = 64 * 1024
+MAX_LINE = 300
+
+
+def format_duration(seconds):
+    if seconds < 120:
+        return f"{seconds:.0f} s"
+    if seconds < 7200:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+class Job:
+    """A command running in the background, with stdout and stderr going to a log file.
+
+    The job runs in its own session under the tool limits (cpu, memory), but
+    with its own wall-clock limit and no idle timeout, since training jobs
+    can be quiet for a long time. A thread reaps it and records its
+    resources (see agent.tools.accounting) as soon as it exits.
+    """
+
+    def __init__(self, job_id, command, cwd, log_path, limits=None, env=None):
+        self.job_id = job_id
+        self.command = command
+        self.cwd = cwd
+        self.env = env
+        self.log_path = log_path
+        self.limits = limits or ToolLimits.from_env()
+        self.process = None
+        self.cgroup = None
+        self.started_at = None
+        self.finished_at = None
+        self.returncode = None
+        self.exit_reason = None
+        self.resources = None
+        self.cancelled = False
+        self.timed_out = False
+        # Set once the model has been told the job ended, see JobManager.collect_finished.
+        self.reported = False
+        self.done = threading.Event()
+        self.timer = None
+
+    def start(self):
+        self.cgroup = self.limits.cgroup()
+        # PYTHONUNBUFFERED so the log keeps up with the job.
+        env = dict(os.environ if self.env is None else self.env, PYTHONUNBUFFERED="1")
+        with open(self.log_path, "ab") as log, open(os.devnull, "rb") as devnull:
+            self.process = subprocess.Popen(
+                [shutil.which("bash") or "/bin/sh", "-c", self.command],
+                stdin=devnull,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                cwd=self.cwd,
+                env=env,
+                start_new_session=True,
+                preexec_fn=self.limits.preexec(self.cgroup),
+            )
+        track_process_group(self.process.pid)
+        self.started_at = time.time()
+        monitor = ResourceMonitor().start(self.process.pid)
+        if self.limits.wall_timeout:
+            self.timer = threading.Timer(self.limits.wall_timeout, self._timeout)
+            self.timer.daemon = True
+            self.timer.start()
+        threading.Thread(target=self._wait, args=(monitor,), daemon=True).start()
+        return self
+
+    def _timeout(self):
+        self.timed_out = True
+        kill_process_group(self.process.pid)
+
+    def _wait(self, monitor):
+        returncode, user, system, max_rss = wait_with_rusage(self.process)
+        if self.timer is not None:
+            self.timer.cancel()
+        # Background children of the command would keep writing to the log.
+        # killpg only: the job's pid itself is reaped and may be reused.
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        untrack_process_group(self.process.pid)
+        oom_killed = self.cgroup is not None and self.cgroup.oom_kills() > 0
+        if self.cgroup is not None:
+            self.cgroup.remove()
+        if self.cancelled:
+            exit_reason = "cancelled"
+        elif self.timed_out:
+            exit_reason = "wall_timeout"
+        else:
+            exit_reason = classify_exit(returncode, self.tail(20), self.limits, oom_killed)
+        self.returncode = returncode
+        self.exit_reason = exit_reason
+        self.resources = monitor.usage(
+            user, system, max_rss, {"log": {"bytes": self.log_size()}}, exit_reason
+        )
+        self.finished_at = time.time()
+        self.done.set()
+
+    @property
+    def state(self):
+        """running, completed, failed, cancelled or timed_out."""
+        if not self.done.is_set():
+            return "running"
+        if self.exit_reason == "cancelled":
+            return "cancelled"
+        if self.exit_reason == "wall_timeout":
+            return "timed_out"
+        return "completed" if self.returncode == 0 else "failed"
+
+    @property
+    def runtime(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    def log_size(self):
+        try:
+            return os.path.getsize(self.log_path)
+        except OSError:
+            return 0
+
+    def tail(self, lines=20):
+        """The last `lines` lines of the log, without ANSI codes and progress-bar redraws."""
+        try:
+            with open(self.log_path, "rb") as log:
+                log.seek(max(0, self.log_size() - TAIL_BYTES))
+                data = log.read()
+        except OSError:
+            return ""
+        text = TerminalCleaner().feed(data, final=True)
+        tail = text.splitlines()[-lines:] if lines > 0 else []
+        return "\n".join(line if len(line) <= MAX_LINE else line[:MAX_LINE] + " ..." for line in tail)
+
+    def cancel(self, grace=10):
+        """SIGTERM the job's process group, SIGKILL it if it is still running after `grace` seconds."""
+        if self.done.is_set():
+            return False
+        self.cancelled = True
+        kill_process_group(self.process.pid, signal.SIGTERM)
+        if not self.done.wait(grace):
+            kill_process_group(self.process.pid)
+            self.done.wait(5)
+        return True
+
+    def describe(self):
+        """One line: id, state, runtime and command."""
+        state = self.state
+        if state == "running":
+            status = f"running for {format_duration(self.runtime)}, log {format_size(self.log_size())}"
+        elif state == "timed_out":
+            status = f"killed after the {self.limits.wall_timeout:g} s job time limit"
+        else:
+            status = f"{state} after {format_duration(self.runtime)}"
+            if state != "cancelled":
+                status += f", exit code {self.returncode}"
+            reason = self.limits.describe(self.exit_reason)
+            if reason:
+                status += f", {reason}"
+        return f"{self.job_id} ({status}): {self.command}"
+
+
+class JobManager:
+    """Background jobs of one run.
+
+    At most `max_jobs` (AGENT_MAX_JOBS, default 4) run at once. Logs are
+    written to `.jobs` in the run's working directory; a job's wall-clock
+    limit defaults to AGENT_JOB_TIMEOUT seconds (default 86400, 0 for none).
+    """
+
+    def __init__(self, log_dir=None, max_jobs=None):
+        work_dir = get_run_context()["work_dir"] or os.path.join(tempfile.gettempdir(), "agent_jobs")
+        self.log_dir = log_dir or os.path.join(work_dir, ".jobs")
+        self.max_jobs = max_jobs or int(os.getenv("AGENT_MAX_JOBS", "4"))
+        self.jobs = collections.OrderedDict()
+        self.numbers = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @property
+    def metrics(self):
+        with self.lock:
+            states = [job.state for job in self.jobs.values()]
+        return {"started": len(states), **{state: states.count(state) for state in sorted(set(states))}}
+
+    def running(self):
+        with self.lock:
+            return [job for job in self.jobs.values() if job.state == "running"]
+
+    def start(self, command, cwd=None, timeout=None, env=None):
+        """Start `command` in the background and return its Job.
+
+        `cwd` and `env` default to the working directory and the exported
+        variables (activated environments included) of the run's shell session.
+        Raises RuntimeError when `max_jobs` jobs are already running.
+        """
+        running = self.running()
+        if len(running) >= self.max_jobs:
+            raise RuntimeError(
+                f"{len(running)} jobs are already running (limit {self.max_jobs}): "
+                + ", ".join(job.job_id for job in running)
+                + ". Wait for one to finish or cancel it with cancel_job."
+            )
+        os.makedirs(self.log_dir, exist_ok=True)
+        limits = ToolLimits.from_env()
+        limits.wall_timeout = timeout if timeout is not None else float(os.getenv("AGENT_JOB_TIMEOUT", "86400"))
+        limits.wall_timeout = limits.wall_timeout or None
+        limits.idle_timeout = None
+        with self.lock:
+            job_id = f"job-{next(self.numbers)}"
+        session = get_shell_session()
+        job = Job(
+            job_id,
+            command,
+            cwd or session.current_dir,
+            os.path.join(self.log_dir, f"{job_id}.log"),
+            limits,
+            session.environment() if env is None else env,
+        )
+        job.start()
+        with self.lock:
+            self.jobs[job_id] = job
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(str(job_id).strip())
+        if job is None:
+            known = ", ".join(self.jobs) or "none"
+            raise ValueError(f"No job {job_id!r} (jobs: {known})")
+        return job
+
+    def collect_finished(self):
+        """Jobs that ended since the last call, each returned once."""
+        with self.lock:
+            finished = [job for job in self.jobs.values() if job.done.is_set() and not job.reported]
+            for job in finished:
+                job.reported = True
+        return finished
+
+    def render(self, tail_lines=5, max_finished=5):
+        """Status of the run's jobs for the worker prompt: running jobs with their last lines."""
+        with self.lock:
+            jobs = list(self.jobs.values())
+        if not jobs:
+            return ""
+        running = [job for job in jobs if job.state == "running"]
+        finished = [job for job in jobs if job.state != "running"][-max_finished:]
+        sections = []
+        for job in running:
+            section = job.describe()
+            tail = job.tail(tail_lines)
+            if tail:
+                section += "\n" + "\n".join(f"    | {line}" for line in tail.splitlines())
+            sections.append(section)
+        sections.extend(job.describe() for job in finished)
+        return "\n".join(sections)
+
+    def close(self):
+        for job in self.running():
+            job.cancel(grace=2)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_job_manager(run_id=None):
+    """The job manager of a run (default: the run this process is working on)."""
+    if run_id is None:
+        run_id = get_run_context()["run_id"]
+    with _managers_lock:
+        manager = _managers.get(run_id)
+        if manager is None:
+            manager = _managers[run_id] = JobManager()
+        return manager
+
+
+def job_metrics():
+    with _managers_lock:
+        return {run_id: manager.metrics for run_id, manager in _managers.items()}
+
+
+def close_job_manager(run_id):
+    """Cancel the jobs still running for a run that has finished."""
+    with _managers_lock:
+        manager = _managers.pop(run_id, None)
+    if manager is not None:
+        manager.close()
+
+
+@atexit.register
+def close_job_managers():
+    with _managers_lock:
+        for manager in _managers.values():
+            manager.close()
+        _managers.clear()
@@ -0,0 +1,176 @@
+from agent.tools.jobs.job_manager import get_job_manager
+
+jobs_tool_definitions = [
+    {
+        "name": "start_job",
+        "description": (
+            "Start a long-running bash command (e.g. a training run) in the background and return "
+            "immediately with a job id, so you can keep working while it runs. Output goes to a "
+            "log file. The status and last lines of running jobs are shown to you every turn. The "
+            "command runs in the run_bash shell's current directory with the variables exported there."
+        ),
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "command": {
+                    "type": "string",
+                    "description": "The bash command to run, e.g. 'python train.py --epochs 20'.",
+                },
+                "timeout": {
+                    "type": "number",
+                    "description": "Seconds after which the job is killed (default: AGENT_JOB_TIMEOUT, one day).",
+                },
+            },
+            "required": ["command"],
+        },
+    },
+    {
+        "name": "job_status",
+        "description": "Show the status of a background job, or of all jobs of this run when no job_id is given.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "The job id returned by start_job, e.g. 'job-1'.",
+                },
+            },
+            "required": [],
+        },
+    },
+    {
+        "name": "job_tail",
+        "description": "Show the last lines of a background job's output.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "The job id returned by start_job, e.g. 'job-1'.",
+                },
+                "lines": {
+                    "type": "integer",
+                    "description": "Number of lines to show (default 50, at most 500).",
+                },
+            },
+            "required": ["job_id"],
+        },
+    },
+    {
+        "name": "cancel_job",
+        "description": "Stop a background job and everything it started.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "The job id returned by start_job, e.g. 'job-1'.",
+                },
+            },
+            "required": ["job_id"],
+        },
+    },
+]
+
+
+def _result(tool, attempt):
+    return {
+        "tool": tool,
+        "status": "failure",
+        "attempt": attempt,
+        "stdout": "",
+        "stderr": "",
+    }
+
+
+def job_result(job):
+    """A finished job as a tool result, for the memory table (with its resources)."""
+    result = _result("background_job", job.command)
+    result["status"] = "success" if job.state == "completed" else "failure"
+    result["stdout"] = job.tail(20)
+    result["stderr"] = job.describe()
+    result["resources"] = job.resources
+    return result
+
+
+def start_job(arguments):
+    """
+    This function is used to start a long-running command in the background.
+    Use this function for training runs, so you can keep working while they run.
+    """
+    if isinstance(arguments, dict):
+        command, timeout = arguments.get("command", ""), arguments.get("timeout")
+    else:
+        command, timeout = arguments, None
+    result = _result("start_job", command)
+    try:
+        if not command.strip():
+            raise ValueError("No command given")
+        job = get_job_manager().start(command, timeout=timeout)
+        result["status"] = "success"
+        result["job_id"] = job.job_id
+        result["log_path"] = job.log_path
+        result["stdout"] = (
+            f"Started {job.job_id} (pid {job.process.pid}) in {job.cwd}. Its output goes to "
+            f"{job.log_path}. Check on it with job_status or job_tail, stop it with cancel_job."
+        )
+    except Exception as e:
+        result["stderr"] = str(e)
+    return result
+
+
+def job_status(arguments):
+    """
+    This function is used to check on background jobs.
+    """
+    job_id = arguments.get("job_id") if isinstance(arguments, dict) else arguments
+    result = _result("job_status", job_id or "all jobs")
+    try:
+        manager = get_job_manager()
+        if job_id:
+            job = manager.get(job_id)
+            result["job_state"] = job.state
+            result["stdout"] = job.describe() + "\n" + job.tail(5)
+        else:
+            result["stdout"] = manager.render() or "No background jobs."
+        result["status"] = "success"
+    except Exception as e:
+        result["stderr"] = str(e)
+    return result
+
+
+def job_tail(arguments):
+    """
+    This function is used to read the latest output of a background job.
+    """
+    if isinstance(arguments, dict):
+        job_id, lines = arguments.get("job_id"), arguments.get("lines") or 50
+    else:
+        job_id, lines = arguments, 50
+    result = _result("job_tail", job_id)
+    try:
+        job = get_job_manager().get(job_id)
+        result["job_state"] = job.state
+        result["stdout"] = job.tail(max(1, min(int(lines), 500)))
+        result["status"] = "success"
+    except Exception as e:
+        result["stderr"] = str(e)
+    return result
+
+
+def cancel_job(arguments):
+    """
+    This function is used to stop a background job.
+    """
+    job_id = arguments.get("job_id") if isinstance(arguments, dict) else arguments
+    result = _result("cancel_job", job_id)
+    try:
+        job = get_job_manager().get(job_id)
+        if job.cancel():
+            result["stdout"] = f"Cancelled {job.describe()}"
+        else:
+            result["stdout"] = f"The job had already ended: {job.describe()}"
+        result["status"] = "success"
+    except Exception as e:
+        result["stderr"] = str(e)
+    return result
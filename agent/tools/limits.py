@@ -0,0 +1,180 @@
+import os
+import signal
+import logging
+import resource
+import itertools
+
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+_cgroup_numbers = itertools.count(1)
+
+
+def _env_number(name, default=None):
+    value = os.getenv(name)
+    if value in (None, "", "0", "none"):
+        return default if value is None else None
+    return float(value)
+
+
+class CgroupLimit:
+    """A cgroup v2 child group with memory.max (and optionally cpu.max) set.
+
+    Only usable when the process's own cgroup delegates the memory
+    controller to its children; `create` returns None otherwise and callers
+    fall back to rlimits. The tool process joins the group from its
+    preexec hook, so there is no window where it runs unlimited.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def create(cls, memory_mb=None, cpus=None, root=CGROUP_ROOT, proc_cgroup="/proc/self/cgroup"):
+        try:
+            with open(proc_cgroup) as file:
+                relative = next(line.split("::", 1)[1].strip() for line in file if line.startswith("0::"))
+            parent = os.path.join(root, relative.lstrip("/"))
+            with open(os.path.join(parent, "cgroup.subtree_control")) as file:
+                controllers = file.read().split()
+            if memory_mb and "memory" not in controllers:
+                return None
+            path = os.path.join(parent, f"agent-tool-{os.getpid()}-{next(_cgroup_numbers)}")
+            os.makedirs(path)
+            if memory_mb:
+                with open(os.path.join(path, "memory.max"), "w") as file:
+                    file.write(str(int(memory_mb * 1024 * 1024)))
+            if cpus and "cpu" in controllers:
+                with open(os.path.join(path, "cpu.max"), "w") as file:
+                    file.write(f"{int(cpus * 100000)} 100000")
+            return cls(path)
+        except (OSError, StopIteration):
+            return None
+
+    def join(self):
+        # Runs in the child between fork and exec: "0" means "this process".
+        with open(os.path.join(self.path, "cgroup.procs"), "w") as file:
+            file.write("0")
+
+    def oom_kills(self):
+        try:
+            with open(os.path.join(self.path, "memory.events")) as file:
+                for line in file:
+                    key, value = line.split()
+                    if key == "oom_kill":
+                        return int(value)
+        except OSError:
+            pass
+        return 0
+
+    def remove(self):
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            logging.debug("Could not remove cgroup %s", self.path)
+
+
+class ToolLimits:
+    """Time and resource limits for processes started by run_bash and run_python.
+
+    Defaults come from the environment:
+      AGENT_TOOL_TIMEOUT        wall-clock seconds per command (default 7200)
+      AGENT_TOOL_IDLE_TIMEOUT   seconds without any output (default 1800)
+      AGENT_TOOL_CPU_SECONDS    CPU seconds per process (RLIMIT_CPU, default unlimited)
+      AGENT_TOOL_MEMORY_MB      memory per tool (cgroup v2 memory.max when
+                                available, else RLIMIT_AS; default unlimited)
+      AGENT_TOOL_CPUS           CPU cores (cgroup v2 cpu.max only)
+    Set a variable to 0 to disable that limit.
+    """
+
+    def __init__(self, wall_timeout=None, idle_timeout=None, cpu_seconds=None, memory_mb=None, cpus=None):
+        self.wall_timeout = wall_timeout
+        self.idle_timeout = idle_timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.cpus = cpus
+
+    @classmethod
+    def from_env(cls, **overrides):
+        limits = cls(
+            wall_timeout=_env_number("AGENT_TOOL_TIMEOUT", 7200),
+            idle_timeout=_env_number("AGENT_TOOL_IDLE_TIMEOUT", 1800),
+            cpu_seconds=_env_number("AGENT_TOOL_CPU_SECONDS"),
+            memory_mb=_env_number("AGENT_TOOL_MEMORY_MB"),
+            cpus=_env_number("AGENT_TOOL_CPUS"),
+        )
+        for key, value in overrides.items():
+            if value is not None:
+                setattr(limits, key, value)
+        return limits
+
+    def cgroup(self):
+        if not (self.memory_mb or self.cpus):
+            return None
+        return CgroupLimit.create(self.memory_mb, self.cpus)
+
+    def preexec(self, cgroup=None):
+        """Function for Popen(preexec_fn=...) that applies the limits in the child.
+
+        Returns None when there is nothing to apply, so unlimited tools keep
+        the faster fork path without a preexec hook.
+        """
+        if cgroup is None and not self.cpu_seconds and not self.memory_mb:
+            return None
+        return lambda: self.apply(cgroup)
+
+    def apply(self, cgroup=None):
+        """Apply the limits to the current process (a freshly forked child)."""
+        if cgroup is not None:
+            cgroup.join()
+        if self.cpu_seconds:
+            # SIGXCPU at the soft limit, SIGKILL a few seconds later.
+            resource.setrlimit(resource.RLIMIT_CPU, (int(self.cpu_seconds), int(self.cpu_seconds) + 5))
+        if self.memory_mb and cgroup is None:
+            memory_bytes = int(self.memory_mb * 1024 * 1024)
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+    def describe(self, exit_reason):
+        messages = {
+            "wall_timeout": "was killed after the {wall_timeout:g} s wall-clock limit (AGENT_TOOL_TIMEOUT)",
+            "idle_timeout": "was killed after {idle_timeout:g} s without output (AGENT_TOOL_IDLE_TIMEOUT)",
+            "cpu_limit": "was killed at the {cpu_seconds:g} s CPU limit (AGENT_TOOL_CPU_SECONDS)",
+            "memory_limit": "ran out of memory at the {memory_mb:g} MB limit (AGENT_TOOL_MEMORY_MB)",
+        }
+        if exit_reason not in messages:
+            return None
+        return messages[exit_reason].format(
+            **{key: value or 0 for key, value in vars(self).items()}
+        )
+
+
+def kill_process_group(pid, sig=signal.SIGKILL):
+    """Kill a tool process started with start_new_session=True and all its children."""
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+def classify_exit(returncode, stderr="", limits=None, oom_killed=False):
+    """Why a tool process ended: completed, error, cpu_limit, memory_limit or signal.
+
+    Shell exit codes above 128 mean the command died from signal code - 128.
+    """
+    if oom_killed:
+        return "memory_limit"
+    if returncode is None:
+        return "error"
+    signum = -returncode if returncode < 0 else returncode - 128 if returncode > 128 else None
+    if signum == signal.SIGXCPU:
+        return "cpu_limit"
+    if limits is not None and limits.memory_mb and any(
+        message in stderr for message in ("MemoryError", "std::bad_alloc", "Cannot allocate memory")
+    ):
+        return "memory_limit"
+    if signum is not None:
+        return "signal"
+    return "completed" if returncode == 0 else "error"
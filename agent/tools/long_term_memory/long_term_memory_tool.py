@@ -3,7 +3,7 @@ from agent.memory import AgentMemory
 long_term_memory_tool_definitions = [
     {
         "name": "long_term_memory",
-        "description": "Access the agent's long-term memory.",
+        "description": "Search the agent's long-term memory: earlier steps of a run (tool, attempt, output, errors) ranked by similarity to the query.",
         "input_schema": {
             "type": "object",
             "properties": {
@@ -22,9 +22,20 @@ long_term_memory_tool_definitions = [
 ]
 
 
+_memory = None
+
+
+def get_memory():
+    # One AgentMemory per process, so the vector index is loaded only once.
+    global _memory
+    if _memory is None:
+        _memory = AgentMemory()
+    return _memory
+
+
 class LongTermMemory:
     def __init__(self):
-        self.memory = AgentMemory()
+        self.memory = get_memory()
 
     def access_memory(self, query, run_id):
         try:
@@ -0,0 +1,111 @@
+import os
+import time
+import tempfile
+import itertools
+import threading
+
+from agent.tools.context import get_run_context
+
+
+DEFAULT_HEAD_BYTES = 16 * 1024
+DEFAULT_TAIL_BYTES = 48 * 1024
+
+_call_numbers = itertools.count(1)
+_call_numbers_lock = threading.Lock()
+
+
+def tool_log_path(tool, stream):
+    """Path of the log file for one stream of one tool call.
+
+    Logs go to `.tool_logs` in the run's working directory, or to the system
+    temp directory when no run is active.
+    """
+    work_dir = get_run_context()["work_dir"] or os.path.join(tempfile.gettempdir(), "agent_tool_logs")
+    log_dir = os.path.join(work_dir, ".tool_logs")
+    os.makedirs(log_dir, exist_ok=True)
+    with _call_numbers_lock:
+        number = next(_call_numbers)
+    return os.path.join(log_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{number:04d}_{tool}_{stream}.log")
+
+
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+
+class OutputCapture:
+    """Bounded capture of one output stream.
+
+    Memory holds the first `head_bytes`, the last `tail_bytes` and counters,
+    however much the process prints. Once the stream outgrows head + tail,
+    everything (from the first byte) is spilled to a log file from
+    `tool_log_path`, and `text()` marks the omitted middle with that path.
+    Small outputs never touch the disk.
+    """
+
+    def __init__(self, tool, stream, head_bytes=None, tail_bytes=None):
+        self.tool = tool
+        self.stream = stream
+        self.head_bytes = head_bytes or int(os.getenv("AGENT_OUTPUT_HEAD_BYTES", DEFAULT_HEAD_BYTES))
+        self.tail_bytes = tail_bytes or int(os.getenv("AGENT_OUTPUT_TAIL_BYTES", DEFAULT_TAIL_BYTES))
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.total_lines = 0
+        self.log_path = None
+        self.log_file = None
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        self.total_bytes += len(chunk)
+        self.total_lines += chunk.count(b"\n")
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        self.tail += chunk
+        if self.log_file is not None:
+            self.log_file.write(chunk)
+        elif self.total_bytes > self.head_bytes + self.tail_bytes:
+            # Nothing has been dropped yet, so head + tail is the whole stream.
+            self.log_path = tool_log_path(self.tool, self.stream)
+            self.log_file = open(self.log_path, "wb")
+            self.log_file.write(self.head)
+            self.log_file.write(self.tail)
+        if len(self.tail) > 2 * self.tail_bytes:
+            del self.tail[: -self.tail_bytes]
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+    @property
+    def omitted_bytes(self):
+        return self.total_bytes - len(self.head) - min(len(self.tail), self.tail_bytes)
+
+    @property
+    def truncated(self):
+        return self.omitted_bytes > 0
+
+    def text(self):
+        head = self.head.decode(errors="replace")
+        if not self.truncated:
+            return head + self.tail.decode(errors="replace")
+        tail = bytes(self.tail[-self.tail_bytes :]).decode(errors="replace")
+        return (
+            f"{head}\n... [{format_size(self.omitted_bytes)} of {self.stream} omitted "
+            f"({format_size(self.total_bytes)}, {self.total_lines} lines in total); "
+            f"full output: {self.log_path}] ...\n{tail}"
+        )
+
+    def stats(self):
+        return {
+            "bytes": self.total_bytes,
+            "lines": self.total_lines,
+            "truncated": self.truncated,
+            "log_path": self.log_path,
+        }
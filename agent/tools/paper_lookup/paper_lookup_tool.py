@@ -4,7 +4,7 @@ from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
 from dotenv import load_dotenv
 from agent.utils import structure_paper_output
-from sentence_transformers import SentenceTransformer
+from agent.embeddings import get_encoder
 from numpy import np
 
 paper_lookup_tool_definitions = [
@@ -29,7 +29,7 @@ class RedisPaperLookUp:
     def __init__(self):
         self.cache = {}
         self.index_name = "papers"
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.model = get_encoder()
         self.redis_db = redis.Redis(
             username="default",
             password="YVm2qhsQOlbP23Nt64lSSFi1CR5TfoG0",
@@ -1,13 +1,24 @@
 import sys
 import os
 import io
+import time
 import subprocess
-from agent.utils import remove_ascii
+from agent.tools.output_capture import OutputCapture
+from agent.tools.io_pump import OutputPump, PumpStream
+from agent.tools.limits import ToolLimits, classify_exit, kill_process_group
+from agent.tools.python.warm_pool import get_warm_pool
+from agent.tools.exec_cache import declared_inputs, get_exec_cache, python_inputs
+from agent.tools.accounting import ResourceMonitor, wait_with_rusage
+from agent.tools.context import track_process_group, untrack_process_group
+from agent.tools.bash.shell_session import get_shell_session
 
 python_tool_definitions = [
     {
         "name": "run_python",
-        "description": "Run python code on the server. You must print the output",
+        "description": (
+            "Run python code on the server. You must print the output. The script runs in the "
+            "run_bash shell's current directory with the variables exported there."
+        ),
         "input_schema": {
             "type": "object",
             "properties": {
@@ -15,6 +26,15 @@ python_tool_definitions = [
                     "type": "string",
                     "description": "The path to a python file.",
                 },
+                "inputs": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Files or directories the script reads that it does not name literally (execution cache only).",
+                },
+                "no_cache": {
+                    "type": "boolean",
+                    "description": "Run even if an identical earlier run is cached (execution cache only).",
+                },
             },
             "required": ["filepath"],
         },
@@ -23,10 +43,10 @@ python_tool_definitions = [
 
 
 class PythonRunnerActor:
-    def __init__(self):
-        pass  # No longer need the IPython shell instance
+    def __init__(self, limits=None):
+        self.limits = limits or ToolLimits.from_env()
 
-    def execute_python_code(self, filepath, timeout=None):
+    def execute_python_code(self, filepath, timeout=None, cwd=None, env=None):
         result = {
             "tool": "run_python",
             "status": "failure",
@@ -35,49 +55,87 @@ class PythonRunnerActor:
             "stderr": "",
         }
         try:
-            if os.path.isfile(filepath):
-                # Use subprocess to run the script with unbuffered output
-                process = subprocess.Popen(
-                    [sys.executable, '-u', filepath],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                    bufsize=1,
+            if os.path.isfile(os.path.join(cwd or os.getcwd(), filepath)):
+                timeout = self.limits.wall_timeout if timeout is None else timeout
+                cgroup = self.limits.cgroup()
+                # Use subprocess to run the script with unbuffered output, in
+                # its own process group so a timeout also kills its children.
+                pool = get_warm_pool()
+                # Forked from an interpreter with the heavy imports done, if possible.
+                process = pool.spawn(filepath, self.limits, cgroup, cwd, env) if pool is not None else None
+                if process is None:
+                    process = subprocess.Popen(
+                        [sys.executable, '-u', filepath],
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        bufsize=0,
+                        cwd=cwd,
+                        env=env,
+                        start_new_session=True,
+                        preexec_fn=self.limits.preexec(cgroup),
+                    )
+                track_process_group(process.pid)
+                # Samples the RSS of the script and everything it starts.
+                monitor = ResourceMonitor().start(process.pid)
+
+                # Bounded in memory; long output is spilled to the run directory.
+                stdout_capture = OutputCapture("run_python", "stdout")
+                stderr_capture = OutputCapture("run_python", "stderr")
+                streams = {
+                    "stdout": PumpStream(stdout_capture, sys.stdout),
+                    "stderr": PumpStream(stderr_capture, sys.stderr),
+                }
+
+                def on_chunk(name, data):
+                    streams[name].feed(data, final=not data)
+
+                # Both pipes are read on this thread until the script closes them.
+                pump = OutputPump(
+                    {"stdout": process.stdout.fileno(), "stderr": process.stderr.fileno()},
+                    on_chunk,
+                )
+                pump_status = pump.run(
+                    time.monotonic() + timeout if timeout else None, self.limits.idle_timeout
+                )
+                if pump_status != "done":
+                    kill_process_group(process.pid)
+                    # Collect whatever was still buffered in the pipes.
+                    pump.run(time.monotonic() + 5)
+                    for name, stream in streams.items():
+                        if name not in pump.eof:
+                            stream.feed(b"", final=True)
+                return_code, user, system, max_rss = wait_with_rusage(process)
+                untrack_process_group(process.pid)
+                process.stdout.close()
+                process.stderr.close()
+                stdout_capture.close()
+                stderr_capture.close()
+                oom_killed = cgroup is not None and cgroup.oom_kills() > 0
+                if cgroup is not None:
+                    cgroup.remove()
+
+                result["stdout"] = stdout_capture.text()
+                result["stderr"] = stderr_capture.text()
+                result["returncode"] = return_code
+                result["output_stats"] = {
+                    "stdout": stdout_capture.stats(),
+                    "stderr": stderr_capture.stats(),
+                }
+                if pump_status == "timeout":
+                    result["exit_reason"] = "wall_timeout"
+                elif pump_status == "idle":
+                    result["exit_reason"] = "idle_timeout"
+                else:
+                    result["exit_reason"] = classify_exit(
+                        return_code, result["stderr"], self.limits, oom_killed
+                    )
+                if result["exit_reason"] == "wall_timeout":
+                    result["stderr"] += f"\nThe script was killed after {timeout:g} seconds"
+                elif result["exit_reason"] in ("idle_timeout", "cpu_limit", "memory_limit"):
+                    result["stderr"] += f"\nThe script {self.limits.describe(result['exit_reason'])}"
+                result["resources"] = monitor.usage(
+                    user, system, max_rss, result["output_stats"], result["exit_reason"]
                 )
-
-                stdout_lines = []
-                stderr_lines = []
-
-                # Import threading to read stdout and stderr concurrently
-                import threading
-
-                def read_stdout():
-                    for line in process.stdout:
-                        print(line, end='')  # Print to console
-                        stdout_lines.append(line)
-
-                def read_stderr():
-                    for line in process.stderr:
-                        print(line, end='', file=sys.stderr)  # Print errors to stderr
-                        stderr_lines.append(line)
-
-                # Start threads to read stdout and stderr
-                stdout_thread = threading.Thread(target=read_stdout)
-                stderr_thread = threading.Thread(target=read_stderr)
-
-                stdout_thread.start()
-                stderr_thread.start()
-
-                # Wait for the process to finish and threads to complete
-                process.wait()
-                stdout_thread.join()
-                stderr_thread.join()
-
-                # Get the return code
-                return_code = process.returncode
-
-                result["stdout"] = ''.join(stdout_lines)
-                result["stderr"] = ''.join(stderr_lines)
 
                 if return_code == 0:
                     result["status"] = "success"
@@ -93,9 +151,9 @@ class PythonRunnerActor:
 
         return result
 
-    def run_code(self, filepath, timeout=None):
+    def run_code(self, filepath, timeout=None, cwd=None, env=None):
         """Wrapper method to execute Python code using the actor's execution method with an optional timeout."""
-        return self.execute_python_code(filepath)
+        return self.execute_python_code(filepath, timeout, cwd, env)
 
 
 def run_python(arguments):  # run python code on the server
@@ -103,12 +161,37 @@ def run_python(arguments):  # run python code on the server
     This function is used to run python code.
     Use this function to run the code you need to complete the task.
     """
+    inputs, bypass = [], False
     if isinstance(arguments, dict):
         script = arguments["filepath"]
+        inputs = arguments.get("inputs") or []
+        bypass = bool(arguments.get("no_cache", False))
     else:
         script = arguments
 
     python_runner_actor = PythonRunnerActor()
-    result = python_runner_actor.run_code(script)
-    result["stdout"] = remove_ascii(result["stdout"])
-    return result
+    # Like every tool, the script runs where run_bash would, with the
+    # variables exported there (activated environments, CUDA_VISIBLE_DEVICES, ...).
+    session = get_shell_session()
+    cwd = session.current_dir
+    env = session.environment()
+    cache = get_exec_cache()
+    if cache is None:
+        # Output is already stripped of ANSI codes and progress-bar redraws.
+        return python_runner_actor.run_code(script, cwd=cwd, env=env)
+    try:
+        with open(os.path.join(cwd, script), "rb") as file:
+            source = file.read()
+    except OSError:
+        source, files = b"", None
+    else:
+        files = python_inputs(script, cwd) | declared_inputs(inputs, cwd)
+    return cache.run(
+        "run_python",
+        source,
+        cwd,
+        files,
+        lambda: python_runner_actor.run_code(script, cwd=cwd, env=env),
+        bypass,
+        session.current_state(),
+    )
@@ -0,0 +1,461 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import signal
+import socket
+import logging
+import tempfile
+import threading
+import importlib
+import selectors
+import subprocess
+import traceback
+
+from agent.tools.limits import CgroupLimit, ToolLimits
+
+
+DEFAULT_PRELOAD = "numpy,torch,torchvision,transformers"
+# Read by numpy/torch & co. when they are imported, i.e. once in the server.
+IMPORT_TIME_VARIABLES = (
+    "CUDA_VISIBLE_DEVICES",
+    "CUDA_DEVICE_ORDER",
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "PYTORCH_CUDA_ALLOC_CONF",
+)
+SETS_ENVIRONMENT = re.compile(r"\bos\.(environ\s*\[[^\]]+\]\s*=(?!=)|environ\.(update|setdefault)\b|putenv\b)")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Started with `python -c` so the server sees the same sys.path as a cold
+# `python file.py` would, minus the script directory that each child sets.
+SERVER_COMMAND = (
+    "import sys; sys.path.insert(0, sys.argv[1]); "
+    "from agent.tools.python.warm_pool import serve; "
+    "sys.path.pop(0); serve(sys.argv[2], sys.argv[3:])"
+)
+
+
+def preload_modules(modules):
+    """Import `modules`, skipping the ones that are not installed."""
+    loaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception:
+            pass
+    return loaded
+
+
+def sets_environment(path):
+    """Whether the script at `path` sets environment variables (os.environ[...] = ..., putenv)."""
+    try:
+        with open(path, "r", errors="replace") as file:
+            return SETS_ENVIRONMENT.search(file.read()) is not None
+    except OSError:
+        return False
+
+
+def watched_paths(modules):
+    """Directories whose mtime changes when a preloaded package is (re)installed."""
+    paths = {}
+    for name in modules:
+        path = getattr(sys.modules.get(name), "__file__", None)
+        if path:
+            # site-packages (or the source tree) containing the package.
+            parent = os.path.dirname(os.path.dirname(path)) if path.endswith("__init__.py") else os.path.dirname(path)
+            paths[parent] = os.stat(parent).st_mtime
+    return paths
+
+
+def serve(socket_path, modules):
+    """Forkserver main loop: preload `modules`, then fork one child per script.
+
+    A request is a JSON line with the script path, cwd, environment and limits,
+    sent together with the write ends of the client's stdout and stderr pipes.
+    The server answers "pid <pid>" once the child runs and "exit <code>
+    <user s> <system s> <max rss bytes>" once it has been reaped (negative
+    codes are signals, as with Popen).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    loaded = preload_modules(modules)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(64)
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_read, False)
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    selector.register(wakeup_read, selectors.EVENT_READ)
+    # The client holds our stdin; EOF means it is gone and we should exit.
+    selector.register(sys.stdin, selectors.EVENT_READ)
+    sys.stdout.write(json.dumps({"modules": loaded, "watch": watched_paths(loaded)}) + "\n")
+    sys.stdout.flush()
+
+    children = {}
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is listener:
+                connection, _ = listener.accept()
+                pid = _fork_child(connection, listener)
+                if pid:
+                    children[pid] = connection
+            elif key.fileobj is sys.stdin:
+                if not sys.stdin.buffer.read1(1024):
+                    listener.close()
+                    os.unlink(socket_path)
+                    return
+            else:
+                try:
+                    while os.read(wakeup_read, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                _reap(children)
+
+
+def _reap(children):
+    while children:
+        try:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        connection = children.pop(pid, None)
+        if connection is not None:
+            reply = (
+                f"exit {os.waitstatus_to_exitcode(status)} "
+                f"{rusage.ru_utime} {rusage.ru_stime} {rusage.ru_maxrss * 1024}\n"
+            )
+            try:
+                connection.sendall(reply.encode())
+            except OSError:
+                pass
+            connection.close()
+
+
+def _fork_child(connection, listener):
+    fds = []
+    try:
+        data, fds, _, _ = socket.recv_fds(connection, 65536, 2)
+        while not data.endswith(b"\n"):
+            more = connection.recv(65536)
+            if not more:
+                raise ConnectionError("incomplete request")
+            data += more
+        request = json.loads(data)
+        pid = os.fork()
+    except Exception:
+        logging.exception("Bad warm pool request")
+        for fd in fds:
+            os.close(fd)
+        connection.close()
+        return None
+    if pid == 0:
+        listener.close()
+        _run_script(request, fds)
+    for fd in fds:
+        os.close(fd)
+    connection.sendall(f"pid {pid}\n".encode())
+    return pid
+
+
+def _run_script(request, fds):
+    """Turn the forked child into `python -u <path>`. Never returns."""
+    path = request["path"]
+    try:
+        os.setsid()
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+        sys.stdin = sys.__stdin__ = open(0, closefd=False)
+        # Unbuffered, like -u.
+        sys.stdout = sys.__stdout__ = io.TextIOWrapper(io.FileIO(1, "w", closefd=False), write_through=True)
+        sys.stderr = sys.__stderr__ = io.TextIOWrapper(
+            io.FileIO(2, "w", closefd=False), write_through=True, errors="backslashreplace"
+        )
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        cgroup = CgroupLimit(request["cgroup"]) if request.get("cgroup") else None
+        ToolLimits(cpu_seconds=request.get("cpu_seconds"), memory_mb=request.get("memory_mb")).apply(cgroup)
+        sys.argv = [path]
+        sys.path[0] = os.path.dirname(os.path.abspath(path))
+    except BaseException:
+        traceback.print_exc()
+        os._exit(1)
+
+    import runpy
+
+    try:
+        runpy.run_path(path, run_name="__main__")
+        code = 0
+    except SystemExit as exit:
+        code = exit.code
+        if code is None:
+            code = 0
+        elif not isinstance(code, int):
+            print(code, file=sys.stderr)
+            code = 1
+    except BaseException as error:
+        # Hide the forkserver frames, as if the script had been run directly.
+        tb = error.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(type(error), error, tb or error.__traceback__)
+        code = 1
+    # What interpreter shutdown would do, without tearing down the inherited
+    # heap of preloaded modules (which takes longer than the fork saved).
+    threading._shutdown()
+    atexit._run_exitfuncs()
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    os._exit(code)
+
+
+class WarmProcess:
+    """The part of the Popen interface run_python uses, for a forked child."""
+
+    def __init__(self, connection, pid, stdout, stderr):
+        self.connection = connection
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        # (user seconds, system seconds, max RSS bytes) from the server's wait4().
+        self.rusage = None
+
+    def wait(self):
+        if self.returncode is None:
+            reply = self.connection.makefile("rb").readline().decode().split()
+            self.connection.close()
+            if len(reply) == 5 and reply[0] == "exit":
+                self.returncode = int(reply[1])
+                self.rusage = (float(reply[2]), float(reply[3]), int(reply[4]))
+            else:
+                # The server died before it could reap the child.
+                logging.error("Warm pool lost track of process %s", self.pid)
+                self.returncode = -signal.SIGKILL
+        return self.returncode
+
+
+class WarmPool:
+    """Pre-warmed interpreter for run_python, in the style of a forkserver.
+
+    A server process imports the modules in AGENT_PYTHON_PRELOAD once and
+    forks a fresh child for every script, so `import torch` in the script is
+    a dictionary lookup instead of seconds of work. Each child gets its own
+    session, the caller's cwd and environment, and the tool limits. `spawn`
+    returns None whenever the warm path cannot be used (server not up,
+    packages reinstalled since the server started, RLIMIT_AS memory limit),
+    and the caller falls back to a cold `python -u`.
+
+    The preloaded modules are imported once, in the server, with the
+    server's environment: variables such as CUDA_VISIBLE_DEVICES or
+    OMP_NUM_THREADS that a script sets before `import torch` would be
+    ignored. Scripts that set environment variables, and callers whose
+    IMPORT_TIME_VARIABLES differ from the server's, therefore run cold.
+    """
+
+    def __init__(self, modules=None, start_timeout=None):
+        if modules is None:
+            modules = os.getenv("AGENT_PYTHON_PRELOAD", DEFAULT_PRELOAD).split(",")
+        self.modules = [name.strip() for name in modules if name.strip()]
+        self.start_timeout = start_timeout or float(os.getenv("AGENT_PYTHON_WARM_START_TIMEOUT", "120"))
+        self.process = None
+        self.info = None
+        self.socket_dir = None
+        self.lock = threading.Lock()
+        self.metrics = {"starts": 0, "warm": 0, "cold": 0, "start_seconds": 0.0}
+
+    @property
+    def socket_path(self):
+        return os.path.join(self.socket_dir, "pool.sock")
+
+    def start(self):
+        """Start the server in the background; `spawn` waits for it to be ready."""
+        with self.lock:
+            if self.process is None:
+                self._start()
+
+    def _start(self):
+        self.socket_dir = tempfile.mkdtemp(prefix="agent_pool_")
+        self.started_at = time.perf_counter()
+        self.import_env = {name: os.environ.get(name) for name in IMPORT_TIME_VARIABLES}
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", SERVER_COMMAND, REPO_ROOT, self.socket_path, *self.modules],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.info = None
+        self.metrics["starts"] += 1
+
+    def _ready(self):
+        if self.info is not None:
+            return self.process.poll() is None
+        selector = selectors.DefaultSelector()
+        selector.register(self.process.stdout, selectors.EVENT_READ)
+        ready = selector.select(max(self.start_timeout - (time.perf_counter() - self.started_at), 0))
+        selector.close()
+        line = self.process.stdout.readline() if ready else b""
+        if not line:
+            logging.warning("Python warm pool did not start; running scripts cold")
+            self._stop()
+            return False
+        self.info = json.loads(line)
+        self.metrics["start_seconds"] += time.perf_counter() - self.started_at
+        return True
+
+    def _stale(self):
+        for path, mtime in self.info["watch"].items():
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def spawn(self, path, limits=None, cgroup=None, cwd=None, env=None):
+        """Run `path` in a warm child and return a WarmProcess, or None.
+
+        `cwd` and `env` default to ours, as with Popen.
+        """
+        limits = limits or ToolLimits()
+        cwd = cwd or os.getcwd()
+        env = dict(os.environ) if env is None else env
+        if limits.memory_mb and cgroup is None:
+            # RLIMIT_AS would count the preloaded modules against the script.
+            self.metrics["cold"] += 1
+            return None
+        if sets_environment(os.path.join(cwd, path)):
+            # Too late for the modules the server has already imported.
+            self.metrics["cold"] += 1
+            return None
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._stop()
+                self._start()
+            if not self._ready():
+                self.metrics["cold"] += 1
+                return None
+            if any(env.get(name) != value for name, value in self.import_env.items()):
+                self.metrics["cold"] += 1
+                return None
+            if self._stale():
+                # pip install since the server started: restart in the background.
+                self._stop()
+                self._start()
+                self.metrics["cold"] += 1
+                return None
+        process = self._request(path, limits, cgroup, cwd, env)
+        self.metrics["warm" if process is not None else "cold"] += 1
+        return process
+
+    def _request(self, path, limits, cgroup, cwd, env):
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        request = {
+            "path": path,
+            "cwd": cwd,
+            "env": env,
+            "cpu_seconds": limits.cpu_seconds,
+            "memory_mb": limits.memory_mb,
+            "cgroup": cgroup.path if cgroup is not None else None,
+        }
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.socket_path)
+            socket.send_fds(connection, [json.dumps(request).encode() + b"\n"], [stdout_write, stderr_write])
+            reply = b""
+            while not reply.endswith(b"\n"):
+                data = connection.recv(64)
+                if not data:
+                    raise ConnectionError("warm pool closed the connection")
+                reply += data
+            pid = int(reply.split()[1])
+        except (OSError, ValueError, IndexError):
+            logging.exception("Warm pool request failed; running %s cold", path)
+            connection.close()
+            for fd in (stdout_read, stderr_read):
+                os.close(fd)
+            return None
+        finally:
+            os.close(stdout_write)
+            os.close(stderr_write)
+        return WarmProcess(
+            connection, pid, os.fdopen(stdout_read, "rb", buffering=0), os.fdopen(stderr_read, "rb", buffering=0)
+        )
+
+    def _stop(self):
+        if self.process is not None:
+            # Closing stdin tells the server to exit; running children are not affected.
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+        if self.socket_dir is not None:
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            os.rmdir(self.socket_dir)
+            self.socket_dir = None
+
+    def close(self):
+        with self.lock:
+            self._stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_warm_pool():
+    """The process-wide warm pool, started on first use, or None unless AGENT_PYTHON_WARM_POOL=1."""
+    global _pool
+    if os.getenv("AGENT_PYTHON_WARM_POOL", "0") != "1":
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WarmPool()
+            _pool.start()
+        return _pool
+
+
+def warm_pool_metrics():
+    """Metrics of the warm pool, or None if it was never started."""
+    with _pool_lock:
+        return dict(_pool.metrics) if _pool is not None else None
+
+
+@atexit.register
+def close_warm_pool():
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import signal
+import resource
+import threading
+import subprocess
+
+from agent.tools.context import get_run_context, track_process_group, untrack_process_group
+from agent.tools.io_pump import SentinelReader
+from agent.tools.limits import ToolLimits, classify_exit, kill_process_group
+from agent.tools.accounting import ResourceMonitor, process_times
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Like the warm pool server: the repository is only on sys.path while the
+# kernel module is imported, cells see the same sys.path as `python -c`.
+KERNEL_COMMAND = (
+    "import sys; sys.path.insert(0, sys.argv[1]); "
+    "from agent.tools.python_cell.kernel import serve; "
+    "sys.path.pop(0); del sys.argv[1]; serve()"
+)
+
+
+def memory_usage():
+    """Resident and peak resident memory of this process, in bytes."""
+    usage = {}
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    usage["rss" if key == "VmRSS" else "peak_rss"] = int(value.split()[0]) * 1024
+    except OSError:
+        usage["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return usage
+
+
+def serve():
+    """Kernel main loop: run the cells sent as JSON lines on stdin in one IPython shell.
+
+    After each cell the kernel prints the sentinel with a JSON payload
+    (execution count, success, error type, memory) on stdout and the bare
+    sentinel on stderr, which is what SentinelReader waits for. SIGINT
+    interrupts the running cell with a KeyboardInterrupt.
+
+    A request may carry the run_bash shell's directory and environment;
+    whatever changed there since the last cell is applied before the cell
+    runs, while a cell's own os.chdir() or os.environ changes are kept.
+    """
+    from traitlets.config import Config
+    from IPython.core.interactiveshell import InteractiveShell
+
+    # Commands come in on a private copy of stdin; cells read /dev/null.
+    commands = os.fdopen(os.dup(0), "r")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    config = Config()
+    config.HistoryManager.enabled = False
+    shell = InteractiveShell.instance(config=config, colors="NoColor")
+    # The shell's directory and environment as of the last cell.
+    shell_cwd, shell_env = os.getcwd(), dict(os.environ)
+
+    while True:
+        try:
+            line = commands.readline()
+        except KeyboardInterrupt:
+            # An interrupt that arrived just after the cell finished.
+            continue
+        if not line:
+            return
+        request = json.loads(line)
+        payload = {"execution_count": None, "success": False, "error": None}
+        try:
+            if request.get("cwd") and request["cwd"] != shell_cwd:
+                shell_cwd = request["cwd"]
+                try:
+                    os.chdir(shell_cwd)
+                except OSError as e:
+                    print(f"Could not change to the shell's directory: {e}", file=sys.stderr)
+            if request.get("env") is not None:
+                for name in set(shell_env) | set(request["env"]):
+                    value = request["env"].get(name)
+                    if value != shell_env.get(name):
+                        if value is None:
+                            os.environ.pop(name, None)
+                        else:
+                            os.environ[name] = value
+                shell_env = request["env"]
+            result = shell.run_cell(request["cell"], store_history=True)
+            error = result.error_before_exec or result.error_in_exec
+            payload.update(
+                execution_count=result.execution_count,
+                success=result.success,
+                error=type(error).__name__ if error is not None else None,
+            )
+        except KeyboardInterrupt:
+            payload["error"] = "KeyboardInterrupt"
+        payload.update(memory_usage())
+        for stream in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        marker = request["marker"]
+        os.write(1, f"\n{marker} {json.dumps(payload)}\n".encode())
+        os.write(2, f"\n{marker}\n".encode())
+
+
+class Kernel:
+    """A persistent IPython process that runs run_python_cell cells.
+
+    Variables, imports and loaded models survive between cells. A cell that
+    exceeds its wall-clock or idle timeout is interrupted with SIGINT, which
+    keeps the kernel's state; if it does not stop within `interrupt_grace`
+    seconds the kernel's process group is killed and a fresh kernel starts
+    with the next cell. The kernel runs under the same ToolLimits as
+    run_bash and run_python, and follows the `cwd` and `env` passed to
+    execute() (the run_bash shell's, for the tool).
+    """
+
+    def __init__(self, cwd=None, limits=None, interrupt_grace=10):
+        self.cwd = cwd or os.getcwd()
+        self.env = None
+        self.limits = limits or ToolLimits.from_env()
+        self.interrupt_grace = interrupt_grace
+        self.process = None
+        self.cgroup = None
+        self.lock = threading.Lock()
+        self.metrics = {"starts": 0, "cells": 0, "interrupts": 0, "restarts": 0, "deaths": 0}
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.cgroup = self.limits.cgroup()
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", "-c", KERNEL_COMMAND, REPO_ROOT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            env=self.env,
+            start_new_session=True,
+            preexec_fn=self.limits.preexec(self.cgroup),
+        )
+        track_process_group(self.process.pid)
+        self.metrics["starts"] += 1
+
+    def kill(self):
+        if self.process is None:
+            return
+        kill_process_group(self.process.pid)
+        self.process.wait()
+        untrack_process_group(self.process.pid)
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            pipe.close()
+        self.process = None
+        if self.cgroup is not None:
+            self.cgroup.remove()
+            self.cgroup = None
+
+    def restart(self):
+        with self.lock:
+            self.kill()
+            self.metrics["restarts"] += 1
+            self.start()
+
+    def close(self):
+        with self.lock:
+            self.kill()
+
+    def interrupt(self):
+        if self.alive:
+            os.kill(self.process.pid, signal.SIGINT)
+
+    def execute(self, cell, timeout=None, echo=True, idle_timeout=None, cwd=None, env=None):
+        """Run `cell` and return a dict with status, exit_reason, stdout, stderr, output_stats,
+        resources, execution_count, success, error and the kernel's rss / peak_rss.
+
+        Changes to `cwd` and `env` since the last cell are applied before
+        this one runs; a new kernel starts from them.
+
+        status is "completed", "interrupted" (timed out, state kept),
+        "restarted" (timed out and did not respond to the interrupt) or
+        "died" (the kernel exited, e.g. out of memory); after the last two
+        the kernel's variables are gone.
+        """
+        timeout = self.limits.wall_timeout if timeout is None else timeout
+        idle_timeout = self.limits.idle_timeout if idle_timeout is None else idle_timeout
+        with self.lock:
+            if cwd is not None:
+                self.cwd = cwd
+            if env is not None:
+                self.env = env
+            if not self.alive:
+                if self.process is not None:
+                    self.kill()
+                self.start()
+            self.metrics["cells"] += 1
+            marker = f"__AGENT_CELL_DONE_{uuid.uuid4().hex}__"
+            monitor = ResourceMonitor().start(self.process.pid)
+            times_before = process_times(self.process.pid)
+            try:
+                request = {"cell": cell, "marker": marker, "cwd": cwd, "env": env}
+                self.process.stdin.write((json.dumps(request) + "\n").encode())
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                pass
+            oom_kills = self.cgroup.oom_kills() if self.cgroup is not None else 0
+
+            reader = SentinelReader(self.process, marker, "run_python_cell", echo)
+            pump_status = reader.run(time.monotonic() + timeout if timeout else None, idle_timeout)
+            exit_reason = {"timeout": "wall_timeout", "idle": "idle_timeout"}.get(pump_status)
+            status = "completed"
+            if exit_reason is not None:
+                self.metrics["interrupts"] += 1
+                self.interrupt()
+                status = "interrupted"
+                if reader.run(time.monotonic() + self.interrupt_grace) != "done" or reader.eof:
+                    status = "restarted"
+            elif reader.eof:
+                status = "died"
+            payload = reader.finish()
+
+            times_after = process_times(self.process.pid)
+            user = system = None
+            if times_before is not None and times_after is not None:
+                user, system = times_after[0] - times_before[0], times_after[1] - times_before[1]
+
+            result = {"status": status, "exit_reason": exit_reason or "completed", "execution_count": None}
+            if payload is not None and status != "restarted":
+                result.update(json.loads(payload))
+            if status == "restarted":
+                self.metrics["restarts"] += 1
+                self.kill()
+            elif status == "died" or payload is None:
+                result["status"] = "died"
+                self.metrics["deaths"] += 1
+                returncode = self.process.wait()
+                oom_killed = self.cgroup is not None and self.cgroup.oom_kills() > oom_kills
+                result["exit_reason"] = classify_exit(
+                    returncode, reader.text("stderr"), self.limits, oom_killed
+                )
+                result["returncode"] = returncode
+                self.kill()
+            result["stdout"] = reader.text("stdout")
+            result["stderr"] = reader.text("stderr")
+            result["output_stats"] = reader.stats()
+            result["resources"] = monitor.usage(
+                user, system, 0, result["output_stats"], result["exit_reason"]
+            )
+            return result
+
+
+_kernels = {}
+_kernels_lock = threading.Lock()
+
+
+def get_kernel(run_id=None):
+    """The Python kernel of a run (default: the run this process is working on)."""
+    if run_id is None:
+        run_id = get_run_context()["run_id"]
+    with _kernels_lock:
+        kernel = _kernels.get(run_id)
+        if kernel is None:
+            kernel = _kernels[run_id] = Kernel()
+        return kernel
+
+
+def kernel_metrics():
+    with _kernels_lock:
+        return {run_id: dict(kernel.metrics) for run_id, kernel in _kernels.items()}
+
+
+def close_kernel(run_id):
+    """Stop the kernel of a run that has finished, if it has one."""
+    with _kernels_lock:
+        kernel = _kernels.pop(run_id, None)
+    if kernel is not None:
+        kernel.close()
+
+
+@atexit.register
+def close_kernels():
+    with _kernels_lock:
+        for kernel in _kernels.values():
+            kernel.close()
+        _kernels.clear()
@@ -0,0 +1,116 @@
+from agent.tools.bash.shell_session import get_shell_session
+from agent.tools.python_cell.kernel import get_kernel
+
+python_cell_tool_definitions = [
+    {
+        "name": "run_python_cell",
+        "description": (
+            "Run a cell of Python code in a persistent IPython kernel. Variables, imports and "
+            "loaded models or datasets stay in memory between calls, so load them once and "
+            "iterate. The value of the last expression is shown as Out[n]. A cell that runs "
+            "past its timeout is interrupted and the kernel keeps its variables. The kernel's "
+            "memory use is reported after every cell. Cells run in the run_bash shell's current "
+            "directory with the variables exported there; a cd or export in run_bash applies "
+            "from the next cell on."
+        ),
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "cell": {
+                    "type": "string",
+                    "description": "The Python code to run.",
+                },
+                "timeout": {
+                    "type": "number",
+                    "description": "Seconds before the cell is interrupted (default: the tool timeout).",
+                },
+                "restart": {
+                    "type": "boolean",
+                    "description": "Restart the kernel, clearing all variables, before running the cell.",
+                },
+            },
+            "required": ["cell"],
+        },
+    },
+]
+
+
+def megabytes(num_bytes):
+    return f"{num_bytes / (1024 * 1024):.0f} MB"
+
+
+class KernelRunnerActor:
+    def __init__(self, kernel=None):
+        self.kernel = kernel or get_kernel()
+
+    def run_cell(self, cell, timeout=None, restart=False):
+        result = {
+            "tool": "run_python_cell",
+            "status": "failure",
+            "attempt": cell,
+            "stdout": "",
+            "stderr": "",
+        }
+        try:
+            if restart:
+                self.kernel.restart()
+            if not cell.strip():
+                result["status"] = "success"
+                result["stdout"] = "The kernel was restarted" if restart else ""
+                return result
+            # Where run_bash would run, with the variables exported there.
+            session = get_shell_session()
+            outcome = self.kernel.execute(
+                cell, timeout=timeout, cwd=session.current_dir, env=session.environment()
+            )
+            result["stdout"] = outcome["stdout"]
+            result["stderr"] = outcome["stderr"]
+            result["exit_reason"] = outcome["exit_reason"]
+            result["execution_count"] = outcome["execution_count"]
+            result["output_stats"] = outcome["output_stats"]
+            result["resources"] = outcome["resources"]
+            if "peak_rss" in outcome:
+                # Whole megabytes, so the same cell reports the same figure
+                # from run to run and replayed prompts still match.
+                result["kernel_memory"] = (
+                    f"{megabytes(outcome['rss'])} resident, {megabytes(outcome['peak_rss'])} peak"
+                    if "rss" in outcome
+                    else f"{megabytes(outcome['peak_rss'])} peak"
+                )
+
+            limits = self.kernel.limits
+            if outcome["status"] == "interrupted":
+                reason = limits.describe(outcome["exit_reason"]) if timeout is None else f"ran past its {timeout:g} s timeout"
+                result["stderr"] += f"\nThe cell {reason} and was interrupted; the kernel kept its variables"
+            elif outcome["status"] == "restarted":
+                result["stderr"] += (
+                    "\nThe cell did not stop when interrupted, so the kernel was restarted; "
+                    "all variables were lost"
+                )
+            elif outcome["status"] == "died":
+                reason = limits.describe(outcome["exit_reason"])
+                result["stderr"] += (
+                    f"\nThe kernel {reason or 'exited'} (exit code {outcome.get('returncode')}); "
+                    "all variables were lost and the next cell starts a new kernel"
+                )
+            if outcome["status"] == "completed" and outcome.get("success"):
+                result["status"] = "success"
+        except Exception as e:
+            result["stderr"] = str(e)
+        return result
+
+
+def run_python_cell(arguments):
+    """
+    This function is used to run a cell of python code in a persistent kernel.
+    Use this function to iterate on data or models without reloading them.
+    """
+    if isinstance(arguments, dict):
+        cell = arguments.get("cell", "")
+        timeout = arguments.get("timeout")
+        restart = bool(arguments.get("restart", False))
+    else:
+        cell, timeout, restart = arguments, None, False
+
+    kernel_runner_actor = KernelRunnerActor()
+    return kernel_runner_actor.run_cell(cell, timeout, restart)
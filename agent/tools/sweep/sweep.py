@@ -0,0 +1,284 @@
+import os
+import re
+import sys
+import math
+import time
+import random
+import shutil
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from agent.tools.context import get_run_context, track_process_group, untrack_process_group
+from agent.tools.io_pump import TerminalCleaner
+from agent.tools.limits import ToolLimits, classify_exit, kill_process_group
+from agent.tools.accounting import ResourceMonitor, merge_usage, wait_with_rusage
+
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?(?:nan|inf)"
+# Environment variables that size the thread pools of numpy/torch/sklearn & co.
+THREAD_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+# Only the end of a trial's log is parsed for the metric.
+TAIL_BYTES = 1024 * 1024
+
+_sweep_numbers = itertools.count(1)
+
+
+def available_cores(limits=None):
+    """CPU cores this process may use: its affinity mask, capped by AGENT_TOOL_CPUS."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    if limits is not None and limits.cpus:
+        cores = min(cores, max(1, math.ceil(limits.cpus)))
+    return cores
+
+
+def _round(value):
+    return float(f"{value:.4g}")
+
+
+def sample_value(spec, rng):
+    """One random value of a parameter: a list is a choice, a dict a {min, max, log, int} range."""
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    low, high = spec["min"], spec["max"]
+    if spec.get("log"):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    return int(round(value)) if spec.get("int") else _round(value)
+
+
+def search_space(space, search="grid", trials=None, seed=None, max_trials=None):
+    """The list of parameter dicts to run.
+
+    `space` maps parameter names to a list of values (grid or random
+    choice) or, for random search, a {"min", "max", "log", "int"} range.
+    Raises ValueError for a space that cannot be searched that way.
+    """
+    max_trials = max_trials or int(os.getenv("AGENT_SWEEP_MAX_TRIALS", "64"))
+    if not isinstance(space, dict) or not space:
+        raise ValueError("space must map parameter names to lists of values or {min, max} ranges")
+    for name, spec in space.items():
+        if isinstance(spec, dict):
+            if not {"min", "max"} <= set(spec):
+                raise ValueError(f"Range of {name} needs min and max")
+            if spec.get("log") and min(spec["min"], spec["max"]) <= 0:
+                raise ValueError(f"Log range of {name} must be positive")
+        elif not isinstance(spec, list) or not spec:
+            raise ValueError(f"Values of {name} must be a non-empty list or a {{min, max}} range")
+    names = list(space)
+    if search == "grid":
+        ranges = [name for name in names if isinstance(space[name], dict)]
+        if ranges:
+            raise ValueError(f"Grid search needs lists of values; use random search for ranges ({', '.join(ranges)})")
+        grid = [dict(zip(names, values)) for values in itertools.product(*space.values())]
+        if len(grid) > max_trials:
+            raise ValueError(
+                f"The grid has {len(grid)} points, more than {max_trials} (AGENT_SWEEP_MAX_TRIALS); "
+                "use fewer values or random search with a number of trials"
+            )
+        return grid
+    if search == "random":
+        trials = min(int(trials or 8), max_trials)
+        rng = random.Random(seed)
+        return [{name: sample_value(space[name], rng) for name in names} for _ in range(trials)]
+    raise ValueError(f"Unknown search {search!r}, expected grid or random")
+
+
+def trial_arguments(params, pass_as="args"):
+    """(extra argv, extra environment) that hand `params` to the script."""
+    if pass_as == "env":
+        return [], {name: str(value) for name, value in params.items()}
+    args = []
+    for name, value in params.items():
+        flag = name if name.startswith("-") else f"--{name}"
+        if isinstance(value, bool):
+            if value:
+                args.append(flag)
+        else:
+            args.extend([flag, str(value)])
+    return args, {}
+
+
+def parse_metric(text, metric, metric_regex=None):
+    """The last value of `metric` printed in `text`, or None.
+
+    By default lines like "accuracy: 0.93", "accuracy=0.93", "accuracy 0.93"
+    and '"accuracy": 0.93' match; `metric_regex` overrides this and must have
+    one group around the number.
+    """
+    pattern = metric_regex or rf"\b{re.escape(metric)}[\"']?\s*[:=]?\s*({NUMBER})"
+    matches = re.findall(pattern, text, flags=re.IGNORECASE)
+    if not matches:
+        return None
+    value = matches[-1]
+    try:
+        return float(value[0] if isinstance(value, tuple) else value)
+    except ValueError:
+        return None
+
+
+def is_scored(trial):
+    """Whether the trial reported a usable metric (a number, not nan)."""
+    return trial.get("value") is not None and not math.isnan(trial["value"])
+
+
+class Sweep:
+    """Runs one script once per parameter set, `parallel` trials at a time.
+
+    Each trial is its own `python -u` process, in its own session, under the
+    tool limits (AGENT_TOOL_TIMEOUT per trial unless `timeout` is given),
+    started in `cwd` with `env` (default: ours) and the `python` found on its
+    PATH, so an activated environment's interpreter and packages are used. The thread pools of
+    numpy/torch are capped at `threads` so parallel trials do not
+    oversubscribe the cores; a cap already set in `env` is kept unless
+    `threads` is given. Trial output goes to
+    `<run dir>/.sweeps/sweep-<n>/trial-<i>.log`.
+    """
+
+    def __init__(self, filepath, trials, metric, goal="max", pass_as="args", metric_regex=None,
+                 parallel=None, threads=None, timeout=None, limits=None, echo=True, cwd=None, env=None):
+        self.filepath = filepath
+        self.trials = [{"trial": idx + 1, "params": params} for idx, params in enumerate(trials)]
+        self.metric = metric
+        self.goal = goal
+        self.pass_as = pass_as
+        self.metric_regex = metric_regex
+        self.limits = limits or ToolLimits.from_env()
+        cores = available_cores(self.limits)
+        self.parallel = max(1, min(int(parallel or cores), len(self.trials) or 1))
+        self.threads = max(1, int(threads or cores // self.parallel))
+        self.explicit_threads = threads is not None
+        self.cwd = cwd
+        self.env = dict(os.environ if env is None else env)
+        self.python = shutil.which("python", path=self.env.get("PATH")) or sys.executable
+        self.timeout = self.limits.wall_timeout if timeout is None else timeout
+        self.echo = echo
+        work_dir = get_run_context()["work_dir"] or os.getcwd()
+        self.log_dir = os.path.join(work_dir, ".sweeps", f"sweep-{os.getpid()}-{next(_sweep_numbers)}")
+        self.wall_seconds = 0.0
+
+    def _run_trial(self, trial):
+        args, params_env = trial_arguments(trial["params"], self.pass_as)
+        env = dict(self.env)
+        for name in THREAD_VARIABLES:
+            if self.explicit_threads or name not in env:
+                env[name] = str(self.threads)
+        env.update(params_env)
+        log_path = os.path.join(self.log_dir, f"trial-{trial['trial']}.log")
+        cgroup = self.limits.cgroup()
+        with open(log_path, "wb") as log:
+            process = subprocess.Popen(
+                [self.python, "-u", self.filepath, *args],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                cwd=self.cwd,
+                env=env,
+                start_new_session=True,
+                preexec_fn=self.limits.preexec(cgroup),
+            )
+        track_process_group(process.pid)
+        monitor = ResourceMonitor().start(process.pid)
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            kill_process_group(process.pid)
+
+        timer = threading.Timer(self.timeout, kill) if self.timeout else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        returncode, user, system, max_rss = wait_with_rusage(process)
+        if timer is not None:
+            timer.cancel()
+        untrack_process_group(process.pid)
+        oom_killed = cgroup is not None and cgroup.oom_kills() > 0
+        if cgroup is not None:
+            cgroup.remove()
+
+        output_bytes = os.path.getsize(log_path)
+        with open(log_path, "rb") as log:
+            log.seek(max(0, output_bytes - TAIL_BYTES))
+            # Without ANSI codes and progress-bar redraws.
+            output = TerminalCleaner().feed(log.read(), final=True)
+        if timed_out.is_set():
+            exit_reason = "wall_timeout"
+        else:
+            exit_reason = classify_exit(returncode, output, self.limits, oom_killed)
+        trial.update(
+            returncode=returncode,
+            exit_reason=exit_reason,
+            value=parse_metric(output, self.metric, self.metric_regex),
+            last_line=next((line.strip() for line in reversed(output.splitlines()) if line.strip()), ""),
+            log_path=log_path,
+            resources=monitor.usage(user, system, max_rss, {"log": {"bytes": output_bytes}}, exit_reason),
+        )
+        return trial
+
+    def run(self):
+        """Run every trial and return them ranked: best metric first, failed trials last."""
+        os.makedirs(self.log_dir, exist_ok=True)
+        started = time.perf_counter()
+        finished = 0
+        with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+            futures = [executor.submit(self._run_trial, trial) for trial in self.trials]
+            for future in as_completed(futures):
+                trial = future.result()
+                finished += 1
+                if self.echo:
+                    print(
+                        f"[run_sweep] trial {finished}/{len(self.trials)} {trial['params']}: "
+                        f"{self.metric}={trial['value']} ({trial['exit_reason']})"
+                    )
+        self.wall_seconds = time.perf_counter() - started
+        return self.ranked()
+
+    def ranked(self):
+        scored = [trial for trial in self.trials if is_scored(trial)]
+        scored.sort(key=lambda trial: trial["value"], reverse=self.goal == "max")
+        return scored + [trial for trial in self.trials if trial not in scored]
+
+    def resources(self):
+        """Usage of the whole sweep: CPU and output summed over trials, wall time of the sweep."""
+        usage = merge_usage(trial.get("resources") for trial in self.trials)
+        if usage is not None:
+            usage["wall_seconds"] = round(self.wall_seconds, 3)
+        return usage
+
+    def table(self, ranked=None):
+        """The ranked trials as a compact fixed-width table."""
+        ranked = ranked or self.ranked()
+        names = list(self.trials[0]["params"]) if self.trials else []
+        header = ["rank", self.metric, *names, "seconds", "status"]
+        rows = []
+        for rank, trial in enumerate(ranked, start=1):
+            scored = trial.get("value") is not None
+            if trial.get("returncode") == 0:
+                status = "ok" if scored else "no metric"
+            else:
+                status = f"{trial.get('exit_reason')} (exit {trial.get('returncode')})"
+            rows.append([
+                str(rank) if scored else "-",
+                f"{trial['value']:.6g}" if scored else "-",
+                *(str(trial["params"][name]) for name in names),
+                f"{trial['resources']['wall_seconds']:.1f}" if trial.get("resources") else "-",
+                status,
+            ])
+        widths = [max(len(row[idx]) for row in [header, *rows]) for idx in range(len(header))]
+        return "\n".join(
+            "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+            for row in [header, *rows]
+        )
@@ -0,0 +1,137 @@
+import os
+from agent.tools.bash.shell_session import get_shell_session
+from agent.tools.sweep.sweep import Sweep, is_scored, search_space
+
+sweep_tool_definitions = [
+    {
+        "name": "run_sweep",
+        "description": (
+            "Run a python script once per hyperparameter setting, several trials in parallel across "
+            "the CPU cores, and return one table of the trials ranked by a metric the script prints "
+            "(e.g. 'accuracy: 0.93'). Parameters are passed as --name value arguments or as "
+            "environment variables. Use this instead of editing and re-running a script per value."
+        ),
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "filepath": {
+                    "type": "string",
+                    "description": "The path to the python script to run.",
+                },
+                "space": {
+                    "type": "object",
+                    "description": (
+                        "Parameter name -> list of values, e.g. {\"lr\": [0.1, 0.01, 0.001], \"batch_size\": [32, 64]}. "
+                        "For random search a parameter may instead be a range {\"min\": 1e-5, \"max\": 1e-1, "
+                        "\"log\": true} (add \"int\": true for integers)."
+                    ),
+                },
+                "metric": {
+                    "type": "string",
+                    "description": "Name of the metric the script prints, e.g. 'accuracy' or 'val_loss'. The last printed value counts.",
+                },
+                "goal": {
+                    "type": "string",
+                    "enum": ["max", "min"],
+                    "description": "Whether a higher (max, default) or lower (min) metric is better.",
+                },
+                "search": {
+                    "type": "string",
+                    "enum": ["grid", "random"],
+                    "description": "grid (default) runs every combination, random samples `trials` settings.",
+                },
+                "trials": {
+                    "type": "integer",
+                    "description": "Number of settings to sample for random search (default 8).",
+                },
+                "pass_as": {
+                    "type": "string",
+                    "enum": ["args", "env"],
+                    "description": "Pass parameters as --name value arguments (default) or as environment variables.",
+                },
+                "parallel": {
+                    "type": "integer",
+                    "description": "Trials to run at once (default: one per available core).",
+                },
+                "threads_per_trial": {
+                    "type": "integer",
+                    "description": "Threads each trial may use for numpy/torch (default: cores / parallel).",
+                },
+                "timeout": {
+                    "type": "number",
+                    "description": "Seconds before a trial is killed (default: the tool timeout).",
+                },
+                "seed": {
+                    "type": "integer",
+                    "description": "Random seed for random search.",
+                },
+            },
+            "required": ["filepath", "space", "metric"],
+        },
+    },
+]
+
+
+def run_sweep(arguments):
+    """
+    This function is used to run a hyperparameter sweep of a python script.
+    Use this function to compare settings in one step instead of one run per value.
+    """
+    filepath = arguments.get("filepath", "")
+    metric = arguments.get("metric", "")
+    result = {
+        "tool": "run_sweep",
+        "status": "failure",
+        "attempt": f"{filepath} over {arguments.get('space')}",
+        "stdout": "",
+        "stderr": "",
+    }
+    try:
+        # Trials run where run_bash would, with the variables exported there
+        # (activated environments, CUDA_VISIBLE_DEVICES, ...).
+        session = get_shell_session()
+        cwd = session.current_dir
+        if not os.path.isfile(os.path.join(cwd, filepath)):
+            raise FileNotFoundError(f"File not found: {filepath}")
+        if not metric:
+            raise ValueError("No metric given")
+        trials = search_space(
+            arguments.get("space"),
+            arguments.get("search", "grid"),
+            arguments.get("trials"),
+            arguments.get("seed"),
+        )
+        goal = arguments.get("goal", "max")
+        sweep = Sweep(
+            filepath,
+            trials,
+            metric,
+            goal=goal,
+            pass_as=arguments.get("pass_as", "args"),
+            parallel=arguments.get("parallel"),
+            threads=arguments.get("threads_per_trial"),
+            timeout=arguments.get("timeout"),
+            cwd=cwd,
+            env=session.environment(),
+        )
+        ranked = sweep.run()
+        scored = [trial for trial in ranked if is_scored(trial)]
+        summary = (
+            f"{len(trials)} trials of {filepath}, {sweep.parallel} at a time with "
+            f"{sweep.threads} thread{'s' if sweep.threads > 1 else ''} each, "
+            f"in {sweep.wall_seconds:.1f} s; {len(scored)} reported {metric} ({goal} is best)."
+        )
+        result["stdout"] = f"{summary}\n{sweep.table(ranked)}"
+        failed = [trial for trial in ranked if not is_scored(trial)]
+        result["stderr"] = "\n".join(
+            f"trial {trial['params']}: {trial['last_line'][:200]}" for trial in failed
+        )
+        if failed:
+            result["stderr"] += f"\nFull trial logs are in {sweep.log_dir}"
+        if scored:
+            result["status"] = "success"
+            result["best"] = {"params": scored[0]["params"], metric: scored[0]["value"]}
+        result["resources"] = sweep.resources()
+    except Exception as e:
+        result["stderr"] = str(e)
+    return result
@@ -1,18 +1,15 @@
 import re
-import tiktoken
+from agent.models.registry import get_encoding
 
 
 def count_tokens(string: str, encoding_name: str) -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
+    encoding = get_encoding(encoding_name)
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
 
 def remove_ascii(text):
-    pattern = r"[\x00-\x7F]"
-    # Replace all ASCII characters with an empty string
-    cleaned_string = re.sub(pattern, "", text)
     ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
     result_cleaned = re.sub(
         r"(^|\n)(Out|In)\[[0-9]+\]: ", r"\1", ansi_escape.sub("", text)
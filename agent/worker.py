@@ -1,4 +1,5 @@
 import os
+import time
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import traceback
@@ -10,16 +11,56 @@ from rich.console import Console
 from rich.columns import Columns
 
 from agent.memory import AgentMemory
+from agent.compaction import OutputCompactor
 from agent.tool_registry import Tool, worker_action_map
 from agent.memory import Base
-from agent.tool_registry import all_tools
-from agent.prompts import get_worker_system_prompt, get_worker_prompt
+from agent.tool_registry import (
+    all_tools,
+    ToolCallScheduler,
+    merge_tool_outputs,
+)
+from agent.prompts import (
+    get_worker_system_prompt,
+    get_worker_prompt,
+    get_worker_task_prompt,
+    get_worker_turn_prompt,
+)
+from agent.models.history import ConversationHistory
 from agent.models.anthropic import AnthropicModel
 from agent.models.openai import OpenAIModel
+from agent.models.registry import get_registry
+from agent.models.response_cache import ReplayMissError
+from agent.tools.context import set_run_context
+from agent.tools.bash.shell_session import close_shell_session, session_metrics
+from agent.tools.python.warm_pool import warm_pool_metrics
+from agent.tools.python_cell.kernel import close_kernel, kernel_metrics
+from agent.tools.exec_cache import get_exec_cache
+from agent.tools.jobs.job_manager import close_job_manager, get_job_manager, job_metrics
+from agent.tools.jobs.jobs_tool import job_result
 
 load_dotenv()
 console = Console()
 
+# Fields of a tool result shown to the model. The rest (resources,
+# output_stats, log paths, cache timestamps) differ from run to run and would
+# make every recorded response cache request unique; they are kept in the
+# memory table instead.
+MODEL_RESULT_KEYS = (
+    "tool",
+    "status",
+    "attempt",
+    "stdout",
+    "stderr",
+    "returncode",
+    "exit_reason",
+    "execution_count",
+    "kernel_memory",
+    "job_id",
+    "job_state",
+    "best",
+    "cached",
+)
+
 
 class Worker:
     def __init__(
@@ -30,6 +71,8 @@ class Worker:
         plan=str,
         worker_number=int,
         provider=str,
+        history_mode=False,
+        streaming=False,
     ) -> None:
         self.user_id = user_id
         self.run_id = run_id
@@ -41,14 +84,32 @@ class Worker:
         self.num_tokens = []
         self.run_number = run_id
         self.start_time = datetime.now()
+        self.history_mode = history_mode
+        self.streaming = streaming
+        self.turn_metrics = []
+        # Runs every tool call of a response; independent reads in parallel.
+        self.scheduler = ToolCallScheduler()
 
         self.plan_structure = {"subtasks": [], "completed": [], "in_progress": None}
         self.system_prompt = get_worker_system_prompt(self.run_number)
         self.make_directory(self.run_id)
+        # Lets tools find this run's shell session and working directory.
+        set_run_context(self.run_id, f"./{self.run_id}")
 
         self.memory = AgentMemory()
-        
-        
+
+        # One model per worker; the underlying SDK client and tokenizer are
+        # shared process-wide through agent.models.registry.
+        if self.agent_model == "openai":
+            self.model = OpenAIModel(self.system_prompt, all_tools)
+        else:
+            self.model = AnthropicModel(self.system_prompt, all_tools)
+        # Budgets are counted with the model's tokenizer; full copies of
+        # compacted tool output land in the run's directory.
+        self.compactor = OutputCompactor(
+            log_dir=os.path.join(f"./{self.run_id}", ".outputs"), encoding=self.model.encoding
+        )
+
     def make_directory(self, work_dir):
         work_dir = f"./{work_dir}"
         if not os.path.exists(work_dir):
@@ -72,7 +133,14 @@ class Worker:
         previous_subtask_errors,
         elapsed_time,
     ) -> dict:
-        memories = self.memory.get_conversation_memory(self.run_id)
+        memories = self.memory.get_conversation_memory(
+            self.run_id, compact=self.compactor.compact_memory
+        )
+        previous_subtask_output = self.compactor.compact(previous_subtask_output, "output")
+        previous_subtask_errors = self.compactor.compact(previous_subtask_errors, "errors")
+        tokens_saved = self.compactor.start_turn()
+        if tokens_saved:
+            print(f"Compacted tool output: saved {tokens_saved} tokens this turn")
 
         self.prompt = get_worker_prompt(
             self.user_query,
@@ -83,6 +151,7 @@ class Worker:
             previous_subtask_attempt,
             previous_subtask_output,
             previous_subtask_errors,
+            self.background_jobs(),
         )
 
         try:
@@ -103,24 +172,12 @@ class Worker:
                         """
                     )
 
-            if self.agent_model == "openai":
-                (
-                    response_data,
-                    total_tokens,
-                    prompt_tokens,
-                    response_tokens,
-                ) = OpenAIModel(self.system_prompt, all_tools).generate_response(
-                    self.prompt
-                )
-            else:
-                (
-                    response_data,
-                    total_tokens,
-                    prompt_tokens,
-                    response_tokens,
-                ) = AnthropicModel(self.system_prompt, all_tools).generate_response(
-                    self.prompt
-                )
+            (
+                response_data,
+                total_tokens,
+                prompt_tokens,
+                response_tokens,
+            ) = self.model.generate_response(self.prompt)
 
             self.num_tokens.append(total_tokens)
             print(f"Number of tokens: {total_tokens}")
@@ -132,7 +189,19 @@ class Worker:
                     "subtask_status": "failure",
                 }
 
-            if isinstance(response_data, dict):
+            if isinstance(response_data, list):
+                # Run every tool call from the response and report them as one step
+                tool_outputs = self.scheduler.run_all(
+                    [(call["name"], call["input"]) for call in response_data]
+                )
+                return {
+                    "subtask_result": merge_tool_outputs(tool_outputs),
+                    "attempted": "yes",
+                    "total_tokens": total_tokens,
+                    "prompt_tokens": prompt_tokens,
+                    "response_tokens": response_tokens,
+                }
+            elif isinstance(response_data, dict):
                 # Iterate through the action_map
                 for key, val in worker_action_map.items():
                     # Check if val is a string and directly check for existence
@@ -188,6 +257,10 @@ class Worker:
                     "response_tokens": response_tokens,
                 }
 
+        except ReplayMissError:
+            # A replay run has no recorded answer to this prompt; asking again
+            # would only miss again.
+            raise
         except Exception as e:
             print(
                 f"An error occurred in the Worker: {str(e)} on line {e.__traceback__.tb_lineno}"
@@ -262,14 +335,9 @@ class Worker:
                     prompt_tokens = subtask_response["prompt_tokens"]
                     response_tokens = subtask_response["response_tokens"]
 
-                    self.memory.save_conversation_memory(
-                        self.user_id,
-                        self.run_id,
-                        previous_subtask_tool,
-                        previous_subtask_result,
-                        previous_subtask_attempt,
-                        previous_subtask_output,
-                        previous_subtask_errors,
+                    # Stored with the tool's resource usage, if it ran a process.
+                    self.save_tool_memory(
+                        subtask_response["subtask_result"],
                         total_tokens,
                         prompt_tokens,
                         response_tokens,
@@ -323,8 +391,293 @@ class Worker:
                     "total_tokens": sum(self.num_tokens),
                     "total_turns": str(self.task_number),
                     "run_number": str(self.run_number),
+                    "connection_stats": get_registry().connection_stats(),
+                    "compaction_tokens_saved": self.compactor.tokens_saved,
                 }
 
+    def format_tool_result(self, tool_output):
+        tool_output = self.compactor.compact_result(tool_output)
+        if isinstance(tool_output, dict):
+            return "\n".join(
+                f"{key}: {tool_output[key]}" for key in MODEL_RESULT_KEYS if key in tool_output
+            )
+        return str(tool_output)
+
+    def tool_memory_step(self, tool_output, total_tokens, prompt_tokens, response_tokens):
+        if not isinstance(tool_output, dict):
+            tool_output = {"stdout": tool_output}
+        return {
+            "tool": tool_output.get("tool", "None"),
+            "status": tool_output.get("status", "None"),
+            "attempt": tool_output.get("attempt", "None"),
+            "stdout": tool_output.get("stdout", "None"),
+            "stderr": tool_output.get("stderr", "None"),
+            "total_tokens": total_tokens,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            # wall/CPU time, peak RSS, output bytes and exit reason of process tools.
+            **(tool_output.get("resources") or {}),
+        }
+
+    def collect_tool_output(self, call, dispatched):
+        """The result of a dispatched call; a call that raised (or was never
+        dispatched) becomes a failed tool result so the turn can go on."""
+        try:
+            return dispatched[call["id"]].result()
+        except Exception as e:
+            traceback.print_exc()
+            return {
+                "tool": call.get("name", "None"),
+                "status": "failure",
+                "attempt": str(call.get("input")),
+                "stdout": "",
+                "stderr": f"The tool call failed: {type(e).__name__}: {e}",
+            }
+
+    def background_jobs(self):
+        """Status and latest output of the run's background jobs, for the next prompt.
+
+        Jobs that ended since the last turn are also stored as a step, with
+        their resource usage.
+        """
+        jobs = get_job_manager(self.run_id)
+        finished = jobs.collect_finished()
+        if finished:
+            self.memory.save_conversation_memories(
+                self.user_id, self.run_id, [self.tool_memory_step(job_result(job), 0, 0, 0) for job in finished]
+            )
+        return jobs.render()
+
+    def save_tool_memory(self, tool_output, total_tokens, prompt_tokens, response_tokens):
+        self.memory.save_conversation_memories(
+            self.user_id,
+            self.run_id,
+            [self.tool_memory_step(tool_output, total_tokens, prompt_tokens, response_tokens)],
+        )
+
+    def process_turns(self):
+        """Worker loop that keeps a real multi-turn conversation.
+
+        The system prompt, tool schemas and opening task message form a stable
+        prefix that the provider caches, so each turn only pays full price for
+        the newest tool results.
+        """
+        history = ConversationHistory(
+            max_tokens=self.model.max_tokens // 2,
+            count_tokens=lambda text: len(self.model.encode_text(text)),
+        )
+        history.add_user_text(
+            get_worker_task_prompt(self.user_query, self.plan, self.run_number)
+        )
+        self.task_number = 0
+        self.save_tool_memory(
+            {
+                "tool": "You are starting the task",
+                "status": "This is your first attempt",
+                "attempt": "You are starting the task",
+                "stdout": "You are starting the task",
+                "stderr": "You are starting the task",
+            },
+            0,
+            0,
+            0,
+        )
+
+        max_errors = int(os.getenv("AGENT_MAX_TURN_ERRORS", "5"))
+        errors = 0
+        while True:
+            dispatched = {}
+            dispatched_calls = []
+
+            def dispatch(call):
+                dispatched[call["id"]] = self.scheduler.submit(call["name"], call["input"])
+                dispatched_calls.append(call)
+
+            try:
+                if self.streaming:
+                    turn = self.model.stream_turn(history, on_tool_call=dispatch)
+                else:
+                    turn = self.model.generate_turn(history)
+                    for call in turn["tool_calls"]:
+                        dispatch(call)
+            except ReplayMissError:
+                raise
+            except Exception as e:
+                # Rate limits, server errors, dropped streams: record the
+                # failure and ask again.
+                errors += 1
+                print(f"An error occurred in the Worker: {str(e)} (attempt {errors} of {max_errors})")
+                traceback.print_exc()
+                self.save_tool_memory(
+                    {
+                        "tool": "None",
+                        "status": "failure",
+                        "attempt": f"An error occurred: {str(e)}",
+                        "stdout": "None",
+                        "stderr": "None",
+                    },
+                    0,
+                    0,
+                    0,
+                )
+                if dispatched_calls:
+                    # A stream that broke off after dispatching calls: they
+                    # have run (code inserted, jobs started), so they go into
+                    # the history with their results rather than being asked
+                    # for, and run, a second time.
+                    history.add_assistant("(The response was interrupted.)", dispatched_calls)
+                    final_output = self.answer_tool_calls(
+                        history,
+                        dispatched_calls,
+                        dispatched,
+                        {"total_tokens": 0, "prompt_tokens": 0, "response_tokens": 0},
+                        "Your previous response was interrupted after these tool calls ran. "
+                        + get_worker_turn_prompt(datetime.now() - self.start_time, self.background_jobs()),
+                    )
+                    if final_output is not None:
+                        return self.turns_result(final_output)
+                if errors >= max_errors:
+                    return {
+                        "plan": self.plan,
+                        "result": f"The worker stopped after {errors} failed model calls in a row: {str(e)}",
+                        "total_tokens": sum(self.num_tokens),
+                        "total_turns": str(self.task_number),
+                        "run_number": str(self.run_number),
+                        "connection_stats": get_registry().connection_stats(),
+                    }
+                time.sleep(min(2 ** errors, 60))
+                continue
+            errors = 0
+            self.task_number += 1
+            self.num_tokens.append(turn["total_tokens"])
+            self.turn_metrics.append(
+                {
+                    "turn": self.task_number,
+                    "prompt_tokens": turn["prompt_tokens"],
+                    "response_tokens": turn["response_tokens"],
+                    "cache_read_tokens": turn["cache_read_tokens"],
+                    "cache_write_tokens": turn["cache_write_tokens"],
+                    "time_to_first_token": turn.get("time_to_first_token"),
+                    "time_to_tool_dispatch": turn.get("time_to_tool_dispatch"),
+                }
+            )
+            if self.streaming:
+                print(
+                    f"Time to first token: {turn['time_to_first_token']}s, "
+                    f"time to tool dispatch: {turn['time_to_tool_dispatch']}s"
+                )
+            print(
+                f"Number of tokens: {turn['total_tokens']} "
+                f"(cache read: {turn['cache_read_tokens']}, cache write: {turn['cache_write_tokens']})"
+            )
+
+            history.add_assistant(turn["text"] or "(no response)", turn["tool_calls"])
+            elapsed_time = datetime.now() - self.start_time
+
+            if not turn["tool_calls"]:
+                print(Panel(Text(f"Thought: {turn['text']}"), style="on green"))
+                self.save_tool_memory(
+                    {
+                        "tool": "thought",
+                        "status": "You had a thought",
+                        "attempt": f"You had the thought: {turn['text']}",
+                        "stdout": "you must now use a tool to complete the task",
+                        "stderr": "None",
+                    },
+                    turn["total_tokens"],
+                    turn["prompt_tokens"],
+                    turn["response_tokens"],
+                )
+                history.add_user_text(
+                    "You must now use a tool to complete the task. "
+                    + get_worker_turn_prompt(elapsed_time, self.background_jobs())
+                )
+                continue
+
+            final_output = self.answer_tool_calls(
+                history,
+                turn["tool_calls"],
+                dispatched,
+                turn,
+                get_worker_turn_prompt(elapsed_time, self.background_jobs()),
+            )
+            tokens_saved = self.compactor.start_turn()
+            self.turn_metrics[-1]["compaction_tokens_saved"] = tokens_saved
+            if tokens_saved:
+                print(f"Compacted tool output: saved {tokens_saved} tokens this turn")
+
+            if final_output is not None:
+                return self.turns_result(final_output)
+
+    def answer_tool_calls(self, history, calls, dispatched, turn, text):
+        """Add the results of a turn's tool calls to the history and store
+        them as steps; returns return_fn's output if it was called."""
+        results = []
+        steps = []
+        final_output = None
+        for call in calls:
+            tool_output = self.collect_tool_output(call, dispatched)
+            results.append(
+                {
+                    "id": call["id"],
+                    "name": call["name"],
+                    "content": self.format_tool_result(tool_output),
+                }
+            )
+            steps.append(
+                self.tool_memory_step(
+                    tool_output,
+                    turn["total_tokens"],
+                    turn["prompt_tokens"],
+                    turn["response_tokens"],
+                )
+            )
+            if call["name"] == "return_fn":
+                final_output = tool_output
+        # All of a turn's tool results are stored in one transaction.
+        self.memory.save_conversation_memories(self.user_id, self.run_id, steps)
+        history.add_tool_results(results, text=text)
+        return final_output
+
+    def turns_result(self, final_output):
+        print(
+            f"Plan execution complete. Worker number {self.worker_number} completed the task"
+        )
+        return {
+            "plan": self.plan,
+            "result": str({"subtask_result": final_output}),
+            "total_tokens": sum(self.num_tokens),
+            "total_turns": str(self.task_number),
+            "run_number": str(self.run_number),
+            "connection_stats": get_registry().connection_stats(),
+            "cache_read_tokens": sum(
+                metrics["cache_read_tokens"] for metrics in self.turn_metrics
+            ),
+        }
+
     def run(self):
-        worker_result = self.process_subtasks()
-        return worker_result
+        try:
+            if self.history_mode:
+                return self.process_turns()
+            worker_result = self.process_subtasks()
+            return worker_result
+        finally:
+            self.scheduler.shutdown()
+            self.memory.flush()
+            print(f"Embedding queue: {self.memory.embedding_queue.metrics}")
+            if self.run_id in session_metrics():
+                print(f"Shell session: {session_metrics()[self.run_id]}")
+            if warm_pool_metrics() is not None:
+                print(f"Python warm pool: {warm_pool_metrics()}")
+            exec_cache = get_exec_cache()
+            if exec_cache is not None:
+                print(f"Execution cache: {exec_cache.metrics}")
+            if self.run_id in kernel_metrics():
+                print(f"Python kernel: {kernel_metrics()[self.run_id]}")
+            if self.run_id in job_metrics():
+                print(f"Background jobs: {job_metrics()[self.run_id]}")
+            # The run is over: stop its background jobs, shell and kernel
+            # instead of leaving them to the exit of the process.
+            close_job_manager(self.run_id)
+            close_shell_session(self.run_id)
+            close_kernel(self.run_id)
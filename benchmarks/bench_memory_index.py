@@ -0,0 +1,74 @@
+"""Compare MemoryIndex (IVF) against brute-force cosine search.
+
+    python benchmarks/bench_memory_index.py --rows 1000000 --dim 384
+"""
+import os
+import sys
+import time
+import click
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agent.memory_index import MemoryIndex, normalize
+
+
+def clustered_vectors(n, dim, clusters, rng):
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return centers[labels] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+@click.command()
+@click.option("--rows", default=200_000, help="Number of stored embeddings.")
+@click.option("--dim", default=384, help="Embedding dimension (384 for all-MiniLM-L6-v2).")
+@click.option("--runs", default=1000, help="Distinct run ids the rows are spread over.")
+@click.option("--queries", default=200, help="Number of timed queries.")
+@click.option("--k", default=10)
+@click.option("--n-lists", default=1024)
+@click.option("--n-probe", default=16)
+def main(rows, dim, runs, queries, k, n_lists, n_probe):
+    rng = np.random.default_rng(0)
+    vectors = normalize(clustered_vectors(rows, dim, 200, rng))
+    run_ids = rng.integers(0, runs, rows)
+    query_vectors = normalize(clustered_vectors(queries, dim, 200, rng))
+
+    start = time.perf_counter()
+    index = MemoryIndex(n_lists=n_lists, n_probe=n_probe)
+    for chunk in range(0, rows, 50_000):
+        index.add(
+            np.arange(chunk, min(chunk + 50_000, rows)),
+            vectors[chunk : chunk + 50_000],
+            run_ids[chunk : chunk + 50_000],
+        )
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact = [np.argpartition(-(vectors @ query), k)[:k] for query in query_vectors]
+    brute_ms = (time.perf_counter() - start) / queries * 1000
+
+    start = time.perf_counter()
+    approximate = [index.search(query, k) for query in query_vectors]
+    ivf_ms = (time.perf_counter() - start) / queries * 1000
+
+    recall = np.mean(
+        [
+            len(set(truth) & {row_id for row_id, _ in hits}) / k
+            for truth, hits in zip(exact, approximate)
+        ]
+    )
+
+    start = time.perf_counter()
+    for query, run_id in zip(query_vectors, run_ids[:queries]):
+        index.search(query, k, run_id=int(run_id))
+    filtered_ms = (time.perf_counter() - start) / queries * 1000
+
+    print(f"rows={rows} dim={dim} n_lists={n_lists} n_probe={n_probe}")
+    print(f"index build:          {build_seconds:.2f} s")
+    print(f"brute force:          {brute_ms:.2f} ms/query")
+    print(f"ivf:                  {ivf_ms:.2f} ms/query (recall@{k} {recall:.3f})")
+    print(f"ivf, filtered by run: {filtered_ms:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
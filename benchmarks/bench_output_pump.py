@@ -0,0 +1,132 @@
+"""Pipe a large amount of process output through the old and new output readers.
+
+    python benchmarks/bench_output_pump.py --megabytes 1024
+
+"legacy" is the previous run_bash/run_python reader: two threads calling
+readline, printing every line, appending to lists and running the regex
+clean-up over the joined result. "pump" is agent.tools.io_pump with bounded
+OutputCapture. Each implementation runs in its own process so CPU time and
+peak RSS are measured separately; console echo goes to /dev/null.
+"""
+import os
+import re
+import sys
+import json
+import time
+import resource
+import threading
+import subprocess
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+LINE = "epoch 3 batch 1200/5000 loss=0.4321 acc=0.8765 \x1b[32mok\x1b[0m lr=3e-4"
+
+
+def producer(megabytes):
+    return subprocess.Popen(
+        f"yes '{LINE}' | head -c {megabytes * 1024 * 1024}",
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def legacy(megabytes):
+    process = subprocess.Popen(
+        f"yes '{LINE}' | head -c {megabytes * 1024 * 1024}",
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+    )
+    stdout_lines, stderr_lines = [], []
+
+    def read(pipe, lines):
+        for line in iter(pipe.readline, ""):
+            print(line, end="")
+            lines.append(line)
+
+    threads = [
+        threading.Thread(target=read, args=(process.stdout, stdout_lines)),
+        threading.Thread(target=read, args=(process.stderr, stderr_lines)),
+    ]
+    for thread in threads:
+        thread.start()
+    process.wait()
+    for thread in threads:
+        thread.join()
+    text = "".join(stdout_lines)
+    # The old agent.utils.remove_ascii.
+    re.sub(r"[\x00-\x7F]", "", text)
+    ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
+    text = re.sub(r"(^|\n)(Out|In)\[[0-9]+\]: ", r"\1", ansi_escape.sub("", text))
+    return len(text)
+
+
+def pump(megabytes):
+    from agent.tools.io_pump import OutputPump, PumpStream
+    from agent.tools.output_capture import OutputCapture
+
+    process = producer(megabytes)
+    captures = {name: OutputCapture("bench", name) for name in ("stdout", "stderr")}
+    streams = {
+        "stdout": PumpStream(captures["stdout"], sys.stdout),
+        "stderr": PumpStream(captures["stderr"], sys.stderr),
+    }
+    OutputPump(
+        {"stdout": process.stdout.fileno(), "stderr": process.stderr.fileno()},
+        lambda name, data: streams[name].feed(data, final=not data),
+    ).run()
+    process.wait()
+    for capture in captures.values():
+        capture.close()
+    return len(captures["stdout"].text())
+
+
+def measure(impl, megabytes):
+    console = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    start = time.perf_counter()
+    {"legacy": legacy, "pump": pump}[impl](megabytes)
+    wall = time.perf_counter() - start
+    sys.stdout = console
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    print(
+        json.dumps(
+            {
+                "impl": impl,
+                "wall_seconds": wall,
+                "cpu_seconds": usage.ru_utime + usage.ru_stime,
+                "max_rss_mb": usage.ru_maxrss / 1024,
+            }
+        )
+    )
+
+
+@click.command()
+@click.option("--megabytes", default=1024, help="Amount of output to pipe through each reader.")
+@click.option("--impl", type=click.Choice(["legacy", "pump"]), default=None, hidden=True)
+def main(megabytes, impl):
+    if impl:
+        measure(impl, megabytes)
+        return
+    print(f"{megabytes} MB of output, console echo to /dev/null")
+    print(f"{'impl':<8} {'wall s':>8} {'cpu s':>8} {'peak RSS MB':>12}")
+    for name in ("legacy", "pump"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--megabytes", str(megabytes), "--impl", name],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{name:<8} {result['wall_seconds']:>8.2f} {result['cpu_seconds']:>8.2f} "
+            f"{result['max_rss_mb']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
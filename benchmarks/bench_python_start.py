@@ -0,0 +1,77 @@
+"""Script-start latency of run_python: cold interpreter versus warm pool.
+
+    python benchmarks/bench_python_start.py --modules numpy,torch --runs 20
+
+The script imports `--modules` and exits, so the measured time is what a
+run_python call spends before user code starts doing real work. "cold" is
+`python -u script.py` as run_python did before; "warm" forks it from a
+WarmPool that preloaded the same modules (server start-up is reported
+separately, it happens once per worker while the model is thinking).
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+import subprocess
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agent.tools.python.warm_pool import WarmPool  # noqa: E402
+
+
+def cold(path):
+    process = subprocess.Popen([sys.executable, "-u", path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    process.communicate()
+    return process.returncode
+
+
+def warm(pool, path):
+    process = pool.spawn(path)
+    process.stdout.read()
+    process.stderr.read()
+    process.stdout.close()
+    process.stderr.close()
+    return process.wait()
+
+
+def summarize(name, seconds):
+    seconds = sorted(seconds)
+    p90 = seconds[int(0.9 * (len(seconds) - 1))]
+    print(
+        f"{name:<6} {statistics.median(seconds) * 1000:>10.1f} {p90 * 1000:>10.1f} "
+        f"{min(seconds) * 1000:>10.1f}"
+    )
+
+
+@click.command()
+@click.option("--modules", default="numpy", help="Comma-separated modules the script imports.")
+@click.option("--runs", default=20, help="Scripts started per mode.")
+def main(modules, runs):
+    modules = [name for name in modules.split(",") if name]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "script.py")
+        with open(path, "w") as script:
+            script.write("".join(f"import {name}\n" for name in modules))
+            script.write("print('ready')\n")
+
+        start = time.perf_counter()
+        pool = WarmPool(modules)
+        pool.start()
+        warm(pool, path)
+        print(f"warm pool start-up (once): {(time.perf_counter() - start) * 1000:.0f} ms, preloaded {pool.info['modules']}")
+
+        print(f"{'mode':<6} {'median ms':>10} {'p90 ms':>10} {'min ms':>10}")
+        for name, run in (("cold", lambda: cold(path)), ("warm", lambda: warm(pool, path))):
+            seconds = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                assert run() == 0
+                seconds.append(time.perf_counter() - start)
+            summarize(name, seconds)
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
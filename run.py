@@ -1,4 +1,11 @@
 from agent.supervisor import Supervisor
+from agent.models.response_cache import configure_response_cache
+from agent.portfolio import PlanPortfolio
+from agent.batch import BatchRunner
+from agent.memory import AgentMemory
+from agent.tools.accounting import summarize_usage
+from agent.tools.output_capture import format_size
+import os
 import time
 import random
 from rich import print
@@ -22,6 +29,26 @@ def print_markdown_table(results):
     print(table)
     
     
+def tool_usage_rows(supervisor_result):
+    """Summary rows of the resources used by tool processes, read from the memory table."""
+    run_ids = [supervisor_result.get('run_number')]
+    run_ids += [outcome['run_id'] for outcome in supervisor_result.get("portfolio", [])]
+    try:
+        usage = summarize_usage(AgentMemory().resource_usage(run_ids))
+    except Exception as e:
+        print(f"Could not read tool resource usage: {e}")
+        return []
+    if not usage["tool_executions"]:
+        return []
+    return [
+        ("Tool Executions", usage["tool_executions"]),
+        ("Tool Wall / CPU Seconds", f"{usage['wall_seconds']:.1f} / {usage['cpu_seconds']:.1f}"),
+        ("Peak Tool Memory", format_size(usage["peak_rss_bytes"])),
+        ("Tool Output", format_size(usage["output_bytes"])),
+        ("Tools Killed by Limits", usage["killed"]),
+    ]
+
+
 def parse_json(input_string):
     # Use a regular expression to find the JSON part of the string
     json_match = re.search(r'\{.*\}', input_string)
@@ -39,9 +66,17 @@ def pretty_task(content):
         return f"[yellow] {content}"
     
     
-def run_task(prompt, provider="openai"):
+def run_task(
+    prompt,
+    provider="openai",
+    history_mode=False,
+    streaming=False,
+    run_id=None,
+    portfolio=None,
+):
     user_id = 1
-    run_id = random.getrandbits(32)
+    if run_id is None:
+        run_id = random.getrandbits(32)
     
     user_renderables = [
         Panel(pretty_task(prompt), expand=True),
@@ -50,7 +85,9 @@ def run_task(prompt, provider="openai"):
                 
     
     supervisor = Supervisor()
-    supervisor_result = supervisor.run(user_id, run_id, prompt, provider)
+    supervisor_result = supervisor.run(
+        user_id, run_id, prompt, provider, history_mode, streaming, portfolio
+    )
 
     return supervisor_result
 
@@ -65,35 +102,93 @@ default_prompt = """
 Train a multilayer perceptron on the MNIST dataset in PyTorch.
 """
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option('--prompt', type=str, help='The prompt to run', default=default_prompt)
 @click.option('--provider', type=click.Choice(['openai', 'anthropic']), default='openai', help='The provider to use')
-def main(prompt, provider):
+@click.option('--history/--no-history', default=False, help='Keep a multi-turn message history with provider prompt caching')
+@click.option('--stream/--no-stream', default=False, help='Stream responses and start tools as soon as each call is complete (implies --history)')
+@click.option('--cache-mode', type=click.Choice(['off', 'record', 'replay']), default=None, help='LLM response cache: record to disk, or replay recorded responses with no network')
+@click.option('--cache-dir', type=str, default=None, help='Directory of the LLM response cache')
+@click.option('--run-id', type=int, default=None, help='Fixed run ID (working directory), e.g. to replay a recorded run')
+@click.option('--portfolio/--no-portfolio', default=False, help='Run each alternative plan in its own worker process')
+@click.option('--max-concurrency', type=int, default=None, help='Maximum portfolio workers running at once (default: CPU count)')
+@click.option('--portfolio-strategy', type=click.Choice(['first', 'best']), default='first', help='first: first submission wins; best: best reported metric wins')
+@click.option('--metric-goal', type=click.Choice(['max', 'min']), default='max', help='Whether a higher or lower metric is better for --portfolio-strategy best')
+@click.pass_context
+def main(ctx, prompt, provider, history, stream, cache_mode, cache_dir, run_id, portfolio, max_concurrency, portfolio_strategy, metric_goal):
+    # Exported so worker subprocesses pick up the same cache settings.
+    if cache_mode:
+        os.environ["AGENT_RESPONSE_CACHE"] = cache_mode
+    if cache_dir:
+        os.environ["AGENT_RESPONSE_CACHE_DIR"] = cache_dir
+    response_cache = configure_response_cache()
+
+    if ctx.invoked_subcommand is not None:
+        return
+
     start = time.time()
 
-    supervisor_result = run_task(prompt, provider)
+    plan_portfolio = None
+    if portfolio:
+        plan_portfolio = PlanPortfolio(
+            max_concurrency=max_concurrency,
+            strategy=portfolio_strategy,
+            maximize=metric_goal == 'max',
+        )
+
+    supervisor_result = run_task(
+        prompt, provider, history or stream, stream, run_id, plan_portfolio
+    )
     
     end = time.time()
     
+    if not isinstance(supervisor_result, dict):
+        supervisor_result = {"result": supervisor_result}
     print(supervisor_result['result'])
     
-    result = parse_json(str(supervisor_result['result']))
+    try:
+        result = parse_json(str(supervisor_result['result']))
+    except json.JSONDecodeError:
+        result = None
+    submission = (result or {}).get('subtask_result') or {}
+    if not isinstance(submission, dict):
+        submission = {}
+    usage_rows = tool_usage_rows(supervisor_result)
 
     try:
-        print(f"Plan: {supervisor_result['plan']}")
+        print(f"Plan: {supervisor_result.get('plan')}")
         
         table = Table(title="Task Complete!!!")
         table.add_column("Mertic", justify="right", style="cyan")
         table.add_column("Value", style="magenta")
         
-        table.add_row("Run ID", str(supervisor_result['run_number']))
-        table.add_row("Submission", str(result['subtask_result']['submission']))
-        table.add_row("Model Path", str(result['subtask_result']['model_path']))
-        table.add_row("Total Tokens", str(supervisor_result['total_tokens']))
-        table.add_row("Total Turns", str(supervisor_result['total_turns']))
+        table.add_row("Run ID", str(supervisor_result.get('run_number')))
+        table.add_row("Submission", str(submission.get('submission')))
+        table.add_row("Model Path", str(submission.get('model_path')))
+        table.add_row("Total Tokens", str(supervisor_result.get('total_tokens')))
+        table.add_row("Total Turns", str(supervisor_result.get('total_turns')))
+        for metric, value in usage_rows:
+            table.add_row(metric, str(value))
+        for outcome in supervisor_result.get("portfolio", []):
+            table.add_row(
+                f"Plan {outcome['worker_number']} (run {outcome['run_id']})",
+                str(outcome['submission']),
+            )
+        if response_cache.enabled:
+            table.add_row(
+                "Response Cache Hits / Misses",
+                f"{response_cache.metrics['hits']} / {response_cache.metrics['misses']}",
+            )
+        if "cache_read_tokens" in supervisor_result:
+            table.add_row("Cached Prompt Tokens", str(supervisor_result['cache_read_tokens']))
         table.add_row("Time Taken in Seconds", str(end - start))
         table.add_row("Time Taken in Minutes", str((end - start) / 60))
         table.add_row("Time Taken in Hours", str((end - start) / 3600))
+        for provider, stats in supervisor_result.get("connection_stats", {}).items():
+            table.add_row(
+                f"{provider} Requests / Connections",
+                f"{stats['requests']} / {stats['connections_opened']}",
+            )
 
         console = Console()
         console.print(table)
@@ -104,11 +199,12 @@ def main(prompt, provider):
         
         
     print_markdown_table([
-        ("Run ID", supervisor_result['run_number']),
-        ("Submission", result['subtask_result']['submission']),
-        ("Model Path", result['subtask_result']['model_path']),
-        ("Total Tokens", supervisor_result['total_tokens']),
-        ("Total Turns", supervisor_result['total_turns']),
+        ("Run ID", supervisor_result.get('run_number')),
+        ("Submission", submission.get('submission')),
+        ("Model Path", submission.get('model_path')),
+        ("Total Tokens", supervisor_result.get('total_tokens')),
+        ("Total Turns", supervisor_result.get('total_turns')),
+        *usage_rows,
         ("Time Taken in Seconds", end - start),
         ("Time Taken in Minutes", (end - start) / 60),
         ("Time Taken in Hours", (end - start) / 3600),
@@ -118,5 +214,54 @@ def main(prompt, provider):
     print("Task complete")
 
 
+"""
+Example:
+
+python3 run.py batch --tasks tasks.jsonl --output results.jsonl --max-concurrency 4
+
+Each line of tasks.jsonl is {"task_id": "...", "prompt": "...", "provider": "openai"};
+provider is optional. Re-running the same command skips completed tasks.
+"""
+
+@main.command()
+@click.option('--tasks', 'tasks_path', type=click.Path(exists=True, dir_okay=False), required=True, help='JSONL file of tasks')
+@click.option('--output', 'output_path', type=click.Path(dir_okay=False), required=True, help='JSONL file that per-task results are appended to')
+@click.option('--max-concurrency', type=int, default=1, help='Number of tasks to run at once')
+@click.option('--provider', type=click.Choice(['openai', 'anthropic']), default='openai', help='Default provider for tasks that do not set one')
+@click.option('--history/--no-history', default=False, help='Keep a multi-turn message history with provider prompt caching')
+@click.option('--stream/--no-stream', default=False, help='Stream responses and start tools early (implies --history)')
+@click.option('--log-dir', type=click.Path(file_okay=False), default=None, help='Write each task\'s console output to <log-dir>/<task_id>.log')
+def batch(tasks_path, output_path, max_concurrency, provider, history, stream, log_dir):
+    start = time.time()
+    runner = BatchRunner(
+        tasks_path,
+        output_path,
+        max_concurrency=max_concurrency,
+        options={"provider": provider, "history_mode": history or stream, "streaming": stream},
+        log_dir=log_dir,
+    )
+    records = runner.run()
+    end = time.time()
+
+    table = Table(title="Batch Complete!!!")
+    table.add_column("Task", justify="right", style="cyan")
+    table.add_column("Status", style="magenta")
+    table.add_column("Submission", style="magenta")
+    table.add_column("Tokens", style="magenta")
+    table.add_column("Turns", style="magenta")
+    table.add_column("Seconds", style="magenta")
+    for record in records:
+        table.add_row(
+            str(record["task_id"]),
+            record["status"],
+            str(record.get("submission")),
+            str(record.get("total_tokens")),
+            str(record.get("total_turns")),
+            f"{record.get('wall_time_seconds', 0):.1f}",
+        )
+    console.print(table)
+    print(f"Batch wall time: {end - start:.1f} seconds")
+
+
 if __name__ == "__main__":
     main()
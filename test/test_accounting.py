@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import subprocess
+import pytest
+from agent.tools.accounting import (
+    ResourceMonitor,
+    merge_usage,
+    process_times,
+    session_rss,
+    summarize_usage,
+)
+from agent.tools.context import set_run_context
+from agent.tools.python.python_tool import PythonRunnerActor
+from agent.tools.bash.shell_session import ShellSession
+from agent.tools.limits import ToolLimits, kill_process_group
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("AGENT_ACCOUNTING_INTERVAL", "0.05")
+    monkeypatch.setenv("AGENT_PYTHON_WARM_POOL", "0")
+    set_run_context(1, str(tmp_path))
+    yield tmp_path
+    set_run_context(None, None)
+
+
+def test_session_rss_covers_the_process_tree():
+    process = subprocess.Popen(
+        ["bash", "-c", "sleep 5 & sleep 5 & wait"], start_new_session=True
+    )
+    try:
+        monitor = ResourceMonitor(interval=0.05).start(process.pid)
+        assert session_rss(process.pid) > 0
+        assert process_times(process.pid) is not None
+        # A few samples, so the forked sleeps are counted at least once.
+        time.sleep(0.3)
+        rss = session_rss(process.pid)
+        usage = monitor.usage()
+        assert usage["peak_rss_bytes"] >= rss > 0
+    finally:
+        kill_process_group(process.pid)
+        process.wait()
+
+
+def test_python_tool_reports_resources(run_dir):
+    (run_dir / "work.py").write_text(
+        "import time\n"
+        "block = bytearray(200 * 1024 * 1024)\n"
+        "end = time.process_time() + 0.5\n"
+        "while time.process_time() < end: pass\n"
+        "print('x' * 99)\n"
+    )
+    result = PythonRunnerActor(ToolLimits(wall_timeout=60)).execute_python_code("work.py")
+    resources = result["resources"]
+    assert resources["exit_reason"] == "completed"
+    assert resources["cpu_user_seconds"] + resources["cpu_system_seconds"] >= 0.4
+    assert resources["wall_seconds"] >= 0.4
+    assert resources["peak_rss_bytes"] > 200 * 1024 * 1024
+    assert resources["output_bytes"] == 100
+
+
+def test_shell_commands_are_measured_separately(run_dir):
+    session = ShellSession(cwd=str(run_dir), limits=ToolLimits(wall_timeout=30))
+    try:
+        busy = f"{sys.executable} -c \"import time\nend = time.process_time() + 0.5\nwhile time.process_time() < end: pass\""
+        first = session.run(busy, echo=False)["resources"]
+        second = session.run("echo done", echo=False)["resources"]
+        assert first["cpu_user_seconds"] + first["cpu_system_seconds"] >= 0.4
+        assert second["cpu_user_seconds"] + second["cpu_system_seconds"] < 0.2
+        assert second["output_bytes"] == 5
+
+        killed = session.run("sleep 30", timeout=0.5, echo=False)["resources"]
+        assert killed["exit_reason"] == "wall_timeout" and killed["wall_seconds"] < 5
+    finally:
+        session.close()
+
+
+def test_summaries():
+    rows = [
+        {"wall_seconds": 2.0, "cpu_user_seconds": 1.0, "cpu_system_seconds": 0.5,
+         "peak_rss_bytes": 100, "output_bytes": 10, "exit_reason": "completed"},
+        {"wall_seconds": 60.0, "cpu_user_seconds": None, "cpu_system_seconds": None,
+         "peak_rss_bytes": 300, "output_bytes": 5, "exit_reason": "wall_timeout"},
+        dict.fromkeys(("wall_seconds", "exit_reason")),  # a step that ran no process
+    ]
+    assert summarize_usage(rows) == {
+        "tool_executions": 2,
+        "wall_seconds": 62.0,
+        "cpu_seconds": 1.5,
+        "peak_rss_bytes": 300,
+        "output_bytes": 15,
+        "killed": 1,
+    }
+    merged = merge_usage([rows[0], None, rows[1]])
+    assert merged["wall_seconds"] == 62.0 and merged["cpu_user_seconds"] == 1.0
+    assert (merged["peak_rss_bytes"], merged["exit_reason"]) == (300, "wall_timeout")
+    assert merge_usage([None, {}]) is None
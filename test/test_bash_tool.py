@@ -0,0 +1,141 @@
+import os
+import time
+import pytest
+from agent.tools.bash.shell_session import ShellSession, close_shell_session
+from agent.tools.bash.bash_tool import BashRunnerActor, run_bash
+from agent.tools.context import set_run_context
+from agent.tools.output_capture import OutputCapture
+from agent.tools.python.python_tool import PythonRunnerActor, run_python
+from agent.tools.python_cell.kernel import close_kernel
+from agent.tools.python_cell.python_cell_tool import run_python_cell
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = ShellSession(cwd=str(tmp_path))
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def run_dir(tmp_path):
+    set_run_context(1, str(tmp_path))
+    yield tmp_path
+    set_run_context(None, None)
+
+
+def test_state_persists_between_commands(session, tmp_path):
+    (tmp_path / "sub").mkdir()
+    assert session.run("cd sub && export GREETING=hello", echo=False)["returncode"] == 0
+    outcome = session.run("pwd; echo $GREETING", echo=False)
+    assert (outcome["returncode"], outcome["status"]) == (0, "completed")
+    assert outcome["stdout"] == f"{tmp_path / 'sub'}\nhello\n"
+    assert session.metrics["spawns"] == 1 and session.metrics["commands"] == 2
+
+
+def test_python_tools_follow_the_session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    set_run_context("follow", str(tmp_path))
+    (tmp_path / "exp").mkdir()
+    (tmp_path / "exp" / "train.py").write_text("import os\nprint(os.getcwd(), os.environ['LR'])\n")
+    cell = "import os\nprint(os.getcwd(), os.environ.get('LR'))"
+    try:
+        assert run_bash({"script": "cd exp && export LR=0.1"})["returncode"] == 0
+        assert run_python({"filepath": "train.py"})["stdout"] == f"{tmp_path / 'exp'} 0.1\n"
+        assert run_python_cell({"cell": cell})["stdout"] == f"{tmp_path / 'exp'} 0.1\n"
+
+        assert run_bash({"script": "cd .. && unset LR"})["returncode"] == 0
+        assert run_python_cell({"cell": cell})["stdout"] == f"{tmp_path} None\n"
+        assert run_python({"filepath": "exp/train.py"})["status"] == "failure"
+    finally:
+        close_kernel("follow")
+        close_shell_session("follow")
+        set_run_context(None, None)
+
+
+@pytest.mark.skipif(not os.path.exists("/bin/sh"), reason="needs /bin/sh")
+def test_posix_shell_fallback(tmp_path):
+    session = ShellSession(cwd=str(tmp_path), shell="/bin/sh")
+    try:
+        assert session.run("export GREETING=hello", echo=False)["returncode"] == 0
+        outcome = session.run("echo $GREETING", echo=False)
+        assert (outcome["returncode"], outcome["stdout"]) == (0, "hello\n")
+    finally:
+        session.close()
+
+
+def test_exit_codes_and_partial_lines(session):
+    outcome = session.run("printf 'no newline'; echo oops >&2; false", echo=False)
+    assert outcome["returncode"] == 1
+    assert outcome["stdout"] == "no newline"
+    assert outcome["stderr"] == "oops\n"
+    # stdin is /dev/null, so a command reading it cannot eat the next command.
+    assert session.run("cat; echo after", echo=False)["stdout"] == "after\n"
+
+
+def test_timeout_kills_process_group_and_restarts(session):
+    start = time.monotonic()
+    outcome = session.run("sleep 30 & sleep 30", timeout=0.5, echo=False)
+    assert outcome["status"] == "timeout" and outcome["returncode"] is None
+    assert time.monotonic() - start < 5
+    assert session.run("echo back", echo=False)["stdout"] == "back\n"
+    assert session.metrics["restarts"] == 1 and session.metrics["timeouts"] == 1
+
+
+def test_exit_restarts_session(session):
+    outcome = session.run("exit 3", echo=False)
+    assert (outcome["returncode"], outcome["status"]) == (3, "shell_exited")
+    assert session.run("echo alive", echo=False)["stdout"] == "alive\n"
+
+
+def test_bash_runner_result(session):
+    result = BashRunnerActor(timeout=10, session=session).run("echo hi; exit 2")
+    assert result["status"] == "failure" and result["returncode"] == 2
+    assert result["stdout"] == "hi\n"
+    assert "new session" in result["stderr"]
+
+
+def test_output_capture_is_bounded_and_spills(run_dir):
+    capture = OutputCapture("run_bash", "stdout", head_bytes=100, tail_bytes=200)
+    lines = [f"line {idx}\n".encode() for idx in range(10000)]
+    for line in lines:
+        capture.write(line)
+    capture.close()
+
+    assert len(capture.head) == 100 and len(capture.tail) <= 400
+    stats = capture.stats()
+    assert stats["truncated"] and stats["lines"] == 10000
+    assert stats["bytes"] == sum(map(len, lines))
+    assert os.path.dirname(stats["log_path"]) == str(run_dir / ".tool_logs")
+    with open(stats["log_path"], "rb") as log:
+        assert log.read() == b"".join(lines)
+    text = capture.text()
+    assert text.startswith("line 0\n") and text.endswith("line 9999\n")
+    assert stats["log_path"] in text and "10000 lines" in text
+
+
+def test_small_output_stays_in_memory(run_dir):
+    capture = OutputCapture("run_bash", "stdout")
+    capture.write(b"short\n")
+    capture.close()
+    assert capture.text() == "short\n"
+    assert capture.stats()["log_path"] is None
+    assert not (run_dir / ".tool_logs").exists() or not os.listdir(run_dir / ".tool_logs")
+
+
+def test_long_output_is_truncated_in_tool_results(session, run_dir, monkeypatch):
+    monkeypatch.setenv("AGENT_OUTPUT_HEAD_BYTES", "1000")
+    monkeypatch.setenv("AGENT_OUTPUT_TAIL_BYTES", "1000")
+    result = BashRunnerActor(timeout=30, session=session).run("seq 1 200000")
+    assert result["returncode"] == 0
+    stats = result["output_stats"]["stdout"]
+    assert stats["truncated"] and stats["lines"] == 200000
+    assert result["stdout"].rstrip().endswith("200000")
+    assert len(result["stdout"]) < 3000
+
+    script = run_dir / "chatty.py"
+    script.write_text("for i in range(100000):\n    print('batch', i)\n")
+    result = PythonRunnerActor().execute_python_code(str(script))
+    assert result["status"] == "success"
+    assert result["output_stats"]["stdout"]["truncated"]
+    assert "batch 99999" in result["stdout"]
@@ -0,0 +1,50 @@
+import json
+from unittest.mock import patch
+from agent.batch import load_tasks, load_completed, run_batch_task
+
+
+def test_load_tasks_assigns_ids(tmp_path):
+    tasks_path = tmp_path / "tasks.jsonl"
+    tasks_path.write_text(
+        json.dumps({"task_id": 7, "prompt": "a"}) + "\n\n" + json.dumps({"prompt": "b"}) + "\n"
+    )
+    tasks = load_tasks(str(tasks_path))
+    assert [task["task_id"] for task in tasks] == ["7", "3"]
+
+
+def test_load_completed_skips_failed_and_partial_lines(tmp_path):
+    output_path = tmp_path / "results.jsonl"
+    output_path.write_text(
+        json.dumps({"task_id": "1", "status": "completed"})
+        + "\n"
+        + json.dumps({"task_id": "2", "status": "failed"})
+        + "\n"
+        + '{"task_id": "3", "sta'
+    )
+    assert load_completed(str(output_path)) == {"1"}
+    assert load_completed(str(tmp_path / "missing.jsonl")) == set()
+
+
+@patch("agent.batch.Supervisor")
+def test_run_batch_task_record(mock_supervisor, tmp_path):
+    mock_supervisor.return_value.run.return_value = {
+        "result": str({"subtask_result": {"tool": "return_fn", "submission": "0.97", "model_path": "m.pt"}}),
+        "total_tokens": 1200,
+        "total_turns": "8",
+    }
+    record = run_batch_task(
+        {"task_id": "1", "prompt": "train"}, {"provider": "anthropic"}, str(tmp_path / "logs")
+    )
+    assert record["status"] == "completed"
+    assert record["submission"] == "0.97"
+    assert record["total_turns"] == 8
+    assert record["provider"] == "anthropic"
+    assert (tmp_path / "logs" / "1.log").exists()
+
+
+@patch("agent.batch.Supervisor")
+def test_run_batch_task_failure(mock_supervisor):
+    mock_supervisor.return_value.run.side_effect = RuntimeError("boom")
+    record = run_batch_task({"task_id": "1", "prompt": "train"}, {})
+    assert record["status"] == "failed"
+    assert "boom" in record["error"]
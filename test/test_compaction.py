@@ -0,0 +1,89 @@
+import os
+import pytest
+from agent.compaction import (
+    OutputCompactor,
+    collapse_repeated_lines,
+    fold_carriage_returns,
+    fold_progress_lines,
+)
+
+
+class CharEncoding:
+    """One token per character keeps budgets easy to reason about."""
+
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture
+def compactor(tmp_path):
+    return OutputCompactor(
+        log_dir=str(tmp_path / ".outputs"),
+        budgets={"output": 200, "memory_output": 50},
+        encoding=CharEncoding(),
+    )
+
+
+def test_fold_carriage_returns():
+    assert fold_carriage_returns("a\rb\rdone\nnext") == ["done", "next"]
+
+
+def test_fold_progress_lines():
+    lines = [f" {pct}%|####| {pct}/100" for pct in range(0, 101, 10)] + ["Accuracy: 0.98"]
+    folded = fold_progress_lines(lines)
+    assert folded == [" 100%|####| 100/100", "[10 progress updates folded]", "Accuracy: 0.98"]
+
+
+def test_collapse_repeated_lines():
+    lines = ["warning: x"] * 4 + ["ok"]
+    assert collapse_repeated_lines(lines) == [
+        "warning: x",
+        "[previous line repeated 3 more times]",
+        "ok",
+    ]
+
+
+def test_short_output_is_untouched(compactor):
+    assert compactor.compact("epoch 1 loss 0.5") == "epoch 1 loss 0.5"
+    assert compactor.start_turn() == 0
+
+
+def test_head_tail_keeps_error_and_saves_full_output(compactor):
+    text = "\n".join(f"step {idx} loss {idx * 0.01:.2f}" for idx in range(200))
+    text += "\nTraceback: ValueError: bad shape"
+    compacted = compactor.compact(text)
+
+    assert len(compacted) < 200 + 150  # budget plus the omission marker
+    assert compacted.startswith("step 0")
+    assert compacted.endswith("ValueError: bad shape")
+    assert "tokens omitted; full output:" in compacted
+    logs = os.listdir(compactor.log_dir)
+    assert len(logs) == 1
+    with open(os.path.join(compactor.log_dir, logs[0])) as file:
+        assert file.read() == text
+    assert compactor.start_turn() == len(text) - len(compacted)
+    assert compactor.start_turn() == 0
+
+
+def test_omitted_count_matches_what_was_dropped(compactor):
+    text = "\n".join(f"line {idx:03d} " + "x" * 20 for idx in range(100))
+    compacted = compactor.compact(text)
+    head, rest = compacted.split("\n... [", 1)
+    marker, tail = rest.split("] ...\n", 1)
+    omitted = int(marker.split(" tokens omitted")[0])
+    assert omitted == len(text) - len(head) - len(tail)
+
+
+def test_memory_compaction_does_not_write_logs(compactor):
+    compactor.compact_memory("x\n" * 500, "output")
+    assert not os.path.exists(compactor.log_dir)
+
+
+def test_compact_result_only_touches_output_fields(compactor):
+    result = {"tool": "run_bash", "status": "success", "stdout": "y\n" * 300, "stderr": ""}
+    compacted = compactor.compact_result(result)
+    assert compacted["tool"] == "run_bash"
+    assert len(compacted["stdout"]) < len(result["stdout"])
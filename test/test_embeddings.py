@@ -0,0 +1,47 @@
+import sys
+import threading
+import types
+import pytest
+import agent.embeddings as embeddings
+
+
+@pytest.fixture
+def fake_sentence_transformers(monkeypatch):
+    loads = []
+
+    class FakeSentenceTransformer:
+        def __init__(self, name):
+            loads.append(name)
+            self.name = name
+
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = FakeSentenceTransformer
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    monkeypatch.setattr(embeddings, "_encoder", None)
+    return loads
+
+
+def test_encoder_is_lazy_and_shared(fake_sentence_transformers, monkeypatch):
+    monkeypatch.delenv("AGENT_ENCODER_PATH", raising=False)
+    monkeypatch.delenv("AGENT_ENCODER_MODEL", raising=False)
+    assert not embeddings.encoder_loaded()
+
+    encoders = []
+    threads = [
+        threading.Thread(target=lambda: encoders.append(embeddings.get_encoder()))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fake_sentence_transformers == ["all-MiniLM-L6-v2"]
+    assert all(encoder is encoders[0] for encoder in encoders)
+
+
+def test_offline_encoder_path(fake_sentence_transformers, monkeypatch, tmp_path):
+    monkeypatch.setenv("AGENT_ENCODER_PATH", str(tmp_path))
+    monkeypatch.delenv("HF_HUB_OFFLINE", raising=False)
+    assert embeddings.get_encoder().name == str(tmp_path)
+    assert embeddings.os.environ["HF_HUB_OFFLINE"] == "1"
@@ -0,0 +1,123 @@
+import os
+import pytest
+from agent.tools.context import set_run_context
+from agent.tools.exec_cache import ExecCache, bash_inputs, get_exec_cache, python_inputs
+from agent.tools.python.python_tool import run_python
+from agent.tools.bash.bash_tool import BashRunnerActor, run_bash
+from agent.tools.bash.shell_session import ShellSession, close_shell_session
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+    monkeypatch.chdir(run_dir)
+    monkeypatch.setenv("AGENT_EXEC_CACHE", "1")
+    set_run_context(1, str(run_dir))
+    yield run_dir
+    close_shell_session(1)
+    set_run_context(None, None)
+
+
+@pytest.fixture
+def script(run_dir, tmp_path, monkeypatch):
+    (run_dir / "data.txt").write_text("0.91")
+    script = run_dir / "evaluate.py"
+    # Counts executions in a file the script does not name, so it is not an input.
+    monkeypatch.setenv("RUNS_FILE", str(tmp_path / "runs"))
+    script.write_text(
+        "import os\n"
+        "with open(os.environ['RUNS_FILE'], 'a') as runs: runs.write('.')\n"
+        "accuracy = open('data.txt').read()\n"
+        "open('metrics.txt', 'w').write(accuracy)\n"
+        "print('accuracy', accuracy)\n"
+    )
+    return script
+
+
+def executions(tmp_path):
+    return len((tmp_path / "runs").read_text())
+
+
+def test_python_results_are_reused_until_inputs_change(script, run_dir, tmp_path):
+    first = run_python({"filepath": "evaluate.py"})
+    assert first["stdout"] == "accuracy 0.91\n" and "cached" not in first
+    second = run_python({"filepath": "evaluate.py"})
+    assert second["cached"] is True
+    assert (second["stdout"], second["returncode"]) == (first["stdout"], first["returncode"])
+    assert executions(tmp_path) == 1
+
+    (run_dir / "data.txt").write_text("0.93")
+    assert run_python({"filepath": "evaluate.py"})["stdout"] == "accuracy 0.93\n"
+    assert executions(tmp_path) == 2
+
+    # The run's output is gone, so it has to run again to recreate it.
+    (run_dir / "metrics.txt").unlink()
+    assert "cached" not in run_python({"filepath": "evaluate.py"})
+    assert (run_dir / "metrics.txt").read_text() == "0.93"
+
+    assert "cached" not in run_python({"filepath": "evaluate.py", "no_cache": True})
+    assert executions(tmp_path) == 4
+    assert get_exec_cache().metrics["hits"] == 1
+
+
+def test_bash_commands(run_dir, script, tmp_path):
+    session = ShellSession(cwd=str(run_dir))
+    actor = BashRunnerActor(session=session)
+    cache = get_exec_cache()
+    try:
+        def run(command):
+            return cache.run("run_bash", command, session.current_dir, bash_inputs(command, session.current_dir), lambda: actor.run(command))
+
+        assert run("python evaluate.py")["stdout"] == "accuracy 0.91\n"
+        assert run("python evaluate.py")["cached"] is True
+        assert executions(tmp_path) == 1
+        (run_dir / "sub").mkdir()
+        run("cd sub")
+        assert session.current_dir == str(run_dir / "sub")
+        assert "cached" not in run("cd ..")
+        assert cache.metrics["uncacheable"] == 2
+    finally:
+        session.close()
+
+
+def test_bash_results_depend_on_the_session_state(run_dir):
+    import agent.tools.bash.shell_session as shell_session
+
+    set_run_context("session-state", str(run_dir))
+    (run_dir / "show.py").write_text("import os\nprint(os.environ.get('LR'))\n")
+    try:
+        assert run_bash({"script": "python show.py"})["stdout"] == "None\n"
+        assert run_bash({"script": "python show.py"})["cached"] is True
+        run_bash({"script": "export LR=0.1"})
+        assert run_bash({"script": "python show.py"})["stdout"] == "0.1\n"
+        # Plain shell variables count too, not only exported ones.
+        run_bash({"script": "EPOCHS=3"})
+        result = run_bash({"script": "echo epochs $EPOCHS"})
+        assert result["stdout"] == "epochs 3\n" and "cached" not in result
+    finally:
+        shell_session._sessions.pop("session-state").close()
+
+
+def test_input_detection(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "helpers.py").write_text("LABELS = 'labels.json'\n")
+    (tmp_path / "labels.json").write_text("{}")
+    (tmp_path / "train.py").write_text("import helpers\nimport os\nos.listdir('data')\nprint('.')\n")
+    expected = {str(tmp_path / name) for name in ("train.py", "helpers.py", "labels.json", "data")}
+    assert python_inputs("train.py", str(tmp_path)) == expected
+    assert bash_inputs("CUDA_VISIBLE_DEVICES=0 python train.py | tee log.txt", str(tmp_path)) == expected
+    assert bash_inputs("python train.py\npip install torch", str(tmp_path)) is None
+    assert bash_inputs("echo 'unterminated", str(tmp_path)) is None
+
+
+def test_lru_eviction(tmp_path):
+    cache = ExecCache(str(tmp_path / ".exec_cache"), max_entries=2)
+    for idx, key in enumerate("abc"):
+        cache.put(key, {"stdout": key}, {}, {})
+        os.utime(cache._path(key), (idx, idx))
+        if key == "b":
+            assert cache.get("a")["stdout"] == "a"  # a becomes the most recently used
+    assert cache.get("b") is None
+    assert cache.get("a")["cached"] and cache.get("c")["cached"]
+    assert cache.metrics["evictions"] == 1
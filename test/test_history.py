@@ -0,0 +1,58 @@
+import pytest
+from agent.models.history import ConversationHistory, anthropic_cached_tools
+
+
+@pytest.fixture
+def history():
+    history = ConversationHistory(max_tokens=1000, count_tokens=len)
+    history.add_user_text("Your goal is to: train a model")
+    history.add_assistant(
+        "", [{"id": "call_1", "name": "run_bash", "input": {"script": "ls"}}]
+    )
+    history.add_tool_results(
+        [{"id": "call_1", "name": "run_bash", "content": "status: success"}],
+        text="Time spent: 1.00 minutes.",
+    )
+    return history
+
+
+def test_to_anthropic(history):
+    messages = history.to_anthropic()
+    assert [m["role"] for m in messages] == ["user", "assistant", "user"]
+    assert messages[1]["content"] == [
+        {"type": "tool_use", "id": "call_1", "name": "run_bash", "input": {"script": "ls"}}
+    ]
+    assert messages[2]["content"][0]["type"] == "tool_result"
+    assert messages[2]["content"][0]["tool_use_id"] == "call_1"
+    # Only the newest block carries the moving cache breakpoint.
+    assert messages[2]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in messages[0]["content"][0]
+    assert "cache_control" not in history.messages[-1]
+
+
+def test_to_openai(history):
+    messages = history.to_openai("system prompt")
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "tool", "user"]
+    assert messages[2]["tool_calls"][0]["function"]["arguments"] == '{"script": "ls"}'
+    assert messages[3]["tool_call_id"] == "call_1"
+
+
+def test_trim_keeps_task_message_and_pairs(history):
+    for idx in range(20):
+        history.add_assistant(
+            "", [{"id": f"call_{idx}", "name": "thought", "input": {"thought": "x" * 50}}]
+        )
+        history.add_tool_results(
+            [{"id": f"call_{idx}", "name": "thought", "content": "y" * 50}]
+        )
+    assert history.trim()
+    assert history.messages[0]["text"] == "Your goal is to: train a model"
+    assert history.messages[1]["role"] == "assistant"
+    assert history.trim() is False
+
+
+def test_anthropic_cached_tools():
+    tools = [{"name": "a"}, {"name": "b"}]
+    cached = anthropic_cached_tools(tools)
+    assert cached[-1]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in tools[-1]
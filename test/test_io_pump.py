@@ -0,0 +1,91 @@
+import io
+import os
+import subprocess
+import sys
+import time
+from agent.tools.context import set_run_context
+from agent.tools.io_pump import TerminalCleaner, RateLimitedEcho, OutputPump, SentinelReader
+
+
+def clean(chunks):
+    cleaner = TerminalCleaner()
+    return "".join(cleaner.feed(chunk) for chunk in chunks) + cleaner.feed(b"", final=True)
+
+
+def test_progress_bar_redraws_fold_to_final_state():
+    bar = b"".join(f"\r{pct:3d}%|{'#' * (pct // 10)}|".encode() for pct in range(0, 101, 5))
+    assert clean([b"start\n", bar, b"\n", b"done\n"]) == "start\n100%|##########|\ndone\n"
+
+
+def test_split_escape_sequences_crlf_and_utf8():
+    data = "\x1b[32mgreen\x1b[0m line\r\nnext été\n".encode()
+    # Every possible split point, including inside the escape and the UTF-8 bytes.
+    for split in range(1, len(data)):
+        assert clean([data[:split], data[split:]]) == "green line\nnext été\n"
+
+
+def test_partial_last_line_is_flushed():
+    assert clean([b"no newline"]) == "no newline"
+
+
+def test_echo_is_rate_limited():
+    out = io.StringIO()
+    echo = RateLimitedEcho(out, max_lines=10)
+    echo.write("".join(f"line {idx}\n" for idx in range(1000)))
+    echo.flush()
+    lines = out.getvalue().splitlines()
+    assert lines[:10] == [f"line {idx}" for idx in range(10)]
+    assert lines[-1] == "[... 990 lines not echoed ...]"
+
+
+def test_pump_reads_both_pipes_until_eof():
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import sys\nfor i in range(20000):\n    print(i); print(-i, file=sys.stderr)"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    received = {"stdout": bytearray(), "stderr": bytearray()}
+
+    def on_chunk(name, data):
+        received[name] += data
+
+    status = OutputPump({"stdout": process.stdout.fileno(), "stderr": process.stderr.fileno()}, on_chunk).run()
+    process.wait()
+    assert status == "done"
+    assert received["stdout"].count(b"\n") == 20000
+    assert received["stderr"].count(b"\n") == 20000
+
+
+def test_pump_idle_timeout():
+    process = subprocess.Popen(["sleep", "5"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        pump = OutputPump({"stdout": process.stdout.fileno()}, lambda name, data: False)
+        assert pump.run(idle_timeout=0.2) == "idle"
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_sentinel_reader_resumes_after_timeout(tmp_path):
+    set_run_context(1, str(tmp_path))
+    marker = "__TEST_MARKER__"
+    script = (
+        "import sys, time\n"
+        "print('before', flush=True)\n"
+        "time.sleep(0.5)\n"
+        f"sys.stdout.write('after\\n\\n{marker} payload\\n'); sys.stdout.flush()\n"
+        f"sys.stderr.write('warn\\n\\n{marker}\\n'); sys.stderr.flush()\n"
+        "time.sleep(5)\n"
+    )
+    process = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        reader = SentinelReader(process, marker, "test", echo=False)
+        assert reader.run(time.monotonic() + 0.1) == "timeout"
+        # Done once both sentinels arrive, without waiting for the process to exit.
+        assert reader.run(time.monotonic() + 5) == "done" and not reader.eof
+        assert reader.finish() == "payload"
+        assert (reader.text("stdout"), reader.text("stderr")) == ("before\nafter\n", "warn\n")
+    finally:
+        process.kill()
+        process.wait()
+        set_run_context(None, None)
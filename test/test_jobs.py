@@ -0,0 +1,86 @@
+import sys
+import time
+import pytest
+from agent.tools.context import set_run_context
+from agent.tools.bash.bash_tool import run_bash
+from agent.tools.bash.shell_session import close_shell_session
+from agent.tools.jobs.job_manager import JobManager, get_job_manager, close_job_managers
+from agent.tools.jobs.jobs_tool import start_job, job_status, job_tail, cancel_job, job_result
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    set_run_context(1, str(tmp_path))
+    yield tmp_path
+    close_job_managers()
+    close_shell_session(1)
+    set_run_context(None, None)
+
+
+def wait_for(job, timeout=10):
+    assert job.done.wait(timeout)
+    return job
+
+
+def test_job_runs_in_the_background(run_dir):
+    (run_dir / "train.py").write_text(
+        "import sys, time\n"
+        "for epoch in range(3):\n"
+        "    print(f'epoch {epoch} loss {1 / (epoch + 1):.2f}')\n"
+        "    sys.stderr.write('\\rstep 1/9\\rstep 9/9\\n')\n"
+        "time.sleep(0.5)\n"
+    )
+    started = time.monotonic()
+    result = start_job({"command": f"{sys.executable} train.py"})
+    assert time.monotonic() - started < 2
+    assert result["status"] == "success" and result["job_id"] == "job-1"
+
+    job = get_job_manager().get("job-1")
+    assert job_status({"job_id": "job-1"})["job_state"] == "running"
+    wait_for(job)
+    assert job.state == "completed" and job.returncode == 0
+    assert job_tail({"job_id": "job-1", "lines": 2})["stdout"] == "epoch 2 loss 0.33\nstep 9/9"
+    assert job.resources["wall_seconds"] >= 0.5 and job.resources["exit_reason"] == "completed"
+
+    stored = job_result(job)
+    assert stored["status"] == "success" and stored["resources"] is job.resources
+    assert get_job_manager().collect_finished() == [job]
+    assert get_job_manager().collect_finished() == []
+
+
+def test_job_sees_the_variables_exported_in_the_session(run_dir):
+    (run_dir / "exp").mkdir()
+    assert run_bash({"script": "cd exp && export JOB_TEST_VALUE=from-session"})["returncode"] == 0
+    result = start_job({"command": "pwd; echo $JOB_TEST_VALUE"})
+    job = wait_for(get_job_manager().get(result["job_id"]))
+    assert job.tail(2) == f"{run_dir / 'exp'}\nfrom-session"
+
+
+def test_cancel_and_limits(run_dir):
+    manager = JobManager(max_jobs=1)
+    job = manager.start("trap 'echo stopping; exit 3' TERM; echo started; sleep 30 & wait")
+    with pytest.raises(RuntimeError, match="already running"):
+        manager.start("echo too many")
+    time.sleep(0.3)
+    assert "job-1 (running for" in manager.render()
+    assert "    | started" in manager.render()
+    assert job.cancel(grace=5)
+    assert job.state == "cancelled"
+    assert job.tail().endswith("stopping")
+    assert not job.cancel()
+
+    timed_out = wait_for(manager.start("sleep 30", timeout=0.3))
+    assert timed_out.state == "timed_out"
+    assert "job time limit" in timed_out.describe()
+
+    failed = wait_for(manager.start("exit 4"))
+    assert (failed.state, failed.returncode) == ("failed", 4)
+    assert manager.metrics == {"started": 3, "cancelled": 1, "failed": 1, "timed_out": 1}
+
+
+def test_tool_errors(run_dir):
+    assert job_status({})["stdout"] == "No background jobs."
+    result = cancel_job({"job_id": "job-7"})
+    assert result["status"] == "failure" and "No job 'job-7'" in result["stderr"]
+    assert start_job({"command": "  "})["status"] == "failure"
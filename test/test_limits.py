@@ -0,0 +1,114 @@
+import os
+import time
+import signal
+import pytest
+from agent.tools.limits import CgroupLimit, ToolLimits, classify_exit
+from agent.tools.bash.shell_session import ShellSession
+from agent.tools.context import set_run_context
+from agent.tools.python.python_tool import PythonRunnerActor
+
+
+@pytest.fixture(autouse=True)
+def run_dir(tmp_path):
+    set_run_context(1, str(tmp_path))
+    yield tmp_path
+    set_run_context(None, None)
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("AGENT_TOOL_TIMEOUT", "60")
+    monkeypatch.setenv("AGENT_TOOL_IDLE_TIMEOUT", "0")
+    monkeypatch.setenv("AGENT_TOOL_MEMORY_MB", "512")
+    limits = ToolLimits.from_env(cpu_seconds=30)
+    assert (limits.wall_timeout, limits.idle_timeout) == (60, None)
+    assert (limits.cpu_seconds, limits.memory_mb, limits.cpus) == (30, 512, None)
+    assert ToolLimits().preexec() is None
+
+
+def test_classify_exit():
+    limits = ToolLimits(memory_mb=100)
+    assert classify_exit(0) == "completed"
+    assert classify_exit(2) == "error"
+    assert classify_exit(-signal.SIGXCPU) == "cpu_limit"
+    assert classify_exit(128 + signal.SIGXCPU) == "cpu_limit"
+    assert classify_exit(-signal.SIGKILL) == "signal"
+    assert classify_exit(1, "MemoryError", limits) == "memory_limit"
+    assert classify_exit(1, "MemoryError") == "error"
+    assert classify_exit(-signal.SIGKILL, "", limits, oom_killed=True) == "memory_limit"
+
+
+def test_cgroup_create(tmp_path):
+    root = tmp_path / "cgroup"
+    (root / "agent").mkdir(parents=True)
+    (root / "agent" / "cgroup.subtree_control").write_text("cpu memory\n")
+    proc_cgroup = tmp_path / "proc_cgroup"
+    proc_cgroup.write_text("0::/agent\n")
+    cgroup = CgroupLimit.create(256, 1.5, root=str(root), proc_cgroup=str(proc_cgroup))
+    assert (open(os.path.join(cgroup.path, "memory.max")).read()) == str(256 * 1024 * 1024)
+    assert (open(os.path.join(cgroup.path, "cpu.max")).read()) == "150000 100000"
+    (root / "agent" / "cgroup.subtree_control").write_text("cpu\n")
+    assert CgroupLimit.create(256, root=str(root), proc_cgroup=str(proc_cgroup)) is None
+    proc_cgroup.write_text("4:memory:/agent\n")  # cgroup v1 only
+    assert CgroupLimit.create(256, root=str(root), proc_cgroup=str(proc_cgroup)) is None
+
+
+def test_idle_timeout_kills_shell(tmp_path):
+    session = ShellSession(cwd=str(tmp_path), limits=ToolLimits(wall_timeout=30, idle_timeout=0.3))
+    try:
+        start = time.monotonic()
+        outcome = session.run("echo started; sleep 10", echo=False)
+        assert time.monotonic() - start < 5
+        assert (outcome["status"], outcome["exit_reason"]) == ("idle_timeout", "idle_timeout")
+        assert outcome["stdout"] == "started\n"
+        assert session.metrics["idle_timeouts"] == 1
+        assert session.run("echo again", echo=False)["stdout"] == "again\n"
+    finally:
+        session.close()
+
+
+def test_cpu_limit(tmp_path):
+    session = ShellSession(cwd=str(tmp_path), limits=ToolLimits(wall_timeout=30, cpu_seconds=1))
+    try:
+        outcome = session.run("while :; do :; done", echo=False)
+        assert outcome["exit_reason"] == "cpu_limit"
+    finally:
+        session.close()
+
+
+def test_memory_limit_without_cgroup(tmp_path):
+    script = tmp_path / "alloc.py"
+    script.write_text("buffer = bytearray(2 * 1024 ** 3)\nprint('allocated')\n")
+    result = PythonRunnerActor(ToolLimits(wall_timeout=30, memory_mb=512)).run_code(str(script))
+    assert result["status"] == "failure"
+    assert result["exit_reason"] == "memory_limit"
+    assert "ran out of memory at the 512 MB limit" in result["stderr"]
+
+
+def test_python_timeout_kills_children(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    script = tmp_path / "spawn.py"
+    script.write_text(
+        "import subprocess, time\n"
+        f"child = subprocess.Popen(['sleep', '60'])\n"
+        f"open({str(pid_file)!r}, 'w').write(str(child.pid))\n"
+        "print('spawned', flush=True)\n"
+        "time.sleep(60)\n"
+    )
+    start = time.monotonic()
+    result = PythonRunnerActor(ToolLimits(idle_timeout=30)).run_code(str(script), timeout=1)
+    assert time.monotonic() - start < 10
+    assert result["exit_reason"] == "wall_timeout"
+    assert result["stdout"] == "spawned\n"
+    assert "killed after 1 seconds" in result["stderr"]
+    child = int(pid_file.read_text())
+    for _ in range(50):
+        try:
+            os.kill(child, 0)
+        except ProcessLookupError:
+            break
+        # Reaped by init once its parent is gone; a zombie still answers kill(0).
+        if open(f"/proc/{child}/stat").read().split()[2] == "Z":
+            break
+        time.sleep(0.1)
+    else:
+        pytest.fail("grandchild survived the timeout")
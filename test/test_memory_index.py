@@ -0,0 +1,89 @@
+import numpy as np
+from agent.memory_index import MemoryIndex
+
+
+def clustered(n, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, n)
+    return (centers[labels] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def brute_force(vectors, query, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = vectors @ (query / np.linalg.norm(query))
+    return list(np.argsort(-scores)[:k])
+
+
+def test_flat_search_is_exact():
+    vectors = clustered(500)
+    index = MemoryIndex(n_lists=16)
+    index.add(np.arange(500), vectors, np.zeros(500))
+    assert not index.trained
+    query = vectors[7] + 0.01
+    assert [row_id for row_id, _ in index.search(query, 10)] == brute_force(vectors, query, 10)
+
+
+def test_ivf_recall_against_brute_force():
+    vectors = clustered(20000)
+    index = MemoryIndex(n_lists=64, n_probe=8)
+    # Added in chunks, as rows arrive from the embedding queue.
+    for start in range(0, 20000, 1000):
+        index.add(np.arange(start, start + 1000), vectors[start : start + 1000], np.zeros(1000))
+    assert index.trained
+
+    queries = clustered(50, seed=1)
+    recall = np.mean(
+        [
+            len({row_id for row_id, _ in index.search(query, 10)} & set(brute_force(vectors, query, 10))) / 10
+            for query in queries
+        ]
+    )
+    assert recall > 0.9
+
+
+def test_filters_and_incremental_add():
+    vectors = clustered(6000)
+    run_ids = np.arange(6000) % 3
+    user_ids = np.arange(6000) % 2
+    index = MemoryIndex(n_lists=16, exact_limit=100)
+    index.add(np.arange(6000), vectors, run_ids, user_ids)
+
+    hits = index.search(vectors[0], 20, run_id=1)
+    assert hits and all(run_ids[row_id] == 1 for row_id, _ in hits)
+    hits = index.search(vectors[0], 20, run_id=2, user_id=0)
+    assert hits and all(run_ids[row_id] == 2 and user_ids[row_id] == 0 for row_id, _ in hits)
+
+    # A small run is searched exactly and sees rows added after training.
+    index.add([9000, 9001], vectors[:2], [42, 42], [0, 0])
+    assert [row_id for row_id, _ in index.search(vectors[1], 5, run_id=42)] == [9001, 9000]
+
+
+def test_save_and_load(tmp_path):
+    vectors = clustered(3000)
+    index = MemoryIndex(n_lists=16)
+    index.add(np.arange(3000), vectors, np.zeros(3000))
+    index.synced_id = 2999
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    loaded = MemoryIndex.load(path)
+    assert len(loaded) == 3000 and loaded.trained and loaded.synced_id == 2999
+    assert loaded.search(vectors[5], 3) == index.search(vectors[5], 3)
+    loaded.add([5000], vectors[:1], [1])
+    assert loaded.search(vectors[0], 1, run_id=1)[0][0] == 5000
+    assert not MemoryIndex.load(str(tmp_path / "missing.npz")).size
+
+
+def test_retrains_as_the_index_grows(tmp_path):
+    index = MemoryIndex(n_lists=8, train_size=400)
+    index.add(np.arange(400), clustered(400), np.zeros(400))
+    assert index.trained_size == 400
+    index.add(np.arange(400, 700), clustered(300, seed=1), np.zeros(300))
+    assert index.trained_size == 400
+    index.add(np.arange(700, 800), clustered(100, seed=2), np.zeros(100))
+    assert index.trained_size == 800
+
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    assert MemoryIndex.load(path).trained_size == 800
@@ -0,0 +1,56 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from agent.models.registry import ModelClientRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setenv("OPENAI", "test_openai_key")
+    monkeypatch.setenv("ANTHROPIC", "test_anthropic_key")
+    registry = ModelClientRegistry()
+    yield registry
+    registry.close()
+
+
+def test_client_is_shared_per_provider(registry):
+    assert registry.get_client("openai") is registry.get_client("openai")
+    assert registry.get_client("anthropic") is registry.get_client("anthropic")
+    assert registry.get_client("openai") is not registry.get_client("anthropic")
+    assert registry.metrics["openai"]["clients_created"] == 1
+
+
+@patch("agent.models.registry.tiktoken.get_encoding")
+def test_encoding_is_cached(mock_get_encoding, registry):
+    assert registry.get_encoding("cl100k_base") is registry.get_encoding("cl100k_base")
+    mock_get_encoding.assert_called_once_with("cl100k_base")
+
+
+def test_unknown_provider(registry):
+    with pytest.raises(ValueError):
+        registry.get_client("unknown")
+
+
+class FakeStream:
+    pass
+
+
+def test_connection_reuse_metric(registry):
+    registry.get_client("openai")
+    pooled = FakeStream()
+    for stream in [pooled, pooled, pooled, FakeStream()]:
+        response = MagicMock()
+        response.extensions = {"network_stream": stream}
+        registry._record_response("openai", response)
+
+    stats = registry.connection_stats()["openai"]
+    assert stats["requests"] == 4
+    assert stats["connections_opened"] == 2
+    assert stats["reused_connections"] == 2
+
+    # A closed connection is forgotten, so its successor counts as new even
+    # if it gets the same id().
+    del pooled, stream, response
+    response = MagicMock()
+    response.extensions = {"network_stream": FakeStream()}
+    registry._record_response("openai", response)
+    assert registry.connection_stats()["openai"]["connections_opened"] == 3
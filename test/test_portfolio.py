@@ -0,0 +1,108 @@
+import os
+import time
+import signal
+import subprocess
+import pytest
+from agent.tools.context import set_run_context, track_process_group
+from agent.portfolio import (
+    PlanPortfolio,
+    _terminate,
+    derive_run_id,
+    extract_submission,
+    parse_metric,
+)
+
+
+def test_derive_run_id_is_unique_per_plan():
+    assert len({derive_run_id(42, idx) for idx in range(3)}) == 3
+    assert derive_run_id(42, 0) != 42
+
+
+def test_extract_submission_from_worker_results():
+    legacy = {
+        "result": "You had the thought: {'subtask_result': {'tool': 'return_fn', 'submission': 'accuracy: 0.97', 'model_path': 'm.pt'}, 'attempted': 'yes'}"
+    }
+    history = {"result": str({"subtask_result": {"tool": "return_fn", "submission": "0.5", "model_path": ""}})}
+    assert extract_submission(legacy)["submission"] == "accuracy: 0.97"
+    assert extract_submission(history)["submission"] == "0.5"
+    assert extract_submission({"error": "boom"}) is None
+    assert extract_submission(None) is None
+
+
+def test_parse_metric():
+    assert parse_metric("accuracy: 0.981") == pytest.approx(0.981)
+    assert parse_metric("loss -1.5e-3") == pytest.approx(-1.5e-3)
+    assert parse_metric("done") is None
+
+
+def _outcome(number, submission):
+    return {"worker_number": number, "submission": submission, "metric": parse_metric(submission) if submission else None}
+
+
+def test_select_winner_strategies():
+    outcomes = [_outcome(1, None), _outcome(2, "acc 0.90"), _outcome(3, "acc 0.95")]
+    assert PlanPortfolio(strategy="first").select_winner(outcomes)["worker_number"] == 2
+    assert PlanPortfolio(strategy="best").select_winner(outcomes)["worker_number"] == 3
+    assert PlanPortfolio(strategy="best", maximize=False).select_winner(outcomes)["worker_number"] == 2
+    assert PlanPortfolio().select_winner([_outcome(1, None)]) is None
+
+
+def test_cancel_stops_running_process():
+    portfolio = PlanPortfolio(cancel_timeout=5)
+    process = portfolio.context.Process(target=time.sleep, args=(60,))
+    process.start()
+    portfolio.cancel(process)
+    assert not process.is_alive()
+
+
+def test_portfolio_without_a_winner_still_reports_the_run():
+    from agent.supervisor import Supervisor
+
+    class NoWinner:
+        def run(self, user_id, run_id, task, plans, provider, worker_kwargs):
+            outcome = PlanPortfolio().outcome(0, run_id, {"result": "gave up", "total_tokens": 7, "total_turns": "3"})
+            return None, [outcome, PlanPortfolio().outcome(1, run_id, None)]
+
+    result = Supervisor.__new__(Supervisor).run_portfolio(
+        1, 42, "task", [[{"Subtask": "a"}], [{"Subtask": "b"}]], "openai", NoWinner(), {}
+    )
+    assert result["run_number"] == "42"
+    assert result["total_tokens"] == 7 and result["total_turns"] == "3"
+    assert result["plan_results"][0]["result"] == "gave up"
+    assert [outcome["worker_number"] for outcome in result["portfolio"]] == [1, 2]
+
+
+def _worker_with_tool(pid_queue, work_dir, handle_sigterm):
+    os.setsid()
+    signal.signal(signal.SIGTERM, _terminate if handle_sigterm else signal.SIG_IGN)
+    set_run_context(1, work_dir)
+    tool = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    track_process_group(tool.pid)
+    pid_queue.put(tool.pid)
+    time.sleep(60)
+
+
+def _wait_gone(pgid, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.parametrize("handle_sigterm", [True, False])
+def test_cancel_stops_tools_in_their_own_sessions(tmp_path, handle_sigterm):
+    portfolio = PlanPortfolio(cancel_timeout=2)
+    pid_queue = portfolio.context.Queue()
+    process = portfolio.context.Process(
+        target=_worker_with_tool, args=(pid_queue, str(tmp_path), handle_sigterm)
+    )
+    process.start()
+    tool_pid = pid_queue.get(timeout=30)
+    portfolio.cancel(process, str(tmp_path))
+    assert not process.is_alive()
+    assert process.exitcode == (128 + signal.SIGTERM if handle_sigterm else -signal.SIGKILL)
+    assert _wait_gone(tool_pid)
@@ -0,0 +1,73 @@
+import re
+import pytest
+from agent.tools.limits import ToolLimits
+from agent.tools.context import set_run_context
+from agent.tools.bash.shell_session import close_shell_session
+from agent.tools.python_cell.kernel import Kernel
+from agent.tools.python_cell.python_cell_tool import KernelRunnerActor
+
+
+@pytest.fixture
+def kernel(tmp_path):
+    set_run_context(1, str(tmp_path))
+    kernel = Kernel(cwd=str(tmp_path), limits=ToolLimits(wall_timeout=30, idle_timeout=30), interrupt_grace=2)
+    yield kernel
+    kernel.close()
+    close_shell_session(1)
+    set_run_context(None, None)
+
+
+def run(kernel, cell, **kwargs):
+    return kernel.execute(cell, echo=False, **kwargs)
+
+
+def test_state_persists_between_cells(kernel):
+    outcome = run(kernel, "data = list(range(10))\nprint('loaded')\nsum(data)")
+    assert (outcome["status"], outcome["success"], outcome["execution_count"]) == ("completed", True, 1)
+    assert outcome["stdout"] == "loaded\nOut[1]: 45\n"
+    assert outcome["rss"] > 0 and outcome["peak_rss"] >= outcome["rss"]
+    assert run(kernel, "len(data)")["stdout"] == "Out[2]: 10\n"
+
+    outcome = run(kernel, "1 / 0")
+    assert (outcome["status"], outcome["success"], outcome["error"]) == ("completed", False, "ZeroDivisionError")
+    assert "ZeroDivisionError" in outcome["stdout"]
+    assert kernel.metrics["starts"] == 1
+
+
+def test_timeout_interrupts_and_keeps_state(kernel):
+    run(kernel, "model = 'weights'")
+    outcome = run(kernel, "import time\nprint('step', flush=True)\ntime.sleep(30)", timeout=0.5)
+    assert (outcome["status"], outcome["exit_reason"], outcome["error"]) == (
+        "interrupted",
+        "wall_timeout",
+        "KeyboardInterrupt",
+    )
+    assert outcome["stdout"].startswith("step\n")
+    assert run(kernel, "model")["stdout"] == "Out[3]: 'weights'\n"
+
+
+def test_unresponsive_cell_restarts_kernel(kernel):
+    run(kernel, "model = 'weights'")
+    outcome = run(
+        kernel,
+        "import signal, time\nsignal.signal(signal.SIGINT, signal.SIG_IGN)\ntime.sleep(30)",
+        timeout=0.5,
+    )
+    assert outcome["status"] == "restarted"
+    assert run(kernel, "'model' in globals()")["stdout"] == "Out[1]: False\n"
+    assert kernel.metrics == {"starts": 2, "cells": 3, "interrupts": 1, "restarts": 1, "deaths": 0}
+
+
+def test_tool_reports_death_and_restart(kernel):
+    actor = KernelRunnerActor(kernel)
+    result = actor.run_cell("import os\nos._exit(3)")
+    assert result["status"] == "failure"
+    assert "exit code 3" in result["stderr"] and "variables were lost" in result["stderr"]
+
+    result = actor.run_cell("x = 1\nx + 1")
+    assert result["status"] == "success"
+    assert result["stdout"] == "Out[1]: 2\n"
+    assert re.fullmatch(r"\d+ MB resident, \d+ MB peak", result["kernel_memory"])
+
+    result = actor.run_cell("'x' in globals()", restart=True)
+    assert result["stdout"] == "Out[1]: False\n"
@@ -0,0 +1,72 @@
+import pytest
+from unittest.mock import MagicMock
+from agent.models.response_cache import ResponseCache, ReplayMissError
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def model_dump(self, mode="json"):
+        return self.data
+
+    @classmethod
+    def model_validate(cls, data):
+        return cls(data)
+
+
+REQUEST = {
+    "model": "gpt-4o",
+    "messages": [{"role": "user", "content": "Time spent: 1.25 minutes. Remaining: 1438.75 minutes."}],
+    "tools": [],
+}
+
+
+def test_record_then_hit(tmp_path):
+    cache = ResponseCache(str(tmp_path), mode="record")
+    create = MagicMock(return_value=FakeResponse({"answer": 42}))
+
+    first = cache.create("openai", create, FakeResponse, **REQUEST)
+    second = cache.create("openai", create, FakeResponse, **REQUEST)
+
+    assert first.data == second.data == {"answer": 42}
+    create.assert_called_once_with(**REQUEST)
+    assert cache.metrics["hits"] == 1
+    assert cache.metrics["misses"] == 1
+
+
+def test_key_ignores_clock_but_not_content():
+    cache = ResponseCache(mode="record")
+    later = dict(REQUEST, messages=[{"role": "user", "content": "Time spent: 9.00 minutes. Remaining: 1431.00 minutes."}])
+    other = dict(REQUEST, model="gpt-4o-mini")
+    assert cache.key("openai", REQUEST) == cache.key("openai", later)
+    assert cache.key("openai", REQUEST) != cache.key("openai", other)
+    assert cache.key("openai", REQUEST) != cache.key("anthropic", REQUEST)
+
+
+def test_replay_is_strict(tmp_path):
+    ResponseCache(str(tmp_path), mode="record").create(
+        "openai", lambda **request: FakeResponse({"answer": 1}), FakeResponse, **REQUEST
+    )
+    replay = ResponseCache(str(tmp_path), mode="replay")
+    create = MagicMock()
+    assert replay.create("openai", create, FakeResponse, **REQUEST).data == {"answer": 1}
+    with pytest.raises(ReplayMissError):
+        replay.create("openai", create, FakeResponse, **dict(REQUEST, model="other"))
+    create.assert_not_called()
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path), mode="record", max_bytes=250)
+    for idx in range(5):
+        cache.put(f"{idx:064x}", {"payload": "x" * 80})
+    assert cache.metrics["evictions"] > 0
+    assert cache.get(f"{4:064x}") is not None
+    assert cache.get(f"{0:064x}") is None
+
+
+def test_off_mode_passes_through(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    create = MagicMock(return_value="raw")
+    assert cache.create("openai", create, FakeResponse, **REQUEST) == "raw"
+    assert not any(tmp_path.iterdir())
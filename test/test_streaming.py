@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from agent.models.history import ConversationHistory
+from agent.models.openai import OpenAIModel
+from agent.models.streaming import StreamingToolCalls
+
+
+def test_dispatch_as_soon_as_json_is_complete():
+    dispatched = []
+    tool_calls = StreamingToolCalls(on_tool_call=dispatched.append)
+    tool_calls.start(0, "call_1", "write_code")
+    tool_calls.append(0, '{"path": "a.py", "code": "x = {', detect_complete=True)
+    tool_calls.append(0, '}', detect_complete=True)
+    assert dispatched == []
+    tool_calls.append(0, '"}', detect_complete=True)
+    assert dispatched == [
+        {"id": "call_1", "name": "write_code", "input": {"path": "a.py", "code": "x = {}"}}
+    ]
+    assert tool_calls.metrics()["time_to_tool_dispatch"] is not None
+
+
+def test_finish_salvages_truncated_arguments():
+    tool_calls = StreamingToolCalls()
+    tool_calls.start(0, "call_1", "run_bash")
+    tool_calls.append(0, '{"script": "ls -l')
+    tool_calls.finish()
+    assert tool_calls.completed[0]["input"] == {"script": "ls -l"}
+
+
+def _chunk(content=None, tool_calls=None, usage=None):
+    choices = []
+    if content is not None or tool_calls is not None:
+        choices = [SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def _tool_delta(index, arguments, call_id=None, name=None):
+    return SimpleNamespace(
+        index=index,
+        id=call_id,
+        function=SimpleNamespace(name=name, arguments=arguments),
+    )
+
+
+def test_openai_stream_turn_dispatches_each_call_in_order():
+    model = OpenAIModel.__new__(OpenAIModel)
+    model.model = "gpt-4o"
+    model.system_prompt = "system"
+    model.openai_tools = []
+    model.oai_client = MagicMock()
+    model.oai_client.chat.completions.create.return_value = iter(
+        [
+            _chunk(content="Listing"),
+            _chunk(tool_calls=[_tool_delta(0, '{"scr', "call_1", "run_bash")]),
+            _chunk(tool_calls=[_tool_delta(0, 'ipt": "ls"}')]),
+            _chunk(tool_calls=[_tool_delta(1, '{"thought": "ok"}', "call_2", "thought")]),
+            _chunk(
+                usage=SimpleNamespace(
+                    prompt_tokens=100,
+                    completion_tokens=10,
+                    total_tokens=110,
+                    prompt_tokens_details=SimpleNamespace(cached_tokens=64),
+                )
+            ),
+        ]
+    )
+    history = ConversationHistory()
+    history.add_user_text("goal")
+
+    dispatched = []
+    turn = model.stream_turn(history, on_tool_call=dispatched.append)
+
+    assert [call["id"] for call in dispatched] == ["call_1", "call_2"]
+    assert turn["tool_calls"] == dispatched
+    assert turn["text"] == "Listing"
+    assert turn["cache_read_tokens"] == 64
+    assert turn["time_to_first_token"] <= turn["time_to_tool_dispatch"]
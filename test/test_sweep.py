@@ -0,0 +1,130 @@
+import pytest
+from agent.tools.bash.shell_session import close_shell_session, get_shell_session
+from agent.tools.context import set_run_context
+from agent.tools.limits import ToolLimits
+from agent.tools.sweep.sweep import Sweep, parse_metric, search_space, trial_arguments
+from agent.tools.sweep.sweep_tool import run_sweep
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    set_run_context("sweep", str(tmp_path))
+    (tmp_path / "train.py").write_text(
+        "import argparse, os, time\n"
+        "parser = argparse.ArgumentParser()\n"
+        "parser.add_argument('--lr', type=float)\n"
+        "parser.add_argument('--layers', type=int)\n"
+        "args = parser.parse_args()\n"
+        "if args.lr > 0.5: raise SystemExit('diverged')\n"
+        "time.sleep(0.3)\n"
+        "print(f'threads={os.environ[\"OMP_NUM_THREADS\"]}')\n"
+        "print(f'epoch 1 accuracy: 0.5')\n"
+        "print(f'final accuracy: {1 - abs(args.lr - 0.01) - 0.01 * args.layers:.4f}')\n"
+    )
+    yield tmp_path
+    close_shell_session("sweep")
+    set_run_context(None, None)
+
+
+def test_search_space():
+    grid = search_space({"lr": [0.1, 0.01], "layers": [1, 2, 3]})
+    assert len(grid) == 6 and grid[0] == {"lr": 0.1, "layers": 1}
+    sampled = search_space({"lr": {"min": 1e-4, "max": 1e-1, "log": True}, "width": {"min": 8, "max": 64, "int": True}}, "random", 5, seed=3)
+    assert sampled == search_space({"lr": {"min": 1e-4, "max": 1e-1, "log": True}, "width": {"min": 8, "max": 64, "int": True}}, "random", 5, seed=3)
+    assert len(sampled) == 5
+    assert all(1e-4 <= trial["lr"] <= 1e-1 and isinstance(trial["width"], int) for trial in sampled)
+    with pytest.raises(ValueError, match="random search"):
+        search_space({"lr": {"min": 0.1, "max": 1}})
+    with pytest.raises(ValueError, match="AGENT_SWEEP_MAX_TRIALS"):
+        search_space({"a": list(range(10)), "b": list(range(10))}, max_trials=64)
+
+
+def test_arguments_and_metric_parsing():
+    assert trial_arguments({"lr": 0.01, "amp": True, "debug": False, "-n": 3}) == (["--lr", "0.01", "--amp", "-n", "3"], {})
+    assert trial_arguments({"LR": 0.01}, "env") == ([], {"LR": "0.01"})
+    assert parse_metric("accuracy: 0.5\nloss=1.2\nval accuracy 0.91\n", "accuracy") == 0.91
+    assert parse_metric('{"val_loss": 3.5e-2}', "val_loss") == 0.035
+    assert parse_metric("top1_accuracy 0.7", "accuracy") is None
+    assert parse_metric("acc 91%", "acc", r"acc (\d+)%") == 91.0
+
+
+def test_trials_run_in_parallel_and_are_ranked(run_dir):
+    result = run_sweep({
+        "filepath": "train.py",
+        "space": {"lr": [0.01, 0.1, 0.9], "layers": [1, 2]},
+        "metric": "accuracy",
+        "parallel": 6,
+        "threads_per_trial": 2,
+    })
+    assert result["status"] == "success"
+    assert result["best"] == {"params": {"lr": 0.01, "layers": 1}, "accuracy": 0.99}
+    lines = result["stdout"].splitlines()
+    assert lines[0].startswith("6 trials of train.py, 6 at a time with 2 threads each")
+    assert lines[1].split() == ["rank", "accuracy", "lr", "layers", "seconds", "status"]
+    assert lines[2].split()[:4] == ["1", "0.99", "0.01", "1"]
+    assert [line.split()[0] for line in lines[2:]] == ["1", "2", "3", "4", "-", "-"]
+    assert "diverged" in result["stderr"]
+    # Six 0.3 s trials at once, not one after another.
+    assert result["resources"]["wall_seconds"] < 6 * 0.3
+    assert result["resources"]["exit_reason"] == "error"
+
+
+def test_minimize_and_timeouts(run_dir):
+    (run_dir / "slow.py").write_text(
+        "import os, time\n"
+        "delay = float(os.environ['DELAY'])\n"
+        "time.sleep(delay)\n"
+        "print('loss', delay)\n"
+    )
+    sweep = Sweep("slow.py", search_space({"DELAY": [0.1, 0.2, 5]}), "loss", goal="min", pass_as="env",
+                  timeout=1, limits=ToolLimits(), echo=False)
+    ranked = sweep.run()
+    assert [trial["params"]["DELAY"] for trial in ranked] == [0.1, 0.2, 5]
+    assert ranked[-1]["exit_reason"] == "wall_timeout" and ranked[-1]["value"] is None
+    assert "wall_timeout (exit -9)" in sweep.table(ranked)
+
+
+def test_trials_run_in_the_shell_session(run_dir):
+    (run_dir / "exp").mkdir()
+    (run_dir / "exp" / "probe.py").write_text(
+        "import os\n"
+        "print('score', float(os.environ['SCALE']) * float(os.environ['X']))\n"
+        "print('threads', os.environ['OMP_NUM_THREADS'], os.environ['MKL_NUM_THREADS'])\n"
+    )
+    get_shell_session().run("cd exp && export SCALE=10 OMP_NUM_THREADS=3", echo=False)
+
+    result = run_sweep({"filepath": "probe.py", "space": {"X": [1, 2]}, "metric": "score", "pass_as": "env", "parallel": 2})
+    assert result["best"] == {"params": {"X": 2}, "score": 20.0}
+    # A cap exported in the session is kept; the others are set for the sweep.
+    logs = list((run_dir / ".sweeps").glob("*/trial-*.log"))
+    assert len(logs) == 2
+    assert all(log.read_text().splitlines()[-1].startswith("threads 3 ") for log in logs)
+
+
+def test_trials_use_the_python_on_the_session_path(run_dir):
+    bin_dir = run_dir / "venv" / "bin"
+    bin_dir.mkdir(parents=True)
+    python = bin_dir / "python"
+    python.write_text("#!/bin/sh\necho 'interpreter 1'\n")
+    python.chmod(0o755)
+    get_shell_session().run(f"export PATH={bin_dir}:$PATH", echo=False)
+
+    result = run_sweep({"filepath": "train.py", "space": {"lr": [0.01]}, "metric": "interpreter"})
+    assert result["best"] == {"params": {"lr": 0.01}, "interpreter": 1.0}
+
+
+def test_nan_trials_are_never_best(run_dir):
+    (run_dir / "nan.py").write_text("print('loss nan')\n")
+    result = run_sweep({"filepath": "nan.py", "space": {"lr": [0.1, 0.2]}, "metric": "loss", "goal": "min"})
+    assert result["status"] == "failure" and "best" not in result
+    assert "0 reported loss" in result["stdout"]
+
+
+def test_explicit_threads_override_the_environment(run_dir):
+    (run_dir / "probe.py").write_text("import os\nprint('threads', os.environ['OMP_NUM_THREADS'])\n")
+    env = {"OMP_NUM_THREADS": "3"}
+    ranked = Sweep("probe.py", [{}], "threads", threads=1, env=env, echo=False).run()
+    assert ranked[0]["value"] == 1
+    ranked = Sweep("probe.py", [{}], "threads", env=env, echo=False).run()
+    assert ranked[0]["value"] == 3
@@ -0,0 +1,84 @@
+import time
+import threading
+import pytest
+from unittest.mock import patch
+from agent.tool_registry import (
+    ToolCallScheduler,
+    is_read_only,
+    merge_tool_outputs,
+)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = ToolCallScheduler(max_workers=4)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_is_read_only():
+    assert is_read_only("search_papers", {"query": "mlp"})
+    assert is_read_only("scratchpad", {"action": "read", "path": "p", "note": ""})
+    assert not is_read_only("scratchpad", {"action": "write", "path": "p", "note": "x"})
+    assert not is_read_only("run_bash", {"script": "ls"})
+    assert not is_read_only("unknown_tool", {})
+
+
+def test_read_only_calls_run_concurrently(scheduler):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fake_run(name, arguments):
+        barrier.wait()  # only passes if all three run at the same time
+        return {"tool": name, "status": "success"}
+
+    with patch("agent.tool_registry.run_tool_call", side_effect=fake_run):
+        outputs = scheduler.run_all(
+            [("search_papers", {"query": str(idx)}) for idx in range(3)]
+        )
+    assert [output["status"] for output in outputs] == ["success"] * 3
+
+
+def test_mutating_calls_keep_order(scheduler):
+    events = []
+
+    def fake_run(name, arguments):
+        events.append(("start", name))
+        time.sleep(0.05)
+        events.append(("end", name))
+        return {"tool": name}
+
+    with patch("agent.tool_registry.run_tool_call", side_effect=fake_run):
+        scheduler.run_all(
+            [
+                ("search_papers", {"query": "a"}),
+                ("write_code", {"path": "a.py", "code": ""}),
+                ("github_list_files", {"repo_url": "x"}),
+            ]
+        )
+    assert events.index(("end", "search_papers")) < events.index(("start", "write_code"))
+    assert events.index(("end", "write_code")) < events.index(("start", "github_list_files"))
+
+
+def test_finished_calls_are_not_kept_as_dependencies(scheduler):
+    with patch("agent.tool_registry.run_tool_call", side_effect=lambda name, arguments: {"tool": name}):
+        for idx in range(20):
+            scheduler.run_all([("search_papers", {"query": str(idx)})])
+        scheduler.run_all([("write_code", {"path": "a.py", "code": ""})])
+        scheduler.run_all([("search_papers", {"query": "after"})])
+    assert len(scheduler.since_mutation) <= 1
+    assert scheduler.last_mutation is None
+
+
+def test_merge_tool_outputs():
+    merged = merge_tool_outputs(
+        [
+            {"tool": "search_papers", "status": "success", "attempt": "a", "stdout": "1", "stderr": ""},
+            {"tool": "thought", "status": "failure", "attempt": "b", "stdout": "2", "stderr": "e"},
+        ]
+    )
+    assert merged["tool"] == "search_papers, thought"
+    assert merged["status"] == "failure"
+    assert "[thought] 2" in merged["stdout"]
+
+    final = {"tool": "return_fn", "submission": "0.9", "model_path": "m"}
+    assert merge_tool_outputs([{"tool": "thought"}, final]) is final
@@ -0,0 +1,103 @@
+import os
+import signal
+import pytest
+from agent.tools.limits import ToolLimits
+from agent.tools.python.warm_pool import WarmPool
+
+
+@pytest.fixture
+def pool():
+    pool = WarmPool(["colorsys", "not_a_real_module"])
+    pool.start()
+    yield pool
+    pool.close()
+
+
+def run(pool, path):
+    process = pool.spawn(str(path))
+    assert process is not None
+    stdout, stderr = process.stdout.read().decode(), process.stderr.read().decode()
+    process.stdout.close()
+    process.stderr.close()
+    return process.wait(), stdout, stderr
+
+
+def test_runs_script_like_a_cold_interpreter(pool, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("WARM_POOL_TEST", "from-client")
+    script = tmp_path / "script.py"
+    script.write_text(
+        "import os, sys\n"
+        "print(sys.argv[0], sys.path[0], os.getcwd(), os.environ['WARM_POOL_TEST'])\n"
+        "print('colorsys' in sys.modules, __name__)\n"
+        "print('oops', file=sys.stderr)\n"
+        "import threading, time\n"
+        "threading.Thread(target=lambda: (time.sleep(0.1), print('thread'))).start()\n"
+        "sys.exit(3)\n"
+    )
+    returncode, stdout, stderr = run(pool, script)
+    assert returncode == 3
+    assert stdout == f"{script} {tmp_path} {tmp_path} from-client\nTrue __main__\nthread\n"
+    assert stderr == "oops\n"
+    assert pool.info["modules"] == ["colorsys"]
+    assert pool.metrics["warm"] == 1
+
+
+def test_exceptions_and_signals(pool, tmp_path):
+    script = tmp_path / "fail.py"
+    script.write_text("def main():\n    raise ValueError('bad value')\nmain()\n")
+    returncode, stdout, stderr = run(pool, script)
+    assert returncode == 1
+    assert "ValueError: bad value" in stderr
+    assert "warm_pool" not in stderr and "runpy" not in stderr
+
+    script.write_text("import os, signal\nos.kill(os.getpid(), signal.SIGTERM)\n")
+    assert run(pool, script)[0] == -signal.SIGTERM
+
+
+def test_falls_back_to_cold(pool, tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text("print('hi')\n")
+    # RLIMIT_AS would count the preloaded modules against the script.
+    assert pool.spawn(str(script), ToolLimits(memory_mb=512)) is None
+    assert run(pool, script)[1] == "hi\n"
+
+    # A package was reinstalled since the server imported it.
+    first_server = pool.process.pid
+    pool.info["watch"] = {str(tmp_path): 0.0}
+    assert pool.spawn(str(script)) is None
+    assert pool.process.pid != first_server
+    assert run(pool, script)[1] == "hi\n"
+    assert pool.metrics["cold"] == 2 and pool.metrics["starts"] == 2
+
+
+def test_reports_rusage(pool, tmp_path):
+    script = tmp_path / "busy.py"
+    script.write_text("import time\nend = time.process_time() + 0.3\nwhile time.process_time() < end: pass\n")
+    process = pool.spawn(str(script))
+    process.stdout.close()
+    process.stderr.close()
+    assert process.wait() == 0
+    user, system, max_rss = process.rusage
+    assert user + system >= 0.25 and max_rss > 0
+
+
+def test_environment_changes_run_cold(pool, tmp_path, monkeypatch):
+    script = tmp_path / "gpu.py"
+    script.write_text("import os\nos.environ['CUDA_VISIBLE_DEVICES'] = '1'\nimport colorsys\n")
+    assert pool.spawn(str(script)) is None
+
+    script.write_text("print('hi')\n")
+    monkeypatch.setenv("OMP_NUM_THREADS", "3")
+    assert pool.spawn(str(script)) is None
+    monkeypatch.delenv("OMP_NUM_THREADS")
+    assert run(pool, script)[1] == "hi\n"
+
+
+def test_pool_is_opt_in_and_lazy(monkeypatch):
+    import agent.tools.python.warm_pool as warm_pool
+
+    monkeypatch.setattr(warm_pool, "_pool", None)
+    monkeypatch.delenv("AGENT_PYTHON_WARM_POOL", raising=False)
+    assert warm_pool.get_warm_pool() is None
+    assert warm_pool.warm_pool_metrics() is None
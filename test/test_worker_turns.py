@@ -0,0 +1,256 @@
+from concurrent.futures import Future
+from unittest.mock import MagicMock
+
+import pytest
+
+import agent.worker as worker_module
+from agent.compaction import OutputCompactor
+from agent.models.response_cache import ReplayMissError
+from agent.worker import Worker
+
+
+class WordEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split(" ")
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def _turn(tool_calls, text=""):
+    return {
+        "text": text,
+        "tool_calls": tool_calls,
+        "total_tokens": 10,
+        "prompt_tokens": 8,
+        "response_tokens": 2,
+        "cache_read_tokens": 0,
+        "cache_write_tokens": 0,
+    }
+
+
+def _worker(tmp_path, model, scheduler):
+    worker = Worker.__new__(Worker)
+    worker.user_id, worker.run_id, worker.run_number = 1, 1, 1
+    worker.user_query, worker.plan, worker.worker_number = "query", "plan", 1
+    worker.streaming = False
+    worker.num_tokens, worker.turn_metrics = [], []
+    worker.task_number = 0
+    worker.start_time = worker_module.datetime.now()
+    worker.model = model
+    worker.scheduler = scheduler
+    worker.memory = MagicMock()
+    worker.compactor = OutputCompactor(log_dir=str(tmp_path), encoding=WordEncoding())
+    worker.background_jobs = lambda: ""
+    return worker
+
+
+def _model(*turns):
+    model = MagicMock()
+    model.max_tokens = 100000
+    model.encode_text = lambda text: text.split()
+    model.generate_turn.side_effect = list(turns)
+    return model
+
+
+def _scheduler(outcomes):
+    scheduler = MagicMock()
+
+    def submit(name, arguments):
+        future = Future()
+        outcome = outcomes[name]
+        if isinstance(outcome, Exception):
+            future.set_exception(outcome)
+        else:
+            future.set_result(outcome)
+        return future
+
+    scheduler.submit.side_effect = submit
+    return scheduler
+
+
+def _saved_steps(worker):
+    return [step for call in worker.memory.save_conversation_memories.call_args_list for step in call.args[2]]
+
+
+def test_model_errors_are_recorded_and_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker_module.time, "sleep", lambda seconds: None)
+    done = {"tool": "return_fn", "status": "success", "attempt": "return_fn", "stdout": "done", "stderr": ""}
+    model = _model(
+        RuntimeError("overloaded"),
+        _turn([{"id": "c1", "name": "return_fn", "input": {}}]),
+    )
+    worker = _worker(tmp_path, model, _scheduler({"return_fn": done}))
+
+    result = worker.process_turns()
+
+    assert model.generate_turn.call_count == 2
+    assert "done" in result["result"]
+    failures = [step for step in _saved_steps(worker) if step["status"] == "failure"]
+    assert failures[0]["attempt"] == "An error occurred: overloaded"
+
+
+def test_worker_gives_up_after_consecutive_model_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker_module.time, "sleep", lambda seconds: None)
+    monkeypatch.setenv("AGENT_MAX_TURN_ERRORS", "2")
+    model = _model(RuntimeError("down"), RuntimeError("down"))
+    worker = _worker(tmp_path, model, _scheduler({}))
+
+    result = worker.process_turns()
+
+    assert "2 failed model calls" in result["result"]
+    assert result["run_number"] == "1"
+
+
+def test_calls_run_before_a_stream_broke_off_are_not_asked_for_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker_module.time, "sleep", lambda seconds: None)
+    inserted = {"tool": "insert_code", "status": "success", "attempt": "insert", "stdout": "inserted", "stderr": ""}
+    done = {"tool": "return_fn", "status": "success", "attempt": "return_fn", "stdout": "done", "stderr": ""}
+    seen = []
+
+    def stream_turn(history, on_tool_call):
+        seen.append(list(history.messages))
+        if len(seen) == 1:
+            on_tool_call({"id": "c1", "name": "insert_code", "input": {"path": "a.py"}})
+            raise ConnectionError("stream dropped")
+        call = {"id": "c2", "name": "return_fn", "input": {}}
+        on_tool_call(call)
+        return dict(
+            _turn([call]),
+            time_to_first_token=0.1,
+            time_to_tool_dispatch=0.2,
+        )
+
+    model = _model()
+    model.stream_turn.side_effect = stream_turn
+    scheduler = _scheduler({"insert_code": inserted, "return_fn": done})
+    worker = _worker(tmp_path, model, scheduler)
+    worker.streaming = True
+
+    result = worker.process_turns()
+
+    assert "done" in result["result"]
+    assert [call.args[0] for call in scheduler.submit.call_args_list] == ["insert_code", "return_fn"]
+    retried = seen[1]
+    assert retried[-2]["tool_calls"][0]["id"] == "c1"
+    assert "inserted" in retried[-1]["results"][0]["content"]
+    assert "interrupted" in retried[-1]["text"]
+
+
+def test_replay_miss_stops_the_turn_loop(tmp_path):
+    model = _model(ReplayMissError("no recorded response"))
+    worker = _worker(tmp_path, model, _scheduler({}))
+
+    with pytest.raises(ReplayMissError):
+        worker.process_turns()
+    assert model.generate_turn.call_count == 1
+
+
+def test_replay_miss_stops_the_subtask_loop(tmp_path):
+    model = _model()
+    model.generate_response.side_effect = ReplayMissError("no recorded response")
+    worker = _worker(tmp_path, model, _scheduler({}))
+    worker.memory.get_conversation_memory.return_value = []
+
+    with pytest.raises(ReplayMissError):
+        worker.process_subtasks()
+    assert model.generate_response.call_count == 1
+
+
+def test_failed_tool_call_becomes_a_failure_result(tmp_path):
+    done = {"tool": "return_fn", "status": "success", "attempt": "return_fn", "stdout": "done", "stderr": ""}
+    model = _model(
+        _turn([
+            {"id": "c1", "name": "run_bash", "input": {"script": "ls"}},
+            {"id": "c2", "name": "return_fn", "input": {}},
+        ]),
+    )
+    worker = _worker(tmp_path, model, _scheduler({"run_bash": OSError("no shell"), "return_fn": done}))
+
+    result = worker.process_turns()
+
+    assert "done" in result["result"]
+    failed = [step for step in _saved_steps(worker) if step["tool"] == "run_bash"]
+    assert failed[0]["status"] == "failure"
+    assert "no shell" in failed[0]["stderr"]
+
+
+def test_tool_results_sent_to_the_model_leave_out_volatile_fields(tmp_path):
+    worker = _worker(tmp_path, _model(), _scheduler({}))
+    text = worker.format_tool_result(
+        {
+            "tool": "run_python",
+            "status": "success",
+            "attempt": "train.py",
+            "stdout": "accuracy: 0.9",
+            "stderr": "",
+            "returncode": 0,
+            "resources": {"wall_seconds": 1.234},
+            "output_stats": {"stdout": {"bytes": 13}},
+            "cached": True,
+            "cached_at": "2024-01-01 00:00:00",
+        }
+    )
+    assert "accuracy: 0.9" in text and "returncode: 0" in text
+    assert "wall_seconds" not in text and "cached_at" not in text and "bytes" not in text
+
+
+def test_the_model_is_told_a_result_came_from_the_exec_cache(tmp_path):
+    from agent.tools.exec_cache import ExecCache
+
+    worker = _worker(tmp_path, _model(), _scheduler({}))
+    cache = ExecCache(str(tmp_path / ".exec_cache"))
+    result = {"tool": "run_bash", "status": "success", "attempt": "make", "stdout": "built", "stderr": ""}
+    cache.put("key", result, {}, {})
+
+    assert "cached" not in worker.format_tool_result(result)
+    text = worker.format_tool_result(cache.get("key"))
+    assert "cached: True" in text and "cached_at" not in text
+
+
+def test_the_model_sees_the_kernel_memory(tmp_path):
+    worker = _worker(tmp_path, _model(), _scheduler({}))
+    text = worker.format_tool_result(
+        {
+            "tool": "run_python_cell",
+            "status": "success",
+            "attempt": "x = 1",
+            "stdout": "",
+            "stderr": "",
+            "kernel_memory": "120 MB resident, 150 MB peak",
+        }
+    )
+    assert "kernel_memory: 120 MB resident, 150 MB peak" in text
+
+
+def test_run_closes_the_run_shell_session_and_jobs(tmp_path):
+    from agent.tools.bash import shell_session
+    from agent.tools.jobs import job_manager
+
+    done = {"tool": "return_fn", "status": "success", "attempt": "return_fn", "stdout": "done", "stderr": ""}
+    worker = _worker(tmp_path, _model(_turn([{"id": "c1", "name": "return_fn", "input": {}}])), _scheduler({"return_fn": done}))
+    worker.history_mode = True
+    worker.run_id = "closing-run"
+    session = shell_session.get_shell_session("closing-run")
+    session.run("true", echo=False)
+    job_manager.get_job_manager("closing-run")
+
+    worker.run()
+
+    assert "closing-run" not in shell_session.session_metrics()
+    assert session.process is None
+    assert "closing-run" not in job_manager.job_metrics()
+
+
+def test_run_does_not_start_a_shell_session(tmp_path, monkeypatch):
+    from agent.tools.bash import shell_session
+
+    def no_session(*args, **kwargs):
+        raise AssertionError("a shell session was created")
+
+    monkeypatch.setattr(shell_session, "ShellSession", no_session)
+    done = {"tool": "return_fn", "status": "success", "attempt": "return_fn", "stdout": "done", "stderr": ""}
+    worker = _worker(tmp_path, _model(_turn([{"id": "c1", "name": "return_fn", "input": {}}])), _scheduler({"return_fn": done}))
+    worker.history_mode = True
+    worker.run_id = "no-shell-run"
+    assert "done" in worker.run()["result"]